@@ -0,0 +1,55 @@
+"""
+Benchmark batched ellipsoid fitting (ellipsoid.fit_many) against fitting one Ellipsoid
+object per polyhedron.
+
+Usage:
+    python benchmarks/bench_fit_many.py
+"""
+
+from __future__ import division, print_function
+import time
+import numpy as np
+from pieface import ellipsoid
+
+TOLERANCE = 1e-4
+
+_t = (1 + np.sqrt(5)) / 2
+SHAPES = {4: np.array([[1, 1, 1], [1, -1, -1], [-1, 1, -1], [-1, -1, 1]]) / np.sqrt(3),
+          6: np.vstack([np.eye(3), -np.eye(3)]),
+          8: np.array([[i, j, k] for i in [-1, 1] for j in [-1, 1] for k in [-1, 1]]) / np.sqrt(3),
+          12: np.array([[0, i, j * _t] for i in [-1, 1] for j in [-1, 1]] +
+                       [[i, j * _t, 0] for i in [-1, 1] for j in [-1, 1]] +
+                       [[j * _t, 0, i] for i in [-1, 1] for j in [-1, 1]]) / np.sqrt(1 + _t**2)}
+
+
+def makepolyhedra(count, seed=0):
+    """ Return a list of randomly strained and rotated 4, 6, 8 and 12-coordinate polyhedra. """
+    rng = np.random.RandomState(seed)
+    polys = []
+    for i in range(count):
+        ideal = SHAPES[sorted(SHAPES.keys())[i % len(SHAPES)]]
+        strain = np.eye(3) + rng.normal(scale=0.1, size=(3, 3))
+        pts = 2.0 * np.dot(ideal, strain) + rng.normal(scale=0.01, size=ideal.shape)
+        polys.append(pts)
+    return polys
+
+
+def main():
+    print("{0:>8} {1:>14} {2:>14} {3:>10} {4:>14}".format("Polys", "serial (s)", "fit_many (s)", "speedup", "max |dR|"))
+    for count in [10, 100, 1000]:
+        polys = makepolyhedra(count)
+        start = time.time()
+        serial = []
+        for pts in polys:
+            ell = ellipsoid.Ellipsoid(points=pts, tolerance=TOLERANCE)
+            ell.findellipsoid()
+            serial.append(ell.radii)
+        tserial = time.time() - start
+        start = time.time()
+        centres, radii, rotations = ellipsoid.fit_many(polys, tolerance=TOLERANCE)
+        tbatch = time.time() - start
+        print("{0:8d} {1:14.3f} {2:14.3f} {3:10.1f} {4:14.2e}".format(count, tserial, tbatch, tserial / tbatch, abs(np.array(serial) - radii).max()))
+
+
+if __name__ == "__main__":
+    main()
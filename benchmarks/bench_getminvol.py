@@ -0,0 +1,62 @@
+"""
+Benchmark the per-iteration cost of Ellipsoid.getminvol as the number of points grows.
+
+Compares the current O(N*d^2) Khachiyan kernel against the previous formulation, which
+built NxN intermediate arrays (np.diag(u) and QT.inv(V).Q) on every iteration, and against
+the rank-one updated iteration ('khachiyan-rank1'), which only gains for large N.
+
+Usage:
+    python benchmarks/bench_getminvol.py
+"""
+
+from __future__ import division, print_function
+import timeit
+import numpy as np
+from pieface import ellipsoid
+
+CYCLES = 200
+
+
+def _densekernel(points, maxcycles):
+    """ Previous Khachiyan loop, forming NxN arrays at each iteration (reference only). """
+    (N, d) = np.shape(points)
+    Q = np.vstack([np.copy(points.T), np.ones(N)])
+    QT = Q.T
+    u = (1.0 / N) * np.ones(N)
+    for count in range(maxcycles):
+        V = np.dot(Q, np.dot(np.diag(u), QT))
+        M = np.diag(np.dot(QT, np.dot(np.linalg.inv(V), Q)))
+        j = np.argmax(M)
+        step_size = (M[j] - d - 1.0) / ((d + 1.0) * (M[j] - 1.0))
+        u = (1.0 - step_size) * u
+        u[j] += step_size
+    return u
+
+
+def makepoints(N, seed=0):
+    """ Return N random points inside a distorted, rotated ellipsoid. """
+    rng = np.random.RandomState(seed)
+    pts = rng.normal(size=(N, 3))
+    pts /= np.linalg.norm(pts, axis=1)[:, np.newaxis]
+    pts *= rng.uniform(0.2, 1.0, size=(N, 1))
+    rot, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+    return np.dot(pts * np.array([3.0, 2.0, 1.0]), rot)
+
+
+def main():
+    print("{0:>8} {1:>18} {2:>18} {3:>18}".format("N", "dense (us/iter)", "current (us/iter)", "rank-one (us/iter)"))
+    for N in [6, 12, 50, 200, 1000, 4000, 20000]:
+        points = makepoints(N)
+        # New Ellipsoid for each run: stopping on maxcycles overwrites the tolerance of the object
+        current = min(timeit.repeat(lambda: ellipsoid.Ellipsoid(points=points, tolerance=0.0).getminvol(points, maxcycles=CYCLES), number=1, repeat=3))
+        rankone = min(timeit.repeat(lambda: ellipsoid.Ellipsoid(points=points, tolerance=0.0).getminvol(points, maxcycles=CYCLES, algorithm='khachiyan-rank1'), number=1, repeat=3))
+        if N <= 1000:
+            dense = min(timeit.repeat(lambda: _densekernel(points, CYCLES), number=1, repeat=3))
+            densestr = "{0:18.1f}".format(1e6 * dense / CYCLES)
+        else:
+            densestr = "{0:>18}".format("(skipped)")
+        print("{0:8d} {1} {2:18.1f} {3:18.1f}".format(N, densestr, 1e6 * current / CYCLES, 1e6 * rankone / CYCLES))
+
+
+if __name__ == "__main__":
+    main()
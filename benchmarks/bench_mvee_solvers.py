@@ -0,0 +1,81 @@
+"""
+Benchmark convergence of the minimum bounding ellipsoid solvers in Ellipsoid.getminvol.
+
+Compares the plain Khachiyan iteration with the Wolfe-Atwood away-step solver (with
+Kumar-Yildirim core-set initialisation) on the CIF files bundled with the tests and on
+randomly distorted, rotated octahedra.
+
+Usage:
+    python benchmarks/bench_mvee_solvers.py
+"""
+
+from __future__ import division, print_function
+import time
+import pkg_resources
+import numpy as np
+from pieface import calcellipsoid, ellipsoid
+
+METHODS = ['khachiyan', 'wolfe-atwood']
+
+
+def distortedoctahedra(count, seed=0):
+    """ Return a list of randomly distorted and rotated octahedra (centre atom first). """
+    rng = np.random.RandomState(seed)
+    octs = []
+    for i in range(count):
+        verts = np.vstack([np.eye(3), -np.eye(3)]) * rng.uniform(1.8, 2.4, size=(6, 1))
+        verts += rng.normal(scale=0.15, size=verts.shape)
+        rot, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+        octs.append(np.vstack([np.zeros(3), np.dot(verts, rot)]))
+    return octs
+
+
+def bench_cifs(tolerance):
+    """ Time calcfromcif for each bundled CIF using each fitting method. """
+    cifs = {'MnSnO3_COD1004021.cif': ['Mn1', 'Sn1'],
+            'fayalite_COD1000064.cif': ['Fe1', 'Fe2', 'Si1']}
+    print("Bundled CIF files (tolerance {0})".format(tolerance))
+    for cif, centres in sorted(cifs.items()):
+        path = pkg_resources.resource_filename('pieface.tests.test_data', cif)
+        results = {}
+        for method in METHODS:
+            start = time.time()
+            phase = calcellipsoid.calcfromcif(path, centres, 3.0, allligtypes=['O2-'],
+                                              tolerance=tolerance, method=method)
+            results[method] = (time.time() - start, phase)
+        print("  {0}".format(cif))
+        for method in METHODS:
+            elapsed, phase = results[method]
+            radii = np.array([getattr(phase, c + '_poly').ellipsoid.radii for c in centres])
+            diff = abs(radii - np.array([getattr(results[METHODS[0]][1], c + '_poly').ellipsoid.radii for c in centres])).max()
+            print("    {0:<14} {1:10.4f} s   max |dR| vs {2}: {3:.2e}".format(method, elapsed, METHODS[0], diff))
+
+
+def bench_octahedra(count, tolerance):
+    """ Time fitting of many distorted octahedra with each method. """
+    octs = distortedoctahedra(count)
+    print("{0} distorted octahedra (tolerance {1})".format(count, tolerance))
+    reference = None
+    for method in METHODS:
+        start = time.time()
+        radii = []
+        for pts in octs:
+            ell = ellipsoid.Ellipsoid(points=pts, tolerance=tolerance)
+            ell.findellipsoid(method=method)
+            radii.append(ell.radii)
+        elapsed = time.time() - start
+        radii = np.array(radii)
+        if reference is None:
+            reference = radii
+        print("    {0:<14} {1:10.4f} s   max |dR| vs {2}: {3:.2e}".format(method, elapsed, METHODS[0], abs(radii - reference).max()))
+
+
+def main():
+    for tolerance in [1e-5, 1e-6]:
+        bench_cifs(tolerance)
+        bench_octahedra(5, tolerance)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark the closed-form small-matrix kernels (pieface.smallmatrix) against np.linalg.
+
+Reports the cost of each kernel for a stack of matrices, and the per-polyhedron latency
+of ellipsoid fitting for common coordination numbers, both for single Ellipsoid fits
+and for batched fits (ellipsoid.fit_many) with the kernels swapped for np.linalg.
+Single fits always use np.linalg, and are shown for reference only.
+
+Usage:
+    python benchmarks/bench_smallmatrix.py
+"""
+
+from __future__ import division, print_function
+import timeit
+import numpy as np
+from pieface import ellipsoid, smallmatrix
+
+from bench_fit_many import SHAPES, makepolyhedra
+
+STACK = 1000
+TOLERANCE = 1e-4
+
+
+def _best(func, number):
+    """ Best time per call (seconds) of func. """
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def kernels():
+    """ Time smallmatrix kernels against np.linalg on stacks of matrices. """
+    rng = np.random.RandomState(0)
+    print("Kernel timings for a stack of {0} matrices (us per matrix)".format(STACK))
+    print("{0:>24} {1:>12} {2:>12} {3:>10}".format("", "np.linalg", "smallmatrix", "speedup"))
+    for n in [3, 4]:
+        a = rng.normal(size=(STACK, n, n)) + n * np.eye(n)
+        tnp = _best(lambda: np.linalg.inv(a), 20)
+        tsm = _best(lambda: smallmatrix.inv(a), 20)
+        print("{0:>24} {1:12.3f} {2:12.3f} {3:10.1f}".format("inv {0}x{0}".format(n), 1e6 * tnp / STACK, 1e6 * tsm / STACK, tnp / tsm))
+    s = rng.normal(size=(STACK, 3, 3))
+    s = s + np.swapaxes(s, 1, 2)
+    tnp = _best(lambda: np.linalg.eigvalsh(s), 20)
+    tsm = _best(lambda: smallmatrix.eigvalsh3(s), 20)
+    print("{0:>24} {1:12.3f} {2:12.3f} {3:10.1f}".format("eigvalsh 3x3", 1e6 * tnp / STACK, 1e6 * tsm / STACK, tnp / tsm))
+    print()
+
+
+class _NumpyKernels(object):
+    """ Stand-in for smallmatrix using np.linalg (reference only). """
+    inv = staticmethod(np.linalg.inv)
+    @staticmethod
+    def eigvalsh3(a):
+        return np.linalg.eigvalsh(a)
+
+
+def fits():
+    """ Time per-polyhedron fitting latency for each coordination number. """
+    print("Fitting latency (us per polyhedron, tolerance {0})".format(TOLERANCE))
+    print("{0:>6} {1:>14} {2:>18} {3:>18} {4:>10}".format("CN", "single fit", "fit_many np.linalg", "fit_many kernels", "speedup"))
+    for i, cn in enumerate(sorted(SHAPES.keys())):
+        polys = makepolyhedra(4 * STACK)[i::4]
+
+        def single():
+            for pts in polys[:50]:
+                ellipsoid.Ellipsoid(points=pts, tolerance=TOLERANCE).findellipsoid(method='wolfe-atwood')
+        tsingle = _best(single, 1) / 50
+
+        ellipsoid.smallmatrix = _NumpyKernels
+        try:
+            tnp = _best(lambda: ellipsoid.fit_many(polys, tolerance=TOLERANCE), 1) / len(polys)
+        finally:
+            ellipsoid.smallmatrix = smallmatrix
+        tsm = _best(lambda: ellipsoid.fit_many(polys, tolerance=TOLERANCE), 1) / len(polys)
+        print("{0:6d} {1:14.1f} {2:18.1f} {3:18.1f} {4:10.2f}".format(cn, 1e6 * tsingle, 1e6 * tnp, 1e6 * tsm, tnp / tsm))
+
+
+def main():
+    kernels()
+    fits()
+
+
+if __name__ == "__main__":
+    main()
@@ -158,6 +158,23 @@ def main():
                         type=int,
                         default=None,
                         help="Maxmimum number of iterations for ellipsoid fitting (default infinite)")
+    parser.add_argument("--criterion",
+                        action="store",
+                        type=str,
+                        dest="criterion",
+                        default="step",
+                        choices=["step", "gap"],
+                        help="Convergence test for tolerance: change in weights ('step', default) or optimality gap ('gap'), which bounds the ellipsoid volume error")
+    parser.add_argument("--symmetry",
+                        action="store_true",
+                        dest="symmetry",
+                        help="Use faster ellipsoid fitting for centrosymmetric and high-symmetry sites")
+    parser.add_argument("--samples",
+                        action="store",
+                        type=int,
+                        dest="samples",
+                        default=0,
+                        help="Number of Monte Carlo samples used to estimate esds of ellipsoid parameters from CIF esds (default 0, no esds)")
     parser.add_argument("-b", "--block",
                          action="store",
                          type=str,
@@ -10,26 +10,63 @@ is also called to write data to a file.
 
 import sys
 import logging
+import numpy as np
 # Set up logger
 logger = logging.getLogger(__name__)
 
 def calcfromcif(CIF, centres, radius, allligtypes=[], alllignames=[], **kwargs):
-    """ Main routine for computing ellipsoids from CIF file. """
+    """ Main routine for computing ellipsoids from CIF file. 
+    
+    If `previous` is given as a Crystal object (e.g. the preceding step of a temperature
+    series), each ellipsoid fit starts from the weights of the matching polyhedron in
+    `previous`, provided its centre and ligand labels are identical.
+    
+    If `symmetry` is True, the site symmetry of each centre is found from the CIF symmetry
+    operations, allowing the centre to be off a symmetry element by its coordinate esd.
+    Where this fixes the ellipsoid centre on the central atom (e.g. an inversion centre or
+    cubic site) the faster centred fit is used; other sites are checked for symmetry
+    geometrically (see Ellipsoid.getminvol).
+    
+    If `samples` is given, the esds of cell parameters and atomic coordinates in the CIF are
+    propagated to the ellipsoid parameters using that many Monte Carlo samples (see
+    uncertainty.montecarlo), and stored as Ellipsoid.esds.
+    
+    If `shapes` is True, continuous shape measures of each polyhedron against all reference
+    shapes with the same coordination number are stored as Polyhedron.cshm (see cshm module).
+    
+    If `local` is True, only the centres and atoms within radius of them are generated from
+    the CIF symmetry operations (see readcoords.makeP1local), rather than the whole unit cell.
+    This is much faster for a few centres in a large cell, but the atoms of the returned
+    Crystal are then only those near the centres.
+    """
     # kwargs should be valid arguments for polyhedron.makeellipsoid(), primarily designed for tolerance and maxcycles
-    from pieface import readcoords
+    from pieface import readcoords, polyhedron
+    
+    previous = kwargs.pop('previous', None)
+    symmetry = kwargs.pop('symmetry', False)
+    samples = kwargs.pop('samples', 0)
+    shapes = kwargs.pop('shapes', False)
+    local = kwargs.pop('local', False)
     
     logger.debug('Starting file %s', CIF)
     logger.debug('Phase: %s', kwargs.get('phase', None))
-    cell, atomcoords, atomtypes, spacegp, symmops, symmid = readcoords.readcif(CIF, phaseblock = kwargs.get('phase', None))
-    allatoms = readcoords.makeP1cell(atomcoords, symmops, symmid)
+    cell, atomcoords, atomtypes, spacegp, symmops, symmid, cellesd, atomesds = readcoords.readcif(CIF, phaseblock = kwargs.get('phase', None), getesd = True)
+    if local:
+        allatoms = readcoords.makeP1local(atomcoords, symmops, symmid, centres, readcoords.Crystal(cell=cell).orthomatrix(), radius)
+    else:
+        allatoms = readcoords.makeP1cell(atomcoords, symmops, symmid)
     
     phase = readcoords.Crystal(cell=cell, atoms=allatoms, atomtypes=atomtypes)
+    orthom = phase.orthomatrix()
     
+    validcentres = []
     for cen in centres:
         if cen not in allatoms.keys():
             logger.info("Centre %s is not present in atom labels: skipping", cen)
-            continue
-            
+        elif cen not in validcentres:
+            validcentres.append(cen)
+    
+    if len(validcentres) > 0:
         validligtyps = list( set(allligtypes).intersection(set(atomtypes.values())))
         validlignames = list( set(alllignames).intersection(set(atomtypes.keys())))
         if len(validligtyps) == 0 and len(validlignames) == 0:
@@ -38,14 +75,45 @@ def calcfromcif(CIF, centres, radius, allligtypes=[], alllignames=[], **kwargs):
             logger.info("Not all types %s are present in %s; using %s", ", ".join(allligtypes), CIF, ", ".join(validligtyps))
         elif len(validlignames) != len(alllignames):
             logger.info("Not all labels %s are present in %s; using %s", ", ".join(alllignames), CIF, ", ".join(validlignames))
-        # Calculate ligands for current centre: the coordinates returned may be in a different unit cell to those in allatoms
-        ligands, ligtypes = readcoords.findligands(cen, phase.atoms, phase.orthomatrix(), radius=radius, types=validligtyps, names=validlignames, atomtypes=phase.atomtypes)
-        
-        phase.makepolyhedron({cen:allatoms[cen]}, ligands, atomdict=None, ligtypes=ligtypes)
-        
-        polynm = cen+"_poly"
-        
-        getattr(phase, polynm).makeellipsoid(phase.orthomatrix(), **kwargs)
+        # Find ligands of all centres in one search: the coordinates returned may be in a different unit cell to those in allatoms
+        if local:   # Not every site has its original label in allatoms, so check ligand names against the CIF labels
+            ligandsets = readcoords.neighbourlists(validcentres, allatoms, orthom, radius=radius, types=validligtyps, names=validlignames, atomtypes=atomtypes)
+        else:
+            ligandsets = readcoords.neighbourlists(validcentres, phase.atoms, orthom, radius=radius, types=validligtyps, names=validlignames, atomtypes=phase.atomtypes)
+    
+    for cen in validcentres:
+        liglbl, ligabc, ligtyp, centyp = ligandsets[cen]
+        
+        poly = polyhedron.Polyhedron.from_arrays(cen, allatoms[cen], liglbl, ligabc, ligtyp, centyp, labels=phase.labeltable)
+        phase.addpolyhedron(poly)
+        
+        fitargs = dict(kwargs)
+        if previous is not None and cen in previous.polyhedra:
+            prevpoly = previous.polyhedra[cen]
+            if getattr(prevpoly, 'ellipsoid', None) is not None and prevpoly.ellipsoid.weights is not None \
+                    and prevpoly.alllbl == poly.alllbl:
+                fitargs['u0'] = prevpoly.ellipsoid.weights
+            else:
+                logger.debug("Ligands of %s differ from previous structure: not reusing weights", cen)
+        if symmetry:
+            # Site symmetry leaves no direction invariant (averaged rotations vanish) if it fixes the centre.
+            # Sites may be off a symmetry element by their esd (or by CIF rounding, up to 1e-4 A)
+            sitetol = max(np.sqrt((np.dot(orthom, atomesds.get(cen, np.zeros(3)))**2).sum()), 1e-4)
+            siteops = readcoords.sitesymmetry(allatoms[cen], symmops, tol=sitetol, orthom=orthom)
+            if np.allclose(siteops.mean(axis=0), 0.):
+                fitargs['symmetry'] = 'centred'
+            else:
+                fitargs['symmetry'] = True
+            logger.debug("Site %s has %i symmetry operations: using symmetry=%s", cen, len(siteops), fitargs['symmetry'])
+        
+        poly.makeellipsoid(orthom, **fitargs)
+        if shapes:
+            poly.cshm = poly.shapemeasures(orthom)
+        
+    if samples:
+        from pieface import uncertainty
+        logger.debug('Estimating uncertainties from %i samples', samples)
+        uncertainty.montecarlo(phase, atomcoords, symmops, cellesd, atomesds, samples=samples, maxcycles=kwargs.get('maxcycles', None), criterion=kwargs.get('criterion', 'step'))
         
     logger.debug('Finishing file %s', CIF)    
     
@@ -56,41 +124,63 @@ def makenesteddict(phases):
     
     Dict structure is:
     {Central Atom Label : {Ellipsoid Parameter : Value } }
+    
+    Where uncertainties have been estimated, the mean and esd of each parameter are added
+    with suffixes '_mean' and '_esd'. Continuous shape measures, where calculated, are added
+    as 'cshm_' followed by the reference shape label.
     """
+    from pieface import uncertainty
     
     data = {}
+    geometry = dict([ (f, phases[f].bondgeometry()) for f in phases.keys() ])     # Distortion indices of all polyhedra in each phase
     
     for site in set( [ j for file in phases.keys() for j in phases[file].polyhedra ] ):      # Iterate through all possible atom types in phases dict
         data[site] = {}
         data[site]['files'] = [ f for f in phases.keys() if site in phases[f].polyhedra ]     # Get list of files for which site is present
         
-        #data[site]['radii'] = [ getattr(phases[f], site+"_poly").ellipsoid.radii for f in data[site]['files'] ]
-        data[site]['r1'] = [ getattr(phases[f], site+"_poly").ellipsoid.radii[0] for f in data[site]['files'] ]
-        data[site]['r2'] = [ getattr(phases[f], site+"_poly").ellipsoid.radii[1] for f in data[site]['files'] ]
-        data[site]['r3'] = [ getattr(phases[f], site+"_poly").ellipsoid.radii[2] for f in data[site]['files'] ]
-        data[site]['rad_sig'] = [ getattr(phases[f], site+"_poly").ellipsoid.raderr() for f in data[site]['files'] ]  
-        data[site]['meanrad'] = [ getattr(phases[f], site+"_poly").ellipsoid.meanrad() for f in data[site]['files'] ]
-        
-        #data[site]['centre'] = [ getattr(phases[f], site+"_poly").ellipsoid.centre for f in data[site]['files'] ]
-        data[site]['cenx'] = [ getattr(phases[f], site+"_poly").ellipsoid.centre[0] for f in data[site]['files'] ]
-        data[site]['ceny'] = [ getattr(phases[f], site+"_poly").ellipsoid.centre[1] for f in data[site]['files'] ]
-        data[site]['cenz'] = [ getattr(phases[f], site+"_poly").ellipsoid.centre[2] for f in data[site]['files'] ]
-        data[site]['centredisp'] = [ getattr(phases[f], site+"_poly").ellipsoid.centredisp() for f in data[site]['files'] ]
-        
-        data[site]['coordination'] = [ getattr(phases[f], site+"_poly").ellipsoid.numpoints() - 1 for f in data[site]['files'] ]
-        data[site]['shapeparam'] = [ getattr(phases[f], site+"_poly").ellipsoid.shapeparam() for f in data[site]['files'] ]
-        data[site]['sphererad'] = [ getattr(phases[f], site+"_poly").ellipsoid.sphererad() for f in data[site]['files'] ]
-        data[site]['ellipsvol'] = [ getattr(phases[f], site+"_poly").ellipsoid.ellipsvol() for f in data[site]['files'] ]
-        data[site]['strainen'] = [ getattr(phases[f], site+"_poly").ellipsoid.strainenergy() for f in data[site]['files'] ]
+        polys = [ phases[f].polyhedra[site] for f in data[site]['files'] ]
+        ellipsoids = [ p.ellipsoid for p in polys ]
+        
+        #data[site]['radii'] = [ e.radii for e in ellipsoids ]
+        data[site]['r1'] = [ e.radii[0] for e in ellipsoids ]
+        data[site]['r2'] = [ e.radii[1] for e in ellipsoids ]
+        data[site]['r3'] = [ e.radii[2] for e in ellipsoids ]
+        data[site]['rad_sig'] = [ e.raderr() for e in ellipsoids ]  
+        data[site]['meanrad'] = [ e.meanrad() for e in ellipsoids ]
+        
+        #data[site]['centre'] = [ e.centre for e in ellipsoids ]
+        data[site]['cenx'] = [ e.centre[0] for e in ellipsoids ]
+        data[site]['ceny'] = [ e.centre[1] for e in ellipsoids ]
+        data[site]['cenz'] = [ e.centre[2] for e in ellipsoids ]
+        data[site]['centredisp'] = [ e.centredisp() for e in ellipsoids ]
+        
+        data[site]['coordination'] = [ e.numpoints() - 1 for e in ellipsoids ]
+        data[site]['shapeparam'] = [ e.shapeparam() for e in ellipsoids ]
+        data[site]['sphererad'] = [ e.sphererad() for e in ellipsoids ]
+        data[site]['ellipsvol'] = [ e.ellipsvol() for e in ellipsoids ]
+        data[site]['strainen'] = [ e.strainenergy() for e in ellipsoids ]
 
-        data[site]['cenr1'] = [ getattr(phases[f], site+"_poly").ellipsoid.centreaxes()[0] for f in data[site]['files'] ]
-        data[site]['cenr2'] = [ getattr(phases[f], site+"_poly").ellipsoid.centreaxes()[1] for f in data[site]['files'] ]
-        data[site]['cenr3'] = [ getattr(phases[f], site+"_poly").ellipsoid.centreaxes()[2] for f in data[site]['files'] ]
+        data[site]['cenr1'] = [ e.centreaxes()[0] for e in ellipsoids ]
+        data[site]['cenr2'] = [ e.centreaxes()[1] for e in ellipsoids ]
+        data[site]['cenr3'] = [ e.centreaxes()[2] for e in ellipsoids ]
 
-        data[site]['rotation'] = [ getattr(phases[f], site+"_poly").ellipsoid.rotation for f in data[site]['files'] ]
+        data[site]['rotation'] = [ e.rotation for e in ellipsoids ]
+        
+        data[site]['meanbond'] = [ p.averagebondlen(phases[f].mtensor()) for p, f in zip(polys, data[site]['files']) ]
+        data[site]['bondsig'] = [ p.bondlensig(phases[f].mtensor()) for p, f in zip(polys, data[site]['files']) ]
+        for key in ['polyvol', 'quadelong', 'anglevar', 'econ']:
+            data[site][key] = [ float(geometry[f][site][key]) for f in data[site]['files'] ]
+        
+        # Monte Carlo means and esds, if calculated for any file (see uncertainty.montecarlo)
+        if any( getattr(e, 'esds', None) is not None for e in ellipsoids ):
+            for key, name in uncertainty.PROPERTIES:
+                data[site][key+'_mean'] = [ e.esds[key][0] if getattr(e, 'esds', None) is not None else np.nan for e in ellipsoids ]
+                data[site][key+'_esd'] = [ e.esds[key][1] if getattr(e, 'esds', None) is not None else np.nan for e in ellipsoids ]
         
-        data[site]['meanbond'] = [ getattr(phases[f], site+"_poly").averagebondlen(getattr(phases[f], 'mtensor')()) for f in data[site]['files'] ]
-        data[site]['bondsig'] = [ getattr(phases[f], site+"_poly").bondlensig(getattr(phases[f], 'mtensor')()) for f in data[site]['files'] ]
+        # Continuous shape measures, if calculated for any file (see cshm.shapemeasures)
+        shapes = [ getattr(p, 'cshm', None) or {} for p in polys ]
+        for ref in sorted(set( k for s in shapes for k in s.keys() )):
+            data[site]['cshm_'+ref] = [ s.get(ref, np.nan) for s in shapes ]
         
         
     return data
@@ -128,4 +218,4 @@ if __name__ == "__main__":
         
         
         
-        
\ No newline at end of file
+        
\ No newline at end of file
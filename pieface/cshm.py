@@ -0,0 +1,151 @@
+"""
+Continuous shape measures (CShM) of coordination polyhedra against ideal reference shapes.
+
+The shape measure of N ligand positions q relative to a reference shape p (Pinsky & Avnir, 1998) is
+
+    S = 100 * min( sum |q_i - s.R.p_j(i) + t|**2 ) / sum |q_i - q0|**2
+
+minimised over rotations R, scale s, translation t and all pairings j(i) of ligands with reference
+vertices, with q0 the centroid of the ligands. S is 0 for an ideal shape and at most 100.
+
+Rather than trying all N! pairings, each search starts from a rotation that maps two reference
+vertices onto a pair of ligands, then alternates optimal pairing (Hungarian algorithm) and optimal
+rotation (Kabsch algorithm) until the pairing no longer changes. Starts that reach a pairing
+already refined are abandoned.
+"""
+
+from __future__ import division
+import numpy as np
+import logging
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+def _polygon(n, z=0., phase=0.):
+    """ Return vertices of a regular n-gon of unit circumradius at height z. """
+    angles = 2.*np.pi*np.arange(n)/n + phase
+    return np.vstack([np.cos(angles), np.sin(angles), z*np.ones(n)]).T
+
+_PHI = (1. + np.sqrt(5.)) / 2.
+_POLE = np.array([[0., 0., 1.], [0., 0., -1.]])
+
+# Ideal reference shapes (vertices only), labelled as in the SHAPE program
+REFERENCES = {'L-2'     : _POLE,                                                         # Linear
+              'TP-3'    : _polygon(3),                                                   # Trigonal plane
+              'T-4'     : np.array([[1.,1.,1.],[1.,-1.,-1.],[-1.,1.,-1.],[-1.,-1.,1.]]),   # Tetrahedron
+              'SP-4'    : _polygon(4),                                                   # Square plane
+              'TBPY-5'  : np.vstack([_polygon(3), _POLE]),                               # Trigonal bipyramid
+              'vOC-5'   : np.vstack([_polygon(4), _POLE[:1]]),                           # Square pyramid (vacant octahedron)
+              'HP-6'    : _polygon(6),                                                   # Hexagon
+              'OC-6'    : np.vstack([_polygon(4), _POLE]),                               # Octahedron
+              'TPR-6'   : np.vstack([_polygon(3, np.sqrt(3.)/2.), _polygon(3, -np.sqrt(3.)/2.)]),     # Trigonal prism (equal edges)
+              'PBPY-7'  : np.vstack([_polygon(5), _POLE]),                               # Pentagonal bipyramid
+              'CU-8'    : np.array([[x,y,z] for x in [-1.,1.] for y in [-1.,1.] for z in [-1.,1.]]),  # Cube
+              'SAPR-8'  : np.vstack([_polygon(4, np.sqrt(np.sqrt(0.125))), _polygon(4, -np.sqrt(np.sqrt(0.125)), np.pi/4.)]), # Square antiprism (equal edges)
+              'IC-12'   : np.array([ p for s in [-1.,1.] for t in [-1.,1.] for p in ([0.,s,t*_PHI], [s,t*_PHI,0.], [t*_PHI,0.,s]) ]),  # Icosahedron
+              'CUBO-12' : np.array([ p for s in [-1.,1.] for t in [-1.,1.] for p in ([0.,s,t], [s,t,0.], [t,0.,s]) ]),  # Cuboctahedron
+              }
+
+def _hungarian(cost):
+    """ Return the column assigned to each row that minimises the total of a square cost matrix. """
+    n = len(cost)
+    INF = float('inf')
+    u, v = [0.]*(n+1), [0.]*(n+1)
+    match = [0]*(n+1)      # Row (1-based) matched to each column (1-based); column 0 is a dummy
+    way = [0]*(n+1)
+    cost = cost.tolist()
+    for i in range(1, n+1):
+        match[0] = i
+        j0 = 0
+        minv = [INF]*(n+1)
+        used = [False]*(n+1)
+        while True:
+            used[j0] = True
+            i0, delta, j1 = match[j0], INF, 0
+            row = cost[i0-1]
+            for j in range(1, n+1):
+                if not used[j]:
+                    cur = row[j-1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j], way[j] = cur, j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            for j in range(n+1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    assignment = np.zeros(n, dtype=int)
+    for j in range(1, n+1):
+        assignment[match[j]-1] = j-1
+    return assignment
+
+def _rotation(q, p):
+    """ Return the proper rotation R maximising sum(q_i . R.p_i), and that maximum (Kabsch algorithm). """
+    U, s, Vt = np.linalg.svd(np.dot(q.T, p))
+    sign = np.sign(np.linalg.det(np.dot(U, Vt))) or 1.
+    s[-1] *= sign
+    U[:,-1] *= sign
+    return np.dot(U, Vt), s.sum()
+
+def _pairrotations(q, p):
+    """ Yield rotations taking two non-collinear reference vertices onto each ordered pair of ligands. """
+    a = 0
+    b = np.argmax(np.sqrt((np.cross(p, p[a])**2).sum(axis=1)))
+    for i in range(len(q)):
+        for j in range(len(q)):
+            if i != j:
+                yield _rotation(q[[i, j]], p[[a, b]])[0]
+
+def shapemeasure(points, reference, maxiter=50):
+    """ Return the continuous shape measure of points against reference vertices, and the pairing used.
+
+    points and reference are (N, 3) arrays (e.g. Polyhedron.ligdelxyz, or a value of REFERENCES).
+    The pairing gives the reference vertex matched with each point.
+    """
+    q = np.asarray(points, dtype=float)
+    p = np.asarray(reference, dtype=float)
+    if q.shape != p.shape or q.ndim != 2 or q.shape[1] != 3:
+        raise ValueError("Points {0} and reference {1} must be (N, 3) arrays of the same shape".format(q.shape, p.shape))
+    q = q - q.mean(axis=0)
+    p = p - p.mean(axis=0)
+    qnorm, pnorm = (q**2).sum(), (p**2).sum()
+    if qnorm == 0.:
+        raise ValueError("Points are coincident: shape measure is undefined")
+    best, bestpairs = -np.inf, np.arange(len(q))
+    seen = set()
+    for rot in _pairrotations(q, p):
+        pairs = None
+        for i in range(maxiter):
+            newpairs = _hungarian(-np.dot(q, np.dot(rot, p.T)))
+            key = tuple(newpairs)
+            if pairs is None and key in seen:
+                break       # Start leads to a pairing that has already been refined
+            seen.add(key)
+            if pairs is not None and (newpairs == pairs).all():
+                break
+            pairs = newpairs
+            rot, overlap = _rotation(q, p[pairs])
+        else:
+            logger.debug("Shape measure search did not converge in %i iterations", maxiter)
+        if pairs is not None and overlap > best:
+            best, bestpairs = overlap, pairs
+    return max(100. * (1. - best**2 / (qnorm * pnorm)), 0.), bestpairs
+
+def shapemeasures(points, names=None):
+    """ Return dict of shape measures of points against all reference shapes with the same number of vertices.
+
+    names restricts the reference shapes used (keys of REFERENCES).
+    """
+    points = np.asarray(points, dtype=float)
+    if names is None:
+        names = [ k for k in sorted(REFERENCES.keys()) if len(REFERENCES[k]) == len(points) ]
+    return dict([ (k, shapemeasure(points, REFERENCES[k])[0]) for k in names ])
@@ -13,24 +13,324 @@ Basic usage:
 
 from __future__ import division
 import numpy as np
+import smallmatrix
+import sharedarrays
 
 
+def _coreset(points):
+    """ Return initial weights on the Kumar-Yildirim core set of points (2d points at most).
+    
+    Points are chosen in pairs as the extremes along successive directions, each direction
+    orthogonal to the span of the pairs already found.
+    """
+    (N, d) = np.shape(points)
+    u = np.zeros(N)
+    diffs = np.zeros((0, d))
+    for i in range(d):
+        if i == 0:
+            # Start along the direction of largest spread
+            direction = np.linalg.svd(points - points.mean(axis=0))[2][0]
+        else:
+            direction = np.linalg.svd(diffs)[2][i]
+        proj = np.dot(points, direction)
+        alpha, beta = np.argmax(proj), np.argmin(proj)
+        u[alpha] += 1.
+        u[beta] += 1.
+        diffs = np.vstack([diffs, points[alpha] - points[beta]])
+    return u / u.sum()
+
+def _hullindices(points):
+    """ Return indices of the distinct points that can lie on the convex hull of points.
+    
+    Exact duplicates are removed, then interior points are discarded using scipy.spatial.ConvexHull
+    if scipy is available. Otherwise, points that cannot support the minimum bounding ellipsoid
+    are removed using the bound of Harman & Pronzato (2007) evaluated at uniform weights.
+    """
+    points = np.ascontiguousarray(points, dtype=float)
+    (N, d) = np.shape(points)
+    rows = points.view(np.dtype((np.void, points.dtype.itemsize * d))).ravel()
+    unique = np.sort(np.unique(rows, return_index=True)[1])
+    try:
+        from scipy.spatial import ConvexHull
+    except ImportError:
+        ConvexHull = None
+    if ConvexHull is not None:
+        try:
+            return unique[np.sort(ConvexHull(points[unique]).vertices)]
+        except Exception:       # Qhull fails for degenerate point sets
+            return unique
+    Q = np.vstack([points[unique].T, np.ones(len(unique))])
+    M = np.einsum('ij,ij->j', Q, np.linalg.solve(np.dot(Q, Q.T) / len(unique), Q))
+    return unique[M >= _supportbound(M, d + 1.0)]
+
+def _supportbound(M, m):
+    """ Return the value of M below which a point cannot support the minimum bounding ellipsoid.
+    
+    Bound of Harman & Pronzato (2007), for M = diag(QT.inv(V).Q) at any (normalised) weights,
+    where Q has m rows.
+    """
+    eps = np.max(M) / m - 1.0
+    bound = m * (1.0 + eps / 2.0 - np.sqrt(eps * (4.0 + eps - 4.0 / m)) / 2.0)
+    return bound - 1e-8 * m     # Allow for rounding when weights are already optimal
+
+def _symmetricpath(points, symmetry, symprec):
+    """ Return the fitting path ('sphere', 'centred' or 'full') and centre for a set of points, with weights and gap for a sphere.
+    
+    A point set that is invariant under symmetry operations with a single common fixed point
+    (such as inversion, or cubic site symmetry) has its minimum bounding ellipsoid centred on
+    that point. symmetry=True detects inversion symmetry through the centroid of the points,
+    while symmetry='centred' asserts that the first point (the central atom of a polyhedron)
+    is fixed, e.g. by site symmetry. A sphere is identified when the most distant points have
+    zero mean and an isotropic second moment, and is only accepted if uniform weights on these
+    points leave an optimality gap below symprec. Points must be symmetric to within symprec
+    (e.g. the fit tolerance), relative to their largest distance from the centre.
+    """
+    (N, d) = np.shape(points)
+    if symmetry == 'centred':
+        centre = points[0]
+    else:
+        centre = points.mean(axis=0)
+    rel = points - centre
+    dist = np.sqrt((rel**2).sum(axis=1))
+    tol = symprec * dist.max()
+    shell = dist >= dist.max() - tol
+    second = np.dot(rel[shell].T, rel[shell]) / shell.sum()
+    if np.abs(rel[shell].mean(axis=0)).max() <= tol and \
+            np.abs(second - np.eye(d) * np.trace(second) / d).max() <= tol * dist.max():
+        # Confirm optimality of uniform weights on the shell from the gap over all points
+        u = shell / float(shell.sum())
+        Q = np.vstack([points.T, np.ones(N)])
+        M = np.einsum('ij,ij->j', Q, np.linalg.solve(np.dot(Q * u, Q.T), Q))
+        gap = max(M.max() / (d + 1.0) - 1.0, 0.)
+        if gap <= symprec:
+            return 'sphere', centre, u, gap
+    if symmetry == 'centred':
+        return 'centred', centre, None, None
+    # Check every point has an inverse partner through the centroid
+    if all( np.abs(rel + r).max(axis=1).min() <= tol for r in rel ):
+        return 'centred', centre, None, None
+    return 'full', centre, None, None
+
+def _kktderivatives(rel, lam, radii):
+    """ Derivatives of ellipsoid centre and inverse squared radii with respect to support points.
+
+    rel holds the support points relative to the centre, in the basis of the ellipsoid axes
+    (so that the ellipsoid matrix is diag(1/radii**2)), and lam their Lagrange multipliers
+    (d times their weights). The optimality conditions of the minimum-volume ellipsoid,
+        sum(lam * r.rT) = inv(A),  sum(lam * r) = 0,  rT.A.r = 1 for each support point,
+    are differentiated implicitly, and the resulting linear system solved by least squares
+    (so that support sets which over-determine the ellipsoid are handled).
+
+    Returns dcen (d, S, d) and dsig (d, S, d): derivatives of the centre and of diag(A)
+    with respect to each coordinate of each support point.
+    """
+    S, d = rel.shape
+    A = np.diag(1. / radii**2)
+    Ainv = np.diag(radii**2)
+    iu = np.triu_indices(d)
+    nA = len(iu[0])
+    basis = np.zeros((nA, d, d))
+    basis[np.arange(nA), iu[0], iu[1]] = 1.
+    basis[np.arange(nA), iu[1], iu[0]] = 1.
+    eye = np.eye(d)
+    Ar = np.dot(rel, A)
+    g = np.dot(lam, rel)
+    n = nA + d + S
+    Jx = np.zeros((n, n))
+    Jp = np.zeros((n, S, d))
+    # Columns for dA, dc and dlam; rows for the matrix, centre and boundary conditions
+    Jx[:nA, :nA] = np.einsum('ij,kjl,lm->kim', Ainv, basis, Ainv)[:, iu[0], iu[1]].T
+    Jx[nA+d:, :nA] = np.einsum('si,kij,sj->sk', rel, basis, rel)
+    Jx[:nA, nA:nA+d] = -(eye[:, :, np.newaxis] * g + g[:, np.newaxis] * eye[:, np.newaxis, :])[:, iu[0], iu[1]].T
+    Jx[nA:nA+d, nA:nA+d] = -lam.sum() * eye
+    Jx[nA+d:, nA:nA+d] = -2. * Ar
+    Jx[:nA, nA+d:] = (rel[:, :, np.newaxis] * rel[:, np.newaxis, :])[:, iu[0], iu[1]].T
+    Jx[nA:nA+d, nA+d:] = rel.T
+    outer = lam[:, np.newaxis, np.newaxis, np.newaxis] * (eye[np.newaxis, :, :, np.newaxis] * rel[:, np.newaxis, np.newaxis, :])
+    Jp[:nA] = np.rollaxis((outer + np.swapaxes(outer, 2, 3))[:, :, iu[0], iu[1]], 2)
+    Jp[nA:nA+d] = np.rollaxis(lam[:, np.newaxis, np.newaxis] * eye, 1)
+    Jp[nA+d + np.arange(S), np.arange(S)] = 2. * Ar
+    dx = -np.linalg.lstsq(Jx, Jp.reshape(n, S*d), rcond=n*np.finfo(float).eps)[0].reshape(n, S, d)     # rcond=None needs numpy 1.14
+    diag = [ list(zip(iu[0], iu[1])).index((k, k)) for k in range(d) ]
+    return dx[nA:nA+d], dx[diag]
+
+def fit_many(points_list, tolerance=1e-6, maxcycles=None, criterion='step', u0=None):
+    """ Fit minimum bounding ellipsoids to many sets of points at once.
+    
+    Point sets (each an (N,3) array, N may differ between sets) are padded into a masked
+    (batch, N, 3) array and the Khachiyan iteration is run on all of them together, so
+    that thousands of small polyhedra can be fitted without per-object Python overhead.
+    Sets that are not three-dimensional (fewer than four points, collinear or coplanar)
+    are fitted individually with Ellipsoid.findellipsoid. criterion is as for Ellipsoid.getminvol.
+    
+    u0, if given, holds initial weights for each set (e.g. Ellipsoid.weights from a fit of
+    a similar set). As in Ellipsoid.getminvol, uniform weights are used for any set whose
+    weighted points do not span the full space.
+    
+    Returns
+    -------
+    centres : (batch, 3) array
+    radii : (batch, 3) array, ordered r1 > r2 > r3
+    rotations : (batch, 3, 3) array
+    """
+    if criterion not in ['step', 'gap']:
+        raise ValueError("Unknown stopping criterion '{0}'".format(criterion))
+    B = len(points_list)
+    counts = np.array([ len(p) for p in points_list ], dtype=int)
+    if u0 is not None:
+        u0 = [ np.array(w, dtype=float) for w in u0 ]
+        if len(u0) != B or any( w.shape != (counts[i],) or (w < 0.).any() or w.sum() <= 0. for i, w in enumerate(u0) ):
+            raise ValueError("Initial weights u0 must be non-negative values for each point of each set")
+    d = 3
+    centres = np.zeros((B, d))
+    radii = np.zeros((B, d))
+    rotations = np.zeros((B, d, d))
+    if B == 0:
+        return centres, radii, rotations
+    
+    # Pad point sets into stacked arrays, with mask marking real points
+    P = np.zeros((B, counts.max(), d))
+    mask = np.arange(counts.max()) < counts[:, np.newaxis]
+    for i, pts in enumerate(points_list):
+        P[i, :counts[i]] = pts
+    
+    # Find which sets are clearly 3D from eigenvalues of their scatter matrices (nearly
+    # planar or linear sets are left to Ellipsoid.findellipsoid, which tests them exactly)
+    rel = np.where(mask[:,:,np.newaxis], P - P[:, :1, :], 0.)
+    ev = smallmatrix.eigvalsh3(np.einsum('bni,bnj->bij', rel, rel))
+    threed = (counts > 3) & ( ev[:, 0] > 1e-7 * ev[:, -1] )
+    
+    for i in np.flatnonzero(~threed):
+        ell = Ellipsoid(points=np.asarray(points_list[i], dtype=float), tolerance=tolerance)
+        ell.findellipsoid(maxcycles=maxcycles, criterion=criterion, u0=None if u0 is None else u0[i])
+        centres[i], radii[i], rotations[i] = ell.centre, ell.radii, ell.rotation
+    
+    idx3d = np.flatnonzero(threed)
+    if len(idx3d) == 0:
+        return centres, radii, rotations
+    P = P[idx3d]
+    mask = mask[idx3d]
+    
+    # Lifted coordinates (padding rows are zero so they never contribute to V)
+    Q = np.concatenate([P, mask[:,:,np.newaxis].astype(float)], axis=2)
+    u = mask / counts[idx3d, np.newaxis].astype(float)
+    active = np.ones(len(idx3d), dtype=bool)
+    # Flattened outer products q.q^T of every point: V = sum(u*qq) and M = qq.inv(V), both without NxN arrays
+    QQ = (Q[:,:,:,np.newaxis] * Q[:,:,np.newaxis,:]).reshape(Q.shape[0], Q.shape[1], (d+1)**2)
+    if u0 is not None:
+        w = np.zeros(mask.shape)
+        for k, i in enumerate(idx3d):
+            w[k, :counts[i]] = u0[i] / u0[i].sum()
+        # Rank of each stacked matrix as np.linalg.matrix_rank (which only takes stacks from numpy 1.14)
+        s = np.linalg.svd( (QQ * w[:,:,np.newaxis]).sum(axis=1).reshape(len(idx3d), d+1, d+1), compute_uv=False )
+        spans = (s > s.max(axis=1)[:,np.newaxis] * (d+1) * np.finfo(float).eps).sum(axis=1) == d+1
+        u[spans] = w[spans]
+    
+    count = 0
+    while active.any():
+        if maxcycles is not None and count > maxcycles-1:
+            break
+        act = np.flatnonzero(active)
+        QQa = QQ[act]
+        ua = u[act]
+        V = (QQa * ua[:,:,np.newaxis]).sum(axis=1).reshape(len(act), d+1, d+1)
+        Vinv = smallmatrix.inv(V)
+        M = (QQa * Vinv.reshape(len(act), 1, (d+1)**2)).sum(axis=2)
+        M[~mask[act]] = -np.inf
+        j = np.argmax(M, axis=1)
+        maximum = M[np.arange(len(act)), j]
+        if criterion == 'gap':
+            # Retire sets whose optimality gap is already small enough, before stepping
+            done = maximum / (d + 1.0) - 1.0 <= tolerance
+            active[act[done]] = False
+            act, j, maximum, ua = act[~done], j[~done], maximum[~done], ua[~done]
+        step_size = (maximum - d - 1.0) / ((d + 1.0) * (maximum - 1.0))
+        new_u = (1.0 - step_size)[:, np.newaxis] * ua
+        new_u[np.arange(len(act)), j] += step_size
+        u[act] = new_u
+        if criterion == 'step':
+            err = np.sqrt(((new_u - ua)**2).sum(axis=1))
+            active[act[err <= tolerance]] = False
+        count += 1
+    
+    # Ellipsoid parameters for all 3D sets
+    cen = np.einsum('bni,bn->bi', P, u)
+    A = smallmatrix.inv( np.einsum('bni,bn,bnj->bij', P, u, P) - cen[:,:,np.newaxis] * cen[:,np.newaxis,:] ) / d
+    U, sv, rot = np.linalg.svd(A)
+    centres[idx3d] = cen
+    radii[idx3d] = (1.0 / np.sqrt(sv))[:, ::-1]
+    rotations[idx3d] = rot[:, ::-1, :]
+    
+    return centres, radii, rotations
+
 class Ellipsoid(object):
     """ An object for computing various hyperellipse properties. """
+    # Fixed attributes, as one ellipsoid is kept with every fitted polyhedron
+    __slots__ = ('_points', 'tolerance', 'radii', 'centre', 'rotation', 'ellipdims', 'weights', 'fitpath', 'gap', 'cycles', 'esds')
     def __init__(self, points=None, tolerance=1e-6):
         self.tolerance = tolerance
         self.radii = None   # Define radii as [r1 > r2 > r3], in that order
         self.centre = None
         self.rotation = None
         self.ellipdims = None
+        self.weights = None     # Final Khachiyan weight of each point (non-zero only for support points)
+        self.fitpath = None     # How the ellipsoid was found ('sphere', 'centred', 'full', 'line' or 'point')
+        self.gap = None         # Achieved optimality gap max(M)/(d+1) - 1 of the final weights
+        self.cycles = None      # Number of iterations used in the fit
+        self.esds = None        # Monte Carlo (mean, esd) of ellipsoid properties (see uncertainty.montecarlo)
         self.points = points
 
+    def __getstate__(self):
+        return sharedarrays.getslots(self)
+    def __setstate__(self, state):
+        sharedarrays.setslots(self, state)
+
         
-    def getminvol(self, points=None, maxcycles=None):
+    def getminvol(self, points=None, maxcycles=None, algorithm='khachiyan', u0=None, criterion='step', hull=False, symmetry=False):
         """ Find the minimum bounding ellipsoid for a set of points using the Khachiyan algorithm. 
         
         This can be quite time-consuming if a small tolerance is required, and ellipsoid axes
         lie a long way from axis directions.
+        
+        Each iteration costs O(N*d^2) in time and O(N*d) in memory for N points in d dimensions
+        (no NxN arrays are formed), so large point sets can be fitted directly.
+        
+        algorithm can be one of:
+            'khachiyan'       : recompute inv(V) from scratch at every iteration (default)
+            'khachiyan-rank1' : keep inv(V) and M up to date with Sherman-Morrison rank-one
+                                updates, refactorising every `refactor` iterations. Each
+                                iteration is O(N*d) rather than O(N*d^2), which only pays
+                                off for large point sets (N of order 1000 or more in 3D);
+                                for polyhedra it is no faster than 'khachiyan'.
+            'wolfe-atwood'    : Kumar-Yildirim core-set initialisation followed by Khachiyan
+                                steps combined with Wolfe-Atwood away steps, which remove
+                                weight from interior points. Converges much faster when
+                                many points (or distorted polyhedra) are involved. Stops
+                                when max(M)/(d+1) - 1 and 1 - min(M[support])/(d+1) both
+                                fall below tolerance, rather than on the change in weights.
+        
+        u0 gives initial weights for each point (e.g. self.weights from a previous fit of a
+        similar point set), which can greatly reduce the number of iterations needed. If
+        the weighted points do not span the full space, uniform weights are used instead.
+        The final weights are stored as self.weights.
+        
+        criterion sets when the 'khachiyan' and 'khachiyan-rank1' iterations stop:
+            'step' : the change in weights between iterations is below tolerance (default)
+            'gap'  : the optimality gap (max(M) - d - 1)/(d + 1) is below tolerance. All points
+                     then lie within the fitted ellipsoid scaled by sqrt(1 + (d+1)*gap/d), which
+                     bounds the error in the ellipsoid volume.
+        The gap achieved and number of iterations used are stored as self.gap and self.cycles.
+        
+        If hull is True, duplicate and interior points (which cannot define the ellipsoid) are
+        removed before fitting, and points shown not to support the ellipsoid are dropped every
+        `refactor` iterations. Removed points are given zero weight in self.weights.
+        
+        If symmetry is True (or 'centred', if the first point is known to be the centre of
+        symmetry, e.g. a central atom fixed by its site symmetry), symmetric point sets are
+        fitted more quickly: spheres are found without iteration, and centrosymmetric sets are
+        fitted with the centre fixed (a d-dimensional problem with no homogeneous coordinate).
+        Points are only treated as symmetric to within self.tolerance (relative to their
+        size), so genuine distortions are always fitted. The path taken is stored as self.fitpath.
         """
         # if set to a number, maxcycles will stop the calculation after that many iterations
         if points is None:
@@ -38,46 +338,144 @@ class Ellipsoid(object):
                 points = self.points
             except AttributeError:
                 raise
+        if algorithm not in ['khachiyan', 'khachiyan-rank1', 'wolfe-atwood']:
+            raise ValueError("Unknown ellipsoid fitting algorithm '{0}'".format(algorithm))
+        if criterion not in ['step', 'gap']:
+            raise ValueError("Unknown stopping criterion '{0}'".format(criterion))
+        rankone = (algorithm == 'khachiyan-rank1')
+        awaysteps = (algorithm == 'wolfe-atwood')
         
         (N, d) = np.shape(points)
         d = float(d)
+        if u0 is not None:
+            u0 = np.array(u0, dtype=float)
+            if u0.shape != (N,) or (u0 < 0.).any() or u0.sum() <= 0.:
+                raise ValueError("Initial weights u0 must be {0} non-negative values".format(N))
+        
+        self.fitpath = 'full'
+        centre = None
+        if symmetry:
+            self.fitpath, symcentre, shellweights, shellgap = _symmetricpath(points, symmetry, self.tolerance)
+            if self.fitpath == 'sphere':
+                # Uniform weight on the most distant points
+                self.weights = shellweights
+                self.gap = shellgap
+                self.cycles = 0
+                return (symcentre, np.sqrt(((points - symcentre)**2).sum(axis=1)).max() * np.ones(int(d)), np.eye(int(d)))
+            elif self.fitpath == 'centred':
+                centre = symcentre
+        
+        if centre is None:
+            allQ = np.vstack([np.copy(points.T), np.ones(N)])     # Lifted coordinates of all points
+        else:
+            allQ = (points - centre).T      # Centre is known, so no homogeneous coordinate is needed
+        m = float(allQ.shape[0])            # Size of the problem: d+1, or d with known centre
+        allpoints = points
+        keep = np.arange(N)
+        if hull:
+            # Fit only to points on the convex hull
+            keep = _hullindices(points)
+            points = points[keep]
+            N = len(keep)
+            if u0 is not None:
+                u0 = u0[keep]
     
         # Q will be our working array
-        Q = np.vstack([np.copy(points.T), np.ones(N)]) 
+        Q = allQ[:, keep]
         QT = Q.T
         # initialisations
         err = 1.0 + self.tolerance
-        u = (1.0 / N) * np.ones(N)
+        if u0 is not None and u0.sum() > 0.:
+            u = u0 / u0.sum()
+        elif awaysteps:
+            u = _coreset(Q[:-1].T if centre is None else Q.T)
+        else:
+            u = (1.0 / N) * np.ones(N)
+        if (u0 is not None or awaysteps) and np.linalg.matrix_rank(np.dot(Q * u, QT)) < m:
+            u = (1.0 / N) * np.ones(N)
 
         count=0
+        refactor = 50       # Iterations between full recalculation of inv(V) for rank-one updates
 
         # Khachiyan Algorithm
         while err > self.tolerance:
-            V = np.dot(Q, np.dot(np.diag(u), QT))
-            M = np.diag(np.dot(QT , np.dot(np.linalg.inv(V), Q)))    # M the diagonal vector of an NxN matrix
+            if not rankone or count % refactor == 0:
+                # V = Q.diag(u).QT and M = diag(QT.inv(V).Q), formed without any NxN intermediate
+                Vinv = np.linalg.inv(np.dot(Q * u, QT))
+                M = np.einsum('ij,ij->j', Q, np.dot(Vinv, Q))     # M the diagonal vector of QT.inv(V).Q
+            if hull and count % refactor == 0:
+                # Discard points that can no longer support the ellipsoid as the fit improves
+                drop = M < _supportbound(M, m)
+                if drop.any():
+                    keep, Q, u = keep[~drop], Q[:, ~drop], u[~drop] / u[~drop].sum()
+                    QT = Q.T
+                    N = len(keep)
+                    Vinv = np.linalg.inv(np.dot(Q * u, QT))
+                    M = np.einsum('ij,ij->j', Q, np.dot(Vinv, Q))
             j = np.argmax(M)
             maximum = M[j]
-            step_size = (maximum - d - 1.0) / ((d + 1.0) * (maximum - 1.0))
-            new_u = (1.0 - step_size) * u
-            new_u[j] += step_size
-            err = np.linalg.norm(new_u - u)
+            if awaysteps:
+                # Point with smallest M that still carries weight is the away-step candidate
+                support = np.flatnonzero(u > 0.)
+                k = support[np.argmin(M[support])]
+                minimum = M[k]
+            if awaysteps or criterion == 'gap':
+                # Optimality gap of the current weights: stop before taking a further step
+                err = maximum / m - 1.0
+                if awaysteps:
+                    # Also require that no support point lies much inside the ellipsoid
+                    err = max(err, 1.0 - minimum / m)
+                if err <= self.tolerance:
+                    break
+            if awaysteps and (1.0 - minimum / m) > (maximum / m - 1.0):
+                # Away step: move weight off point k (possibly dropping it entirely)
+                if minimum > 1.0:
+                    step_size = min((m - minimum) / (m * (minimum - 1.0)), u[k] / (1.0 - u[k]))
+                else:
+                    step_size = u[k] / (1.0 - u[k])
+                new_u = (1.0 + step_size) * u
+                new_u[k] -= step_size
+                if new_u[k] < 0.:
+                    new_u[k] = 0.
+            else:
+                step_size = (maximum - m) / (m * (maximum - 1.0))
+                new_u = (1.0 - step_size) * u
+                new_u[j] += step_size
+            if not awaysteps and criterion == 'step':
+                err = np.sqrt(np.dot(new_u - u, new_u - u))
             
             if maxcycles is not None:
                 if count > maxcycles-1:
                     self.tolerance = err
                     break
+            if rankone and not awaysteps:
+                # V -> (1-step)V + step*q_j.q_j^T, so update inv(V) and M with Sherman-Morrison
+                w = np.dot(Vinv, Q[:,j])
+                scale = step_size / (1.0 - step_size + step_size * maximum)
+                Vinv = (Vinv - scale * np.outer(w, w)) / (1.0 - step_size)
+                M = (M - scale * np.dot(w, Q)**2) / (1.0 - step_size)
             u = new_u
             count += 1
         #print "Converged with tolerance {0} in {1} iterations".format(loctol, count)
 
+        # Record the optimality gap of the final weights (over all points)
+        M = np.einsum('ij,ij->j', allQ, np.dot(np.linalg.inv(np.dot(Q * u, QT)), allQ))
+        self.gap = np.max(M) / m - 1.0
+        self.cycles = count
 
         # centre of the ellipse 
-        centre = np.dot(points.T, u)
-        # the A matrix for the ellipse
-        A = np.linalg.inv(
-                       np.dot(points.T, np.dot(np.diag(u), points)) - 
-                       np.array([[a * b for b in centre] for a in centre])
-                       ) / d
+        self.weights = np.zeros(allQ.shape[1])
+        self.weights[keep] = u
+        points = allpoints[keep]
+        if centre is None:
+            centre = np.dot(points.T, u)
+            # the A matrix for the ellipse
+            A = np.linalg.inv(
+                           np.dot(points.T * u, points) - 
+                           np.outer(centre, centre)
+                           ) / d
+        else:
+            A = np.linalg.inv(np.dot((points - centre).T * u, points - centre)) / d
         # Get the values we'd like to return
         U, s, rotation = np.linalg.svd(A)
         radii = 1.0/np.sqrt(s)
@@ -91,7 +489,12 @@ class Ellipsoid(object):
         return (centre, radii, rotation)
         
     def findellipsoid(self, suppliedpts=None, **kwargs):
-        """ Determine the number of dimensions required for hyperellipse, and call then compute it with getminvol. """
+        """ Determine the number of dimensions required for hyperellipse, and call then compute it with getminvol. 
+        
+        Keyword arguments maxcycles, method (fitting algorithm), u0 (initial weights),
+        criterion (stopping rule), hull (remove interior points) and symmetry (use symmetric
+        fast paths) are passed to getminvol.
+        """
 
         if suppliedpts is not None:
             self.points = suppliedpts
@@ -106,6 +509,16 @@ class Ellipsoid(object):
                 maxcycles = kwargs['maxcycles']
             else:
                 maxcycles = None
+        method = kwargs.get('method', 'khachiyan')      # Algorithm passed to getminvol
+        u0 = kwargs.get('u0', None)                     # Initial weights passed to getminvol
+        criterion = kwargs.get('criterion', 'step')     # Stopping criterion passed to getminvol
+        hull = kwargs.get('hull', False)                # Convex hull reduction passed to getminvol
+        symmetry = kwargs.get('symmetry', False)        # Symmetric fast paths in getminvol
+        
+        if self.numpoints() > 1:
+            # Rank of points (as np.linalg.matrix_rank), computed once for the tests below
+            s = np.linalg.svd(relpoints, compute_uv=False)
+            rank = np.sum(s > s.max() * max(relpoints.shape) * np.finfo(s.dtype).eps)
         
         if self.numpoints() == 1:
             # Single ligand, ellipsoid is (fairly) meaningless
@@ -113,8 +526,12 @@ class Ellipsoid(object):
             self.centre = points[0]
             self.rotation = np.eye(3)
             self.ellipdims = 0
+            self.weights = np.ones(1)
+            self.fitpath = 'point'
+            self.gap = 0.
+            self.cycles = 0
             
-        elif self.numpoints() == 2 or np.linalg.matrix_rank(relpoints) == 1:
+        elif self.numpoints() == 2 or rank == 1:
             # Points are collinear - ellipsoid fitting will fail
             U,s,V = np.linalg.svd(relpoints)
             vector = V.T[:,0]     # Unit vector defining points
@@ -123,13 +540,18 @@ class Ellipsoid(object):
             self.centre = vector * self.radii[2] + points[0]
             self.rotation = V
             self.ellipdims = 1
+            self.weights = np.zeros(len(points))
+            self.weights[[np.argmax(linepoints), np.argmin(linepoints)]] += 0.5     # Weight shared by end points
+            self.fitpath = 'line'
+            self.gap = 0.
+            self.cycles = 0
             
-        elif self.numpoints() == 3 or np.linalg.matrix_rank(relpoints) == 2:
+        elif self.numpoints() == 3 or rank == 2:
             # Points are co-planar. Need to redefine coordinates in terms of plane for ellipsoid fitting
             U,s,V = np.linalg.svd(relpoints)
             planenorm = V.T[:,2]      # Vector normal to plane of points
             planepoints = np.dot(relpoints, V.T)[:,:2]     # 2D coordinates of points in plane
-            centplane, radplane, rotplane = self.getminvol(planepoints, maxcycles=maxcycles)      # Values of ellipse in basis of plane
+            centplane, radplane, rotplane = self.getminvol(planepoints, maxcycles=maxcycles, algorithm=method, u0=u0, criterion=criterion, hull=hull, symmetry=symmetry)      # Values of ellipse in basis of plane
             #print centplane, radplane, rotplane
             self.radii = np.hstack([radplane, 0.])    # Radii are the same in both coordinate bases
             self.centre = np.dot( np.hstack([centplane, 0]), V) + points[0]
@@ -140,7 +562,7 @@ class Ellipsoid(object):
             
         else:
             # Points occupy 3D space. Assume convex
-            (cen,rad,rot) = self.getminvol(points, maxcycles=maxcycles)
+            (cen,rad,rot) = self.getminvol(points, maxcycles=maxcycles, algorithm=method, u0=u0, criterion=criterion, hull=hull, symmetry=symmetry)
             self.radii = np.array(rad)
             self.centre = cen
             self.rotation = rot
@@ -160,7 +582,6 @@ class Ellipsoid(object):
             pass
         elif points is None:      #Assume we are initialising
             self._points = points
-            self.numpoints = None
             return
         elif isinstance(points, list):
             points = np.array(points)
@@ -172,7 +593,13 @@ class Ellipsoid(object):
             raise ValueError("Points array cannot have more than 2 dimensions (passed {0})".format(len(shape)))
         self._points = points
         
+    @property
     def numpoints(self):
+        """ Function returning the number of points, or None if no points have been assigned. """
+        if self._points is None:
+            return None
+        return self._countpoints
+    def _countpoints(self):
         """ Return the number of points. """
         if self.points is not None:
             shape = self.points.shape
@@ -181,6 +608,58 @@ class Ellipsoid(object):
             else:
                 return shape[0]
         
+    def supportpoints(self, threshold=1e-3):
+        """ Return indices of points defining the ellipsoid (weight above threshold * max weight). """
+        if self.weights is not None:
+            return np.flatnonzero(self.weights > threshold * self.weights.max())
+        else:
+            raise AttributeError("Weights have not been defined: has an ellipsoid been fitted?")
+        
+    def sensitivity(self, threshold=1e-3):
+        """ Return first-order derivatives of radii, centre and shape parameter with respect to the points.
+
+        Derivatives come from implicit differentiation of the optimality conditions of the
+        fitted ellipsoid at its support points (see supportpoints; other points do not move
+        it), and are returned as a dict of arrays:
+            'radii'      : (3, N, 3), d(radii[k]) / d(points[j, m])
+            'centre'     : (3, N, 3), d(centre[k]) / d(points[j, m])
+            'shapeparam' : (N, 3),    d(shapeparam()) / d(points[j, m])
+
+        Planar fits only respond to displacements within the plane of the points (any other
+        displacement makes the points three-dimensional). For linear fits, centre is the first
+        point, as set by findellipsoid. Derivatives are not defined where radii are equal (e.g.
+        for a regular polyhedron), and the values returned for them should not be used.
+        """
+        if self.radii is None:
+            raise AttributeError("Radii have not been defined: has an ellipsoid been fitted?")
+        points = np.atleast_2d(self.points)
+        N = len(points)
+        drad = np.zeros((3, N, 3))
+        dcen = np.zeros((3, N, 3))
+        d = self.ellipdims
+        if d == 0:
+            dcen[:, 0, :] = np.eye(3)
+        elif d == 1:
+            # Radius is half the distance between the outermost points along the line
+            vector = self.rotation[0]
+            linepoints = np.dot(points - points[0], vector)
+            drad[0, np.argmax(linepoints)] += vector / 2.
+            drad[0, np.argmin(linepoints)] -= vector / 2.
+            dcen[:, 0, :] = np.eye(3)
+        else:
+            axes = self.rotation[:d]        # Ellipsoid axes spanning the points
+            support = self.supportpoints(threshold)
+            rel = np.dot(points[support] - self.centre, axes.T)
+            lam = d * self.weights[support] / self.weights[support].sum()
+            cenaxes, sigaxes = _kktderivatives(rel, lam, self.radii[:d])
+            # Radii are 1/sqrt(diag(A)) in the basis of the axes; convert back to cartesian coordinates
+            drad[:d, support] = np.dot(-0.5 * self.radii[:d, np.newaxis, np.newaxis]**3 * sigaxes, axes)
+            dcen[:, support] = np.einsum('ki,ksm->ism', axes, np.dot(cenaxes, axes))
+        r1, r2, r3 = self.radii
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dshape = drad[2]/r2 - r3*drad[1]/r2**2 - drad[1]/r1 + r2*drad[0]/r1**2
+        return {'radii' : drad, 'centre' : dcen, 'shapeparam' : dshape}
+
     def meanrad(self):
         """ Return the mean radius. """
         if self.radii is not None:
@@ -104,7 +104,7 @@ def _wrapper(args):
     """ Wrapper function for passing arguments to calcfromcif when multiprocessing """
     from pieface import calcellipsoid
     try:
-        return calcellipsoid.calcfromcif(args[0], args[1], args[2], allligtypes=args[3], alllignames=args[4], maxcycles=args[5], tolerance=args[6], phase=args[7])
+        return calcellipsoid.calcfromcif(args[0], args[1], args[2], allligtypes=args[3], alllignames=args[4], maxcycles=args[5], tolerance=args[6], phase=args[7], criterion=args[8], symmetry=args[9], samples=args[10])
     except IOError as e:    # Except IOErrors so that missing files are handled sensibly...
         return e
     except KeyboardInterrupt:
@@ -277,7 +277,7 @@ def check_ligands(cifs, ligtypes, liglbls, phase=None):
     return list(finallbl), list(finaltyp)
     
     
-def run_parallel(cifs, testcen, radius=3.0, ligtypes=[], lignames=[], maxcycles=None, tolerance=1e-6, procs=None, phase=None):
+def run_parallel(cifs, testcen, radius=3.0, ligtypes=[], lignames=[], maxcycles=None, tolerance=1e-6, procs=None, phase=None, criterion='step', symmetry=False, samples=0):
     """ Run ellipsoid computation in parallel, by CIF file """
 
     import threading
@@ -296,13 +296,13 @@ def run_parallel(cifs, testcen, radius=3.0, ligtypes=[], lignames=[], maxcycles=
     else:
         pool = multiprocessing.Pool(None, worker_configure, [queue])
     # Construct input for each cif file
-    vals = [ (i, testcen, radius, ligtypes, lignames, maxcycles, tolerance, phase,) for i in cifs ]
+    vals = [ (i, testcen, radius, ligtypes, lignames, maxcycles, tolerance, phase, criterion, symmetry, samples,) for i in cifs ]
 
     try:
         err = False
         log.warning('Processing all cif files...')
         log.info('Using options:')
-        for a in ['cifs', 'testcen', 'radius', 'ligtypes', 'lignames', 'maxcycles', 'tolerance', 'procs']:
+        for a in ['cifs', 'testcen', 'radius', 'ligtypes', 'lignames', 'maxcycles', 'tolerance', 'criterion', 'symmetry', 'samples', 'procs']:
             log.info('{0:20s} : {1}'.format(a, vars()[a]))
 
         results = pool.map(_wrapper, vals)
@@ -351,17 +351,17 @@ def run_parallel(cifs, testcen, radius=3.0, ligtypes=[], lignames=[], maxcycles=
     
     return phases
             
-def run_serial(cifs, testcen, radius=3.0, ligtypes=[], lignames=[], maxcycles=None, tolerance=1e-6, phase=None):
+def run_serial(cifs, testcen, radius=3.0, ligtypes=[], lignames=[], maxcycles=None, tolerance=1e-6, phase=None, criterion='step', symmetry=False, samples=0):
     log.warning('Processing all cif files...')
     log.info('Using options:')
-    for a in ['cifs', 'testcen', 'radius', 'ligtypes', 'lignames', 'maxcycles', 'tolerance', 'phase']:
+    for a in ['cifs', 'testcen', 'radius', 'ligtypes', 'lignames', 'maxcycles', 'tolerance', 'criterion', 'symmetry', 'samples', 'phase']:
         log.info('{0:20s} : {1}'.format(a, vars()[a]))
         
     phases = {}
     for i, CIF in enumerate(cifs):
         #log.debug("Starting file %s",CIF)
         try:
-            phases[CIF] = calcellipsoid.calcfromcif(CIF, testcen, radius, allligtypes=ligtypes, alllignames=lignames, maxcycles = maxcycles, tolerance=tolerance, phase=phase)
+            phases[CIF] = calcellipsoid.calcfromcif(CIF, testcen, radius, allligtypes=ligtypes, alllignames=lignames, maxcycles = maxcycles, tolerance=tolerance, phase=phase, criterion=criterion, symmetry=symmetry, samples=samples)
         except KeyError:
             log.critical("\nValid atom labels are:\n\n %s", ", ".join(_alllabels(CIF, phase)))
             raise
@@ -380,9 +380,9 @@ def plot_all(phases):
     plots = {}
     for CIF in phases.keys():
         plots[CIF] = {}    
-        for cen in getattr(phases[CIF], 'polyhedra'):
-            colours = getattr(phases[CIF], cen+"_poly").pointcolours()
-            plots[CIF][cen] = getattr(phases[CIF], cen+"_poly").ellipsoid.plotsummary(title=CIF+': '+cen, pointcolor=colours)
+        for cen, poly in phases[CIF].polyhedra.items():
+            colours = poly.pointcolours()
+            plots[CIF][cen] = poly.ellipsoid.plotsummary(title=CIF+': '+cen, pointcolor=colours)
             
     return plots
             
@@ -406,6 +406,9 @@ def main(cifs, centres, **kwargs):
     defaults['lignames'] = []
     defaults['tolerance'] = 1e-6
     defaults['maxcycles'] = None
+    defaults['criterion'] = 'step'
+    defaults['symmetry'] = False
+    defaults['samples'] = 0
     defaults['nosave'] = False
     defaults['writeall'] = False
     defaults['printlabels'] = False
@@ -476,7 +479,10 @@ def main(cifs, centres, **kwargs):
                                 maxcycles=args['maxcycles'],
                                 tolerance=args['tolerance'],
                                 procs=args['procs'],
-                                phase = args['phase'])
+                                phase = args['phase'],
+                                criterion = args['criterion'],
+                                symmetry = args['symmetry'],
+                                samples = args['samples'])
             log.debug('Finished parallel calculation')
         
         else:
@@ -490,7 +496,10 @@ def main(cifs, centres, **kwargs):
                                 lignames=testliglbl,
                                 maxcycles=args['maxcycles'],
                                 tolerance=args['tolerance'],
-                                phase = args['phase'])
+                                phase = args['phase'],
+                                criterion = args['criterion'],
+                                symmetry = args['symmetry'],
+                                samples = args['samples'])
             log.debug('Finished serial calculation')
     except:
         log.exception("Ellipsoid calculation aborted abnormally: see traceback for details")
@@ -0,0 +1,148 @@
+"""
+Periodic neighbour search of sites in a unit cell.
+
+Sites are sorted into a grid of bins in crystal coordinates, each bin being at least as wide as
+the search radius along each axis (or the whole cell, if the radius is larger). The images within
+radius of a centre are then all in the bins around the centre's own bin, covering as many
+neighbouring unit cells as the radius needs, so only these are compared. All centres are
+searched at once as array operations.
+
+Bins are set out in the Delaunay-reduced cell (see reducedbasis), whose short, nearly orthogonal
+vectors keep the bins compact even for very oblique settings; translations found are given in
+the original setting.
+"""
+
+from __future__ import division
+import numpy as np
+import itertools
+
+# Original cell and all 26 neighbouring cell translations, in the order used to label repeated ligands
+TRANSLATIONS = np.array([[0,0,0],
+                         [1,0,0],[-1,0,0],
+                         [0,1,0],[0,-1,0],
+                         [0,0,1],[0,0,-1],
+                         [1,1,0],[1,-1,0],
+                         [-1,1,0],[-1,-1,0],
+                         [1,0,1],[1,0,-1],
+                         [-1,0,1],[-1,0,-1],
+                         [0,1,1],[0,1,-1],
+                         [0,-1,1],[0,-1,-1],
+                         [1,1,1],[1,1,-1],
+                         [-1,1,1],[-1,1,-1],
+                         [1,-1,1],[1,-1,-1],
+                         [-1,-1,1],[-1,-1,-1]])
+
+_RANK = np.zeros(27, dtype=np.int64)      # Position in TRANSLATIONS, by (n+1) read as base 3
+_RANK[np.dot(TRANSLATIONS + 1, [9, 3, 1])] = np.arange(27)
+
+def translationorder(trans):
+    """ Return sort keys of integer cell translations (N, 3): the order of TRANSLATIONS, then any larger ones. """
+    trans = np.asarray(trans, dtype=np.int64).reshape(-1, 3)
+    small = (abs(trans) <= 1).all(axis=1)
+    width = 2 * max(abs(trans).max() if len(trans) else 0, 1) + 1
+    shifted = trans + width // 2
+    keys = 27 + np.dot(shifted, [width**2, width, 1])
+    keys[small] = _RANK[np.dot(trans[small] + 1, [9, 3, 1])]
+    return keys
+
+def reducedbasis(orthom, maxiter=1000):
+    """ Return integer matrix P giving the vectors of the Delaunay-reduced cell (columns) in terms of a, b and c.
+    
+    The reduced cell has orthogonalisation matrix np.dot(orthom, P), and crystal coordinates
+    np.dot(inv(P), abc). Found by Selling reduction: of the vectors b1, b2, b3 and
+    b4 = -(b1 + b2 + b3), any pair with a positive scalar product is replaced until none remain,
+    and the three shortest of these and their pairwise sums forming a cell of the same
+    volume are taken (with the same handedness).
+    """
+    orthom = np.asarray(orthom, dtype=float)
+    coeffs = np.hstack([np.eye(3, dtype=np.int64), -np.ones((3, 1), dtype=np.int64)])    # b1..b4 in terms of a, b, c
+    tol = 1e-8 * (orthom**2).sum()
+    for n in range(maxiter):
+        vectors = np.dot(orthom, coeffs)
+        products = np.dot(vectors.T, vectors)
+        products[np.tril_indices(4)] = 0.
+        i, j = np.unravel_index(np.argmax(products), products.shape)
+        if products[i, j] <= tol:
+            break
+        for k in range(4):
+            if k != i and k != j:
+                coeffs[:,k] += coeffs[:,i]
+        coeffs[:,i] = -coeffs[:,i]
+    
+    candidates = np.hstack([coeffs, coeffs[:,[0]] + coeffs[:,[1]], coeffs[:,[0]] + coeffs[:,[2]], coeffs[:,[1]] + coeffs[:,[2]]])
+    lengths = np.sqrt((np.dot(orthom, candidates)**2).sum(axis=0))
+    for cols in sorted(itertools.combinations(range(7), 3), key=lambda c: sorted(lengths[list(c)])):
+        basis = candidates[:, list(cols)]
+        det = int(round(np.linalg.det(basis)))
+        if abs(det) == 1:
+            basis = basis[:, np.argsort(lengths[list(cols)], kind='mergesort')]
+            if round(np.linalg.det(basis)) < 0:
+                basis[:,2] = -basis[:,2]
+            return basis
+    return np.eye(3, dtype=np.int64)    # Not reached for a valid cell
+
+class CellList(object):
+    """ Sites sorted into bins of crystal coordinates, for finding all of their images within radius of any point. """
+    def __init__(self, abc, orthom, radius, basis=None):
+        """ Bin sites (N, 3) of crystal coordinates, for a search radius in the units of orthom (e.g. Angstroms).
+        
+        basis is the integer matrix of the reduced cell in which to set out bins (see reducedbasis),
+        found from orthom if not given. Any cell of the lattice gives the same results.
+        """
+        self.abc = np.asarray(abc, dtype=float).reshape(-1, 3)
+        self.orthom = np.asarray(orthom, dtype=float)
+        self.radius = float(radius)
+        self.basis = np.asarray(reducedbasis(self.orthom) if basis is None else basis, dtype=np.int64)
+        self.inverse = np.round(np.linalg.inv(self.basis)).astype(np.int64)     # Integer, as P has determinant 1
+        # Half-width of the box containing a sphere of radius, in crystal coordinates of the reduced cell
+        self.halfwidth = self.radius * np.sqrt((np.linalg.inv(np.dot(self.orthom, self.basis))**2).sum(axis=1))
+        self.nbins = np.clip(np.floor(1.0 / np.maximum(self.halfwidth, 1e-12)), 1, 2**16).astype(np.int64)
+        self.reach = np.maximum(np.ceil(self.halfwidth * self.nbins), 1).astype(np.int64)    # Bins to search either side
+
+        reduced = np.dot(self.abc, self.inverse.T)
+        self.shift = np.floor(reduced).astype(np.int64)       # Sites are binned by their position in the reduced cell
+        bins = np.floor((reduced - self.shift) * self.nbins).astype(np.int64)
+        bins = np.minimum(bins, self.nbins - 1)     # In case of rounding up to 1.0
+        keys = self._key(bins)
+        self.order = np.argsort(keys, kind='mergesort')
+        self.sortedkeys = keys[self.order]
+
+    def _key(self, bins):
+        """ Return index of bins (N, 3) in the flattened grid. """
+        return (bins[:,0] * self.nbins[1] + bins[:,1]) * self.nbins[2] + bins[:,2]
+
+    def query(self, centres, sites=None):
+        """ Find all images of sites within radius of each centre (M, 3) of crystal coordinates.
+
+        Returns arrays of the index of the centre, index of the site, integer cell translation
+        (K, 3) added to the site's coordinates to give the image, and distance for each image
+        found, ordered by centre, then site, then translation (see translationorder).
+        sites optionally gives a boolean mask of the sites to include.
+        """
+        centres = np.asarray(centres, dtype=float).reshape(-1, 3)
+        reduced = np.dot(centres, self.inverse.T)
+        censhift = np.floor(reduced).astype(np.int64)
+        cenbins = np.minimum(np.floor((reduced - censhift) * self.nbins).astype(np.int64), self.nbins - 1)
+        found = [[], [], []]
+        for offset in np.indices(2 * self.reach + 1).reshape(3, -1).T - self.reach:
+            unwrapped = cenbins + offset
+            keys = self._key(unwrapped % self.nbins)
+            lo = np.searchsorted(self.sortedkeys, keys, side='left')
+            counts = np.searchsorted(self.sortedkeys, keys, side='right') - lo
+            cen = np.repeat(np.arange(len(centres)), counts)
+            site = self.order[np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - lo, counts)]
+            found[0].append(cen)
+            found[1].append(site)
+            found[2].append(unwrapped[cen] // self.nbins)     # Cell of image, relative to the centre's cell
+        cen, site, cell = [ np.concatenate(f) for f in found ]
+        if sites is not None:
+            include = np.asarray(sites, dtype=bool)[site]
+            cen, site, cell = cen[include], site[include], cell[include]
+        trans = np.dot(cell + censhift[cen] - self.shift[site], self.basis.T)      # In the original cell
+
+        delxyz = np.dot(self.abc[site] + trans - centres[cen], self.orthom.T)
+        dist = np.sqrt((delxyz**2).sum(axis=1))
+        near = dist <= self.radius
+        cen, site, trans, dist = cen[near], site[near], trans[near], dist[near]
+        order = np.lexsort((translationorder(trans), site, cen))
+        return cen[order], site[order], trans[order], dist[order]
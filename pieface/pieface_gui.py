@@ -540,7 +540,7 @@ class MainWindow:
                 self.plotnb.add(tabs[poly], text=poly, sticky='nesw')
 
                 figs[poly] = PlotWindow(tabs[poly])
-                figs[poly].updateplot(getattr(crystob, poly+'_poly').ellipsoid, title=self.filebox.get(selection), pointcolor = getattr(crystob, poly+"_poly").pointcolours())
+                figs[poly].updateplot(crystob.polyhedra[poly].ellipsoid, title=self.filebox.get(selection), pointcolor = crystob.polyhedra[poly].pointcolours())
                 figs[poly].pack(expand=1, fill=tk.BOTH)
                 
             self.plotnb.pack(expand=1, fill=tk.BOTH)
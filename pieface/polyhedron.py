@@ -2,10 +2,141 @@
 
 from __future__ import division
 import numpy as np
+import itertools
+import smallmatrix
+import sharedarrays
+
+# Regular polyhedra used as references for distortion indices, by coordination number:
+# (volume / (centre-vertex distance)**3, number of edges, centre angle subtended by an edge in degrees)
+REGULAR = {4  : (8./(9.*np.sqrt(3.)), 6, np.degrees(np.arccos(-1./3.))),       # Tetrahedron
+           6  : (4./3., 12, 90.),                                              # Octahedron
+           8  : (8./(3.*np.sqrt(3.)), 12, np.degrees(np.arccos(1./3.))),       # Cube
+           12 : (5.*(3.+np.sqrt(5.))/12./np.sin(0.4*np.pi)**3, 30, np.degrees(np.arctan(2.))),    # Icosahedron
+           }
+
+def _hullvolume(points, tol=1e-6):
+    """ Return the volume of the convex hull of a small set of points (n, 3).
+    
+    Every plane through three points with all others on one side bounds the hull. Points
+    lying in the same bounding plane (within tol relative to the size of the points) form
+    one face, whose area is found from its vertices in angular order.
+    """
+    n = len(points)
+    if n < 4:
+        return 0.
+    triples = np.array(list(itertools.combinations(range(n), 3)))
+    a, b, c = points[triples[:,0]], points[triples[:,1]], points[triples[:,2]]
+    normals = np.cross(b - a, c - a)
+    lengths = np.sqrt((normals**2).sum(axis=1))
+    scale = np.abs(points - points.mean(axis=0)).max()
+    valid = lengths > tol * scale**2
+    normals = normals[valid] / lengths[valid,np.newaxis]
+    dist = np.dot(normals, points.T) - (normals * a[valid]).sum(axis=1)[:,np.newaxis]
+    inplane = np.abs(dist) <= tol * scale
+    bounding = ((dist <= tol * scale) | inplane).all(axis=1) | ((dist >= -tol * scale) | inplane).all(axis=1)
+    if inplane.all(axis=1).any():
+        return 0.       # Points are coplanar
+    origin = points.mean(axis=0)
+    volume = 0.
+    faces = set()
+    for t in np.flatnonzero(bounding):
+        face = tuple(np.flatnonzero(inplane[t]))
+        if face in faces:
+            continue
+        faces.add(face)
+        verts = points[list(face)]
+        centre = verts.mean(axis=0)
+        # Order vertices by angle about the face centre, in a basis within the face
+        u = verts[0] - centre
+        u = u / np.sqrt((u**2).sum())
+        v = np.cross(normals[t], u)
+        order = np.argsort(np.arctan2(np.dot(verts - centre, v), np.dot(verts - centre, u)))
+        ring = verts[order] - centre
+        area = 0.5 * abs(np.dot(np.cross(ring, np.roll(ring, -1, axis=0)).sum(axis=0), normals[t]))
+        volume += area * abs(np.dot(normals[t], centre - origin)) / 3.
+    return volume
+
+def bondgeometry(vectors):
+    """ Return bond lengths, angles and distortion indices for a stack of polyhedra.
+    
+    vectors are cartesian centre-ligand vectors, shape (n, 3) for a single polyhedron or
+    (..., n, 3) for polyhedra with the same coordination number n. Returns a dict of:
+        'bondlens'  : (..., n) bond lengths
+        'angles'    : (..., n, n) ligand-centre-ligand angles (degrees)
+        'polyvol'   : polyhedron (convex hull) volume
+        'quadelong' : quadratic elongation, <(l/l0)**2> (Robinson et al., 1971)
+        'anglevar'  : bond angle variance, sum((theta - theta0)**2)/(m - 1) over the m angles
+                      subtended by edges of the reference polyhedron (degrees squared)
+        'econ'      : effective coordination number (Hoppe, 1979)
+    where l0 and theta0 are the centre-vertex distance and edge angle of the regular polyhedron
+    (REGULAR) of equal volume. quadelong and anglevar are NaN for other coordination numbers.
+    """
+    vectors = np.asarray(vectors, dtype=float)
+    stack = vectors.shape[:-2]
+    n = vectors.shape[-2]
+    vectors = vectors.reshape((int(np.prod(stack)), n, 3))
+    bondlens = np.sqrt(np.einsum('bij,bij->bi', vectors, vectors))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosines = np.einsum('bik,bjk->bij', vectors, vectors) / (bondlens[:,:,np.newaxis] * bondlens[:,np.newaxis,:])
+        angles = np.degrees(np.arccos(np.clip(cosines, -1., 1.)))
+        angles[:, np.arange(n), np.arange(n)] = 0.
+        polyvol = np.array([ _hullvolume(v) for v in vectors ])
+        # Effective coordination number, with bonds weighted about a weighted mean length
+        shortest = bondlens.min(axis=1) if n > 0 else np.ones(len(vectors))
+        weights = np.exp(1. - (bondlens / shortest[:,np.newaxis])**6)
+        meanlen = (bondlens * weights).sum(axis=1) / weights.sum(axis=1)
+        econ = np.exp(1. - (bondlens / meanlen[:,np.newaxis])**6).sum(axis=1)
+    if n in REGULAR:
+        volfactor, edges, theta0 = REGULAR[n]
+        l0 = (polyvol / volfactor)**(1./3.)
+        quadelong = ((bondlens / l0[:,np.newaxis])**2).mean(axis=1)
+        iu = np.triu_indices(n, 1)
+        edgeangles = np.sort(angles[:, iu[0], iu[1]], axis=1)[:, :edges]
+        anglevar = ((edgeangles - theta0)**2).sum(axis=1) / (edges - 1)
+    else:
+        quadelong = anglevar = np.nan * np.ones(len(vectors))
+    return {'bondlens'  : bondlens.reshape(stack + (n,)),
+            'angles'    : angles.reshape(stack + (n, n)),
+            'polyvol'   : polyvol.reshape(stack),
+            'quadelong' : quadelong.reshape(stack),
+            'anglevar'  : anglevar.reshape(stack),
+            'econ'      : econ.reshape(stack),
+            }
+
+class LabelTable(object):
+    """ Table of distinct labels (atom names and types), so that polyhedra can store them as integer indices. 
+    
+    A Crystal shares one table between all of its polyhedra.
+    """
+    __slots__ = ('labels', '_index')
+    def __init__(self, labels=()):
+        self.labels = []
+        self._index = {}
+        for label in labels:
+            self.intern(label)
+    def intern(self, label):
+        """ Return index of label, adding it to the table if necessary. """
+        try:
+            return self._index[label]
+        except KeyError:
+            self._index[label] = len(self.labels)
+            self.labels.append(label)
+            return self._index[label]
+    def lookup(self, indices):
+        """ Return list of labels for indices. """
+        return [ self.labels[i] for i in indices ]
+    def __len__(self):
+        return len(self.labels)
+    def __getstate__(self):
+        return self.labels
+    def __setstate__(self, labels):
+        self.__init__(labels)
 
 class Polyhedron(object):
     """ Class to hold polyhedron object """
-    def __init__(self, centre, ligands, atomdict=None, ligtypes=None):
+    # A Crystal may hold many thousands of polyhedra, so no per-object __dict__ (see also Crystal.compact)
+    __slots__ = ('_cenabc', '_ligabc', '_allabc', '_cache', '_labels', '_cen', '_lig', '_centyp', '_ligtyp', 'cshm', 'ellipsoid')
+    def __init__(self, centre, ligands, atomdict=None, ligtypes=None, labels=None):
         """ Initialise polyhedron object from sites/coordinates
         
         Can receive data in number of forms:
@@ -15,7 +146,11 @@ class Polyhedron(object):
             - Names of centre/ligands as strings, and dict of atomic names/coords in atomdict
             
             NOTE: abc refers to crystal coordinates, while xyz refers to cartesian
+        
+        Labels and types are stored as indices into labels (a LabelTable, e.g. Crystal.labeltable),
+        or into a new table if labels is not given.
         """
+        self._labels = labels if labels is not None else LabelTable()
         
         # __init__ sets parameters:
             # self.ligabc
@@ -45,8 +180,7 @@ class Polyhedron(object):
                 raise TypeError("Unknown central atom definition")
                 
             if isinstance(ligands, dict):   # Read in ligands
-                self.liglbl = [i for i in ligands.keys()]
-                self.liglbl.sort()
+                self.liglbl = sorted(ligands.keys())
                 if len(ligands.keys()) == 0:
                     self.ligabc = np.array([[]]).T.astype(np.float) # Transpose so shape is (0,1) rather than (1,0)
                 else:
@@ -83,11 +217,6 @@ class Polyhedron(object):
             self.allabc = np.vstack([self.cenabc, self.ligabc])
         else:
             self.allabc = np.array([self.cenabc])
-            
-        if len(self.liglbl) != 0:
-            self.alllbl = [self.cenlbl] + self.liglbl
-        else:
-            self.alllbl = [self.cenlbl]
         
         if ligtypes is not None:
             if isinstance(ligtypes, dict):
@@ -109,28 +238,140 @@ class Polyhedron(object):
             self.centyp = None
             self.ligtyp = []
         
+        self.cshm = None        # Continuous shape measures, if calculated (see shapemeasures)
+        
+    @classmethod
+    def from_arrays(cls, cen_label, cen_abc, lig_labels, lig_abc, lig_types=None, cen_type=None, labels=None):
+        """ Return polyhedron from centre label and coordinates, ligand labels and (N, 3) array of coordinates.
+        
+        Unlike __init__, values are used in the order given, without conversion or sorting (e.g. as
+        returned by readcoords.ligandarrays), so this is faster when making many polyhedra.
+        lig_types is a list of ligand types, and labels a LabelTable as for __init__.
+        """
+        if len(lig_abc) != len(lig_labels):
+            raise ValueError("Number of ligand labels ({0}) and coordinates ({1}) differ".format(len(lig_labels), len(lig_abc)))
+        poly = cls.__new__(cls)
+        poly._labels = labels if labels is not None else LabelTable()
+        intern = poly._labels.intern
+        poly._cen = intern(cen_label)
+        poly._lig = np.array([ intern(l) for l in lig_labels ], dtype=np.int32)
+        poly._centyp = intern(cen_type)
+        poly._ligtyp = np.array([ intern(t) for t in lig_types ], dtype=np.int32) if lig_types is not None else np.zeros(0, dtype=np.int32)
+        allabc = np.empty((len(lig_labels)+1, 3))
+        allabc[0] = cen_abc
+        if len(lig_labels) > 0:
+            allabc[1:] = lig_abc
+            poly._ligabc = allabc[1:].copy()
+        else:
+            poly._ligabc = np.zeros((0, 1))     # Same shape as from __init__
+        poly._allabc, poly._cenabc = allabc, allabc[0].copy()      # Separate arrays, as from __init__
+        poly._cache = {}
+        poly.cshm = None
+        return poly
+        
+    def __getstate__(self):
+        state = sharedarrays.getslots(self)
+        state['_cache'] = {}        # Cached coordinates are not worth storing
+        return state
+    def __setstate__(self, state):
+        sharedarrays.setslots(self, state)
+        
+    # Labels and types are held as indices into a LabelTable
+    @property
+    def cenlbl(self):
+        """ Centre atom label. """
+        return self._labels.labels[self._cen]
+    @cenlbl.setter
+    def cenlbl(self, label):
+        self._cen = self._labels.intern(label)
+    @property
+    def liglbl(self):
+        """ List of ligand labels. """
+        return self._labels.lookup(self._lig)
+    @liglbl.setter
+    def liglbl(self, labels):
+        self._lig = np.array([ self._labels.intern(l) for l in labels ], dtype=np.int32)
+    @property
+    def alllbl(self):
+        """ List of centre and ligand labels. """
+        return [self.cenlbl] + self.liglbl
+    @property
+    def centyp(self):
+        """ Centre atom type (or None). """
+        return self._labels.labels[self._centyp]
+    @centyp.setter
+    def centyp(self, atomtype):
+        self._centyp = self._labels.intern(atomtype)
+    @property
+    def ligtyp(self):
+        """ List of ligand types. """
+        return self._labels.lookup(self._ligtyp)
+    @ligtyp.setter
+    def ligtyp(self, atomtypes):
+        self._ligtyp = np.array([ self._labels.intern(t) for t in atomtypes ], dtype=np.int32)
+        
+    # Coordinates are properties so that cached cartesian coordinates and bond lengths are
+    # discarded whenever new coordinates are assigned
+    @property
+    def cenabc(self):
+        """ Centre atom crystal coordinates. """
+        return self._cenabc
+    @cenabc.setter
+    def cenabc(self, coords):
+        self._cenabc = coords
+        self._cache = {}
+    @property
+    def ligabc(self):
+        """ Ligand crystal coordinates. """
+        return self._ligabc
+    @ligabc.setter
+    def ligabc(self, coords):
+        self._ligabc = coords
+        self._cache = {}
+    @property
+    def allabc(self):
+        """ Centre and ligand crystal coordinates. """
+        return self._allabc
+    @allabc.setter
+    def allabc(self, coords):
+        self._allabc = coords
+        self._cache = {}
+        
+    def _cached(self, name, matrix, func):
+        """ Return func(matrix), reusing the previous (read-only) result for the same matrix. 
+        
+        Results are discarded when coordinates are reassigned, but not if coordinate arrays
+        are modified in place.
+        """
+        key = np.asarray(matrix, dtype=float).tostring()
+        if name not in self._cache or self._cache[name][0] != key:
+            value = func(matrix)
+            value.flags.writeable = False
+            self._cache[name] = (key, value)
+        return self._cache[name][1]
+        
     def cenxyz(self, orthom):
         """ Return centre atom cartesian coordinates. """
-        return np.dot(orthom, self.cenabc )
+        return self._cached('cenxyz', orthom, lambda m: np.dot(m, self.cenabc ))
     def ligxyz(self, orthom):
         """ Return ligand cartesian coordinates. """
         if len(self.ligabc) != 0:
-            return np.dot(orthom, self.ligabc.T ).T
+            return self._cached('ligxyz', orthom, lambda m: np.dot(m, self.ligabc.T ).T)
         else:
             return np.array([[]])
     def allxyz(self, orthom):
         """ Return all atoms in cartesian coordinates. """
-        return np.dot(orthom, self.allabc.T ).T
+        return self._cached('allxyz', orthom, lambda m: np.dot(m, self.allabc.T ).T)
         
     def ligdelxyz(self, orthom):
         """ Return ligand cartesian coordinates relative to centre. """
         if len(self.ligabc) != 0:
-            return self.ligxyz(orthom) - self.cenxyz(orthom) 
+            return self._cached('ligdelxyz', orthom, lambda m: self.ligxyz(m) - self.cenxyz(m))
         else:
             return np.array([[]])
     def alldelxyz(self, orthom):
         """ Return all cartesian coordinates relative to centre. """
-        return self.allxyz(orthom) - self.cenxyz(orthom)
+        return self._cached('alldelxyz', orthom, lambda m: self.allxyz(m) - self.cenxyz(m))
     def ligdelabc(self):
         """ Return ligand coordinates relative to centre. """
         if len(self.ligabc) != 0:
@@ -145,7 +386,7 @@ class Polyhedron(object):
         """ Return bond lengths to all ligands """
         # Use metric tensor to calculate vector magnitude
         if len(self.ligabc) != 0:
-            return np.sqrt( np.diag( np.dot( np.dot(self.ligdelabc(), mtensor), self.ligdelabc().T )))
+            return self._cached('allbondlens', mtensor, lambda m: np.sqrt( smallmatrix.quadform(self.ligdelabc(), m) ))
         else:
             return np.array([[]])
         
@@ -161,8 +402,30 @@ class Polyhedron(object):
         """ Return standard deviation of bond lengths """
         return np.sqrt(self.bondlenvar(mtensor))
     
+    def bondgeometry(self, orthom):
+        """ Return bond lengths, angles and distortion indices (see polyhedron.bondgeometry). """
+        if len(self.ligabc) != 0:
+            return bondgeometry(self.ligdelxyz(orthom))
+        else:
+            return bondgeometry(np.zeros((0, 3)))
+    
+    def shapemeasures(self, orthom, names=None):
+        """ Return dict of continuous shape measures of ligands against reference shapes (see cshm.shapemeasures). """
+        import cshm
+        if len(self.ligabc) != 0:
+            return cshm.shapemeasures(self.ligdelxyz(orthom), names=names)
+        else:
+            return {}
+    
     def makeellipsoid(self, orthom, **kwargs):
-        """ Set up ellipsoid object and fit minimum bounding ellipsoid """
+        """ Set up ellipsoid object and fit minimum bounding ellipsoid 
+        
+        Accepts tolerance, maxcycles, method (fitting algorithm, see Ellipsoid.getminvol),
+        criterion (stopping rule, 'step' or 'gap'), hull (fit only to points on the convex
+        hull, omitting the centre atom and other interior points), symmetry (use faster fits
+        for symmetric polyhedra) and u0 (initial weights for centre followed by ligands, e.g.
+        from a previous fit).
+        """
         import ellipsoid
         
         if 'tolerance' in kwargs.keys():
@@ -170,33 +433,33 @@ class Polyhedron(object):
         else:
             setattr(self, "ellipsoid", ellipsoid.Ellipsoid(points = self.alldelxyz(orthom)))
         
-        if 'maxcycles' in kwargs.keys():
-            self.ellipsoid.findellipsoid(maxcycles=kwargs['maxcycles'])
-        else:
-            self.ellipsoid.findellipsoid()
+        # Pass on fitting options (maxcycles, method, criterion, hull, symmetry, u0) understood by Ellipsoid.findellipsoid
+        fitargs = dict([ (k, kwargs[k]) for k in ['maxcycles', 'method', 'criterion', 'hull', 'symmetry', 'u0'] if k in kwargs.keys() ])
+        self.ellipsoid.findellipsoid(**fitargs)
             
     def pointcolours(self):
         """ Return a list of colours for points based on ligand type. """
-        if len(self.ligtyp) == 0:
+        ligtyp, centyp = self.ligtyp, self.centyp
+        if len(ligtyp) == 0:
             return 'b'
         else:
             colourlist = ['r','g','c','m','y','k']
             c = 0
             colours = ['b']
             usedcols = {}
-            if self.centyp is not None:
-                usedcols[self.centyp] = colours[0]
+            if centyp is not None:
+                usedcols[centyp] = colours[0]
             for i, site in enumerate(self.liglbl):
-                if self.ligtyp[i] in usedcols.keys():
-                    colours.append(usedcols[self.ligtyp[i]])
-                elif self.centyp is not None and self.ligtyp[i] == self.centyp:
-                    colours.append(usedcols[self.centyp])
+                if ligtyp[i] in usedcols.keys():
+                    colours.append(usedcols[ligtyp[i]])
+                elif centyp is not None and ligtyp[i] == centyp:
+                    colours.append(usedcols[centyp])
                 else:
                     try:
-                        usedcols[self.ligtyp[i]] = colourlist[c]
+                        usedcols[ligtyp[i]] = colourlist[c]
                     except IndexError:      # Deal with too many ligand types
-                        usedcols[self.ligtyp[i]] = 0 + 0.1*(c-len(colourlist)+1)
-                    colours.append(usedcols[self.ligtyp[i]])
+                        usedcols[ligtyp[i]] = 0 + 0.1*(c-len(colourlist)+1)
+                    colours.append(usedcols[ligtyp[i]])
                     c += 1
                     
             return colours
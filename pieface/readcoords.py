@@ -5,23 +5,144 @@ import numpy as np
 import os
 #import warnings
 import logging
+import collections
+import re
+import neighbours
+from fractions import Fraction
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+class AtomView(collections.MutableMapping):
+    """ Dict-like view of the crystal coordinates of atoms in a Crystal (held in Crystal.atomabc), by label. """
+    def __init__(self, crystal):
+        self.crystal = crystal
+    def __getitem__(self, site):
+        return self.crystal.atomabc[self.crystal.atomindex[site]]
+    def __setitem__(self, site, coords):
+        self.crystal.atoms = {site : coords}
+    def __delitem__(self, site):
+        self.crystal.removeatoms([site])
+    def __contains__(self, site):
+        return site in self.crystal.atomindex
+    def __iter__(self):
+        return iter(self.crystal.atomlbl)
+    def __len__(self):
+        return len(self.crystal.atomlbl)
+    def copy(self):
+        return dict(self.items())
+        
+class TypeView(collections.MutableMapping):
+    """ Dict-like view of the types of atoms in a Crystal (held in Crystal.atomtypidx), by label. 
+    
+    Atoms without a type are not included.
+    """
+    def __init__(self, crystal):
+        self.crystal = crystal
+    def __getitem__(self, site):
+        atomtype = self.crystal.labeltable.labels[self.crystal.atomtypidx[self.crystal.atomindex[site]]]
+        if atomtype is None:
+            raise KeyError(site)
+        return atomtype
+    def __setitem__(self, site, atomtype):
+        self.crystal.atomtypidx[self.crystal.atomindex[site]] = self.crystal.labeltable.intern(str(atomtype))
+    def __delitem__(self, site):
+        self[site]      # Raise KeyError if no type
+        self.crystal.atomtypidx[self.crystal.atomindex[site]] = self.crystal.labeltable.intern(None)
+    def __iter__(self):
+        untyped = self.crystal.labeltable.intern(None)
+        return ( site for site, t in zip(self.crystal.atomlbl, self.crystal.atomtypidx) if t != untyped )
+    def __len__(self):
+        return int((self.crystal.atomtypidx != self.crystal.labeltable.intern(None)).sum())
+    def copy(self):
+        return dict(self.items())
+
+class PolyhedronRegistry(collections.Mapping):
+    """ Ordered registry of the polyhedra of a Crystal, by centre label.
+    
+    Iterating gives centre labels in the order polyhedra were added, and registry[label] the
+    Polyhedron. values() gives all polyhedra in the same order.
+    """
+    def __init__(self, polys=()):
+        self._labels = []
+        self._polys = []
+        self._index = {}
+        for poly in polys:
+            self.add(poly)
+    def add(self, poly):
+        """ Add Polyhedron, replacing any existing polyhedron with the same centre label. """
+        label = poly.cenlbl
+        if label in self._index:
+            logger.debug("Replacing polyhedron %s", label)
+            self._polys[self._index[label]] = poly
+        else:
+            self._index[label] = len(self._labels)
+            self._labels.append(label)
+            self._polys.append(poly)
+    def remove(self, label):
+        """ Remove polyhedron with centre label. """
+        i = self._index.pop(label)
+        del self._labels[i]
+        del self._polys[i]
+        for j, l in enumerate(self._labels[i:]):
+            self._index[l] = i + j
+    def __getitem__(self, label):
+        return self._polys[self._index[label]]
+    def __contains__(self, label):
+        return label in self._index
+    def __iter__(self):
+        return iter(self._labels)
+    def __len__(self):
+        return len(self._labels)
+    def keys(self):
+        return list(self._labels)
+    def values(self):
+        return list(self._polys)
+    def items(self):
+        return zip(self._labels, self._polys)
+    def __repr__(self):
+        return "PolyhedronRegistry({0})".format(self._labels)
+    def __getstate__(self):
+        return self._polys
+    def __setstate__(self, polys):
+        self.__init__(polys)
+
 class Crystal(object):
-    """ Class to hold crystal data and resulting ellipsoids. """
+    """ Class to hold crystal data and resulting ellipsoids. 
+    
+    Atoms are held as a list of labels (atomlbl), an (N, 3) array of crystal coordinates (atomabc),
+    an array of type indices into labeltable (atomtypidx) and a dict of label to index (atomindex).
+    atoms and atomtypes give dict-like views of these.
+    
+    Polyhedra are held in polyhedra (a PolyhedronRegistry) by centre label, and can also be
+    accessed as attributes '<label>_poly'.
+    """
     def __init__(self, cell=None, atoms=None, atomtypes=None):
         """ Initialise class with cell parameters and atoms. """
         self._cell = {}
-        self._atoms = {}
-        self._atomtypes = {}
+        self._matrices = None     # Cached cell matrices (see _cellmatrices)
+        import polyhedron
+        self.labeltable = polyhedron.LabelTable()     # Labels and types of all polyhedra and atoms, stored by them as indices
         self.cell = cell
+        self.atoms = None       # Empty atom arrays
         self.atoms = atoms
-        self.polyhedra = []
+        self.polyhedra = PolyhedronRegistry()
         self.atomtypes = atomtypes
+        self.store = None       # Shared arrays holding polyhedron and ellipsoid values (see compact)
 
         #self.poly = {}
+        
+    def __getattr__(self, name):
+        """ Give polyhedra as attributes '<label>_poly' """
+        polyhedra = self.__dict__.get('polyhedra')      # Not set while unpickling
+        if name.endswith('_poly') and polyhedra is not None and name[:-len('_poly')] in polyhedra:
+            return polyhedra[name[:-len('_poly')]]
+        raise AttributeError("'Crystal' object has no attribute '{0}'".format(name))
+        
+    def __setstate__(self, state):
+        if isinstance(state.get('polyhedra'), list):        # Pickled by older versions, with polyhedra as attributes
+            state['polyhedra'] = PolyhedronRegistry([ state.pop(str(cen)+'_poly') for cen in state['polyhedra'] ])
+        self.__dict__.update(state)
     @property
     def cell(self):
         return self._cell
@@ -71,53 +192,73 @@ class Crystal(object):
             self._cell['alp'] = float(params[3])
             self._cell['bet'] = float(params[4])
             self._cell['gam'] = float(params[5])
+        self._matrices = None
     
     @property
     def atoms(self):
-        return self._atoms
+        """ Dict-like view of atomic crystal coordinates (see AtomView). """
+        return AtomView(self)
     @atoms.setter
     def atoms(self, atoms):
-        """ Read atoms from dict """
+        """ Read atoms from dict (adding to, or replacing coordinates of, existing atoms) """
         if atoms is None:   # we are initialising
-            self._atoms = {}
+            self.atomlbl = []
+            self.atomindex = {}
+            self.atomabc = np.zeros((0, 3))
+            self.atomtypidx = np.zeros(0, dtype=np.int32)
             return
-        for site in atoms:
+        sites = list(atoms.keys())
+        coords = np.zeros((len(sites), 3))
+        for i, site in enumerate(sites):
             if isinstance(atoms[site], np.ndarray) or isinstance(atoms[site], list):
-                self._atoms[site] = np.array(atoms[site]).astype(np.float)
-            elif isinstance(atoms[site], string):
-                self._atoms[site] = np.array(atoms[site].split()).astype(np.float)
+                coords[i] = np.array(atoms[site]).astype(np.float)
+            elif isinstance(atoms[site], basestring):
+                coords[i] = np.array(atoms[site].split()).astype(np.float)
             else:
                 raise ValueError("Unknown data position type for atom {0}:\t{1}".format(site, type(atoms[site])))
+        new = [ site for site in sites if site not in self.atomindex ]
+        if len(new) > 0:
+            for site in new:
+                self.atomindex[site] = len(self.atomlbl)
+                self.atomlbl.append(site)
+            self.atomabc = np.vstack([self.atomabc, np.zeros((len(new), 3))])
+            self.atomtypidx = np.concatenate([self.atomtypidx, self.labeltable.intern(None) * np.ones(len(new), dtype=np.int32)])
+        self.atomabc[[ self.atomindex[site] for site in sites ]] = coords
+        
+    def removeatoms(self, sites):
+        """ Remove atoms with labels in sites. """
+        keep = np.ones(len(self.atomlbl), dtype=bool)
+        keep[[ self.atomindex[site] for site in sites ]] = False
+        self.atomlbl = [ site for site, k in zip(self.atomlbl, keep) if k ]
+        self.atomindex = dict([ (site, i) for i, site in enumerate(self.atomlbl) ])
+        self.atomabc = self.atomabc[keep]
+        self.atomtypidx = self.atomtypidx[keep]
+        
     @property
     def atomtypes(self):
-        return self._atomtypes
+        """ Dict-like view of atom types (see TypeView). """
+        return TypeView(self)
     @atomtypes.setter
     def atomtypes(self, atomtypes):
-        """ Set atom types from dict """
+        """ Set atom types from dict, by atom label or original label of atoms generated by symmetry (without '_##') """
         if atomtypes is None:   # Initialising
-            self._atomtypes = {}
+            self.atomtypidx[:] = self.labeltable.intern(None)
             return
-        if len(atomtypes) == len(self.atoms):
-            for site in atomtypes:
-                self._atomtypes[site] = str(atomtypes[site])
-        else:
-            for site in self.atoms:
-                try:
-                    self._atomtypes[site] = str(atomtypes[ site.rsplit('_',1)[0]])
-                except IndexError:
-                    self._atomtypes[site] = str(atomtypes[ site ])      # Assume name has a '_' in it, and splitting broke the index
+        for i, site in enumerate(self.atomlbl):
+            key = _typekey(site, atomtypes)
+            if key is not None:
+                self.atomtypidx[i] = self.labeltable.intern(str(atomtypes[key]))
                 
             
-    def orthomatrix(self):
-        """ Return orthogonalisation matrix from cell parameters."""
-        # Orthogonalisation matrix (frac -> cart) with x along crystallographic a
-        # [[a, b cos(gamma), c cos(beta)],
-        # [ 0, b sin(gamma), (-c sin(beta) cos(alpha*)],
-        # [ 0, 0, c sin(beta) sin(alpha*) ]]
-        #
-        # Usage: xyz = np.dot(M, abc)
+    def _cellmatrices(self):
+        """ Return dict of orthogonalisation, reciprocal and metric matrices, computed once for each cell. """
+        # Cached matrices are cleared by the cell setter, and recalculated if the cell dict has been changed directly
         if self.cell is None:
             raise ValueError("Unit cell has not been defined")
+        key = tuple([ self.cell.get(k) for k in ['a', 'b', 'c', 'alp', 'bet', 'gam'] ])
+        cached = getattr(self, '_matrices', None)      # Not set (or incomplete) on objects pickled by older versions
+        if cached is not None and cached['cell'] == key and 'reduction' in cached:
+            return cached
         a = self.cell['a']
         b = self.cell['b']
         c = self.cell['c']
@@ -136,29 +277,112 @@ class Crystal(object):
         cgamstar = (calp*cbet - cgam) / (salp*sbet)
         salpstar = np.sqrt(1.0 - calpstar**2)
         
-        M = np.array(\
+        matrices = {'cell' : key}
+        matrices['orthom'] = np.array(\
             [[a, b*cgam, c*cbet ], \
             [ 0, b*sgam, -c*sbet*calpstar ], \
             [ 0, 0, c*sbet*salpstar ]]).astype(np.float64)
-        return M
+        matrices['recipm'] = np.linalg.inv(matrices['orthom'])
+        matrices['mtensor'] = np.array([[ a*a      , a*b*cgam  , a*c*cbet], \
+                                        [ a*b*cgam , b*b       , b*c*calp], \
+                                        [ a*c*cbet , b*c*calp  , c*c     ]]).astype(np.float64)
+        matrices['reduction'] = neighbours.reducedbasis(matrices['orthom'])
+        for k in ['orthom', 'recipm', 'mtensor', 'reduction']:
+            matrices[k].setflags(write=False)       # Shared by all callers
+        self._matrices = matrices
+        return matrices
+        
+    def orthomatrix(self):
+        """ Return orthogonalisation matrix from cell parameters (read-only, calculated once per cell)."""
+        # Orthogonalisation matrix (frac -> cart) with x along crystallographic a
+        # [[a, b cos(gamma), c cos(beta)],
+        # [ 0, b sin(gamma), (-c sin(beta) cos(alpha*)],
+        # [ 0, 0, c sin(beta) sin(alpha*) ]]
+        #
+        # Usage: xyz = np.dot(M, abc)
+        return self._cellmatrices()['orthom']
+        
+    def recipmatrix(self):
+        """ Return inverse of orthogonalisation matrix (cart -> frac, read-only, calculated once per cell)."""
+        # Usage: abc = np.dot(M, xyz)
+        return self._cellmatrices()['recipm']
         
     def mtensor(self):
-        """ Return metric tensor from cell parameters """
+        """ Return metric tensor from cell parameters (read-only, calculated once per cell)."""
         # [[ a*a            , a*b*cos(gamma), a*c*cos(beta) ],
         #  [ a*b*cos(gamma) , b*b           , b*c*cos(alpha)],
         #  [ a*c*cos(beta)  , b*c*cos(alpha), c*c           ]]
-        if self.cell is None:
-            raise ValueError("Unit cell has not been defined")
-        a = self.cell['a']
-        b = self.cell['b']
-        c = self.cell['c']
-        calp = np.cos(np.radians(self.cell['alp']))
-        cbet = np.cos(np.radians(self.cell['bet']))
-        cgam = np.cos(np.radians(self.cell['gam']))
-        return np.array([[ a*a      , a*b*cgam  , a*c*cbet], \
-                         [ a*b*cgam , b*b       , b*c*calp], \
-                         [ a*c*cbet , b*c*calp  , c*c     ]]).astype(np.float64)
+        return self._cellmatrices()['mtensor']
+        
+    def reducedbasis(self):
+        """ Return integer matrix giving the Delaunay-reduced cell vectors (columns) in terms of a, b and c (read-only, calculated once per cell).
+        
+        Used to set out neighbour searches in a compact cell (see neighbours.reducedbasis).
+        """
+        return self._cellmatrices()['reduction']
         
+    def abctoxyz(self, abc):
+        """ Return cartesian coordinates of crystal coordinates abc (a single position or (N, 3) array). """
+        return np.dot(np.asarray(abc, dtype=float), self.orthomatrix().T)
+        
+    def xyztoabc(self, xyz):
+        """ Return crystal coordinates of cartesian coordinates xyz (a single position or (N, 3) array). """
+        return np.dot(np.asarray(xyz, dtype=float), self.recipmatrix().T)
+        
+    def bondgeometry(self):
+        """ Return dict of bond geometry and distortion indices for all polyhedra (see polyhedron.bondgeometry).
+        
+        Polyhedra with the same coordination number are computed together as one stack.
+        """
+        import polyhedron
+        orthom = self.orthomatrix()
+        bycn = {}
+        for cen, poly in self.polyhedra.items():
+            bycn.setdefault(len(poly.liglbl), []).append(cen)
+        geometry = {}
+        for cn, cens in bycn.items():
+            vectors = [ self.polyhedra[cen].ligdelxyz(orthom) if cn > 0 else np.zeros((0, 3)) for cen in cens ]
+            stacked = polyhedron.bondgeometry(np.array(vectors).reshape(len(cens), cn, 3))
+            for i, cen in enumerate(cens):
+                geometry[cen] = dict([ (k, v[i]) for k, v in stacked.items() ])
+        return geometry
+        
+    def compact(self):
+        """ Move coordinates of all polyhedra, and values of their fitted ellipsoids, into shared contiguous arrays.
+        
+        Each Polyhedron and Ellipsoid then holds views into the arrays of self.store (a dict of
+        'abc', 'points' and 'weights', stacked over all atoms of all polyhedra, and 'radii',
+        'centre' and 'rotation', stacked over all fitted ellipsoids) rather than arrays of its own.
+        Values are unchanged; assigning a new array to an object replaces its view. When pickled,
+        each shared array is stored once (see sharedarrays).
+        """
+        import sharedarrays
+        polys = self.polyhedra.values()
+        offsets = np.cumsum([0] + [ len(p.allabc) for p in polys ])
+        self.store = {'abc' : sharedarrays.share(np.concatenate([ p.allabc for p in polys ]) if polys else np.zeros((0, 3)))}
+        for p, start, end in zip(polys, offsets[:-1], offsets[1:]):
+            p.allabc = self.store['abc'][start:end]
+            p.cenabc = self.store['abc'][start]
+            if end - start > 1:
+                p.ligabc = self.store['abc'][start+1:end]
+        
+        fitted = [ (i, p.ellipsoid) for i, p in enumerate(polys) if getattr(p, 'ellipsoid', None) is not None and p.ellipsoid.radii is not None ]
+        if len(fitted) == 0:
+            return
+        for key in ['radii', 'centre', 'rotation']:
+            self.store[key] = sharedarrays.share(np.array([ getattr(e, key) for i, e in fitted ], dtype=float))
+        self.store['points'] = sharedarrays.share(np.zeros((offsets[-1], 3)))
+        self.store['weights'] = sharedarrays.share(np.zeros(offsets[-1]))
+        for j, (i, e) in enumerate(fitted):
+            for key in ['radii', 'centre', 'rotation']:
+                setattr(e, key, self.store[key][j])
+            if np.shape(e.points) == (offsets[i+1] - offsets[i], 3):       # Fitted to the polyhedron (alldelxyz)
+                self.store['points'][offsets[i]:offsets[i+1]] = e.points
+                e.points = self.store['points'][offsets[i]:offsets[i+1]]
+            if e.weights is not None:
+                self.store['weights'][offsets[i]:offsets[i+1]] = e.weights
+                e.weights = self.store['weights'][offsets[i]:offsets[i+1]]
+    
     def makepolyhedron(self, centre, ligands, atomdict=None, ligtypes=None):
         """ Make polyhedron from centre and ligands. """
         import polyhedron
@@ -166,27 +390,33 @@ class Crystal(object):
         # and a dict of positions (ie. self.atoms) or with individual dicts for centre and ligands.
         # This means that the polyhedron can be defined with ligand positions in a different 
         # position to that in self.atoms, for instance moved into an adjacent unit cell
-        try:
-            assert len(ligands) > 0
-        except AssertionError:
-            if isinstance(centre, dict):
-                logger.warning("No ligands have been defined for %s", centre.keys()[0])
-            elif isinstance(centre, tuple) or isinstance(centre, list):
-                logger.warning("No ligands have been defined for %s", centre[0])
-            else:
-                logger.warning("No ligands have been defined for %s", centre)
+        self.addpolyhedron(polyhedron.Polyhedron(centre, ligands, atomdict=atomdict, ligtypes=ligtypes, labels=self.labeltable))
+        
+    def addpolyhedron(self, poly):
+        """ Add Polyhedron object, labelled by its centre (its labels should be held in self.labeltable). 
         
-        if isinstance(centre, dict):
-            cenname = centre.keys()[0]
-        elif isinstance(centre, tuple) or isinstance(centre, list):
-            cenname = centre[0]
-        elif isinstance(centre,str):
-            cenname = centre
-        setattr(self, str(cenname)+'_poly', polyhedron.Polyhedron(centre, ligands, atomdict=atomdict, ligtypes=ligtypes))
-        self.polyhedra.append(cenname)
+        Replaces any existing polyhedron with the same centre.
+        """
+        if len(poly.liglbl) == 0:
+            logger.warning("No ligands have been defined for %s", poly.cenlbl)
+        self.polyhedra.add(poly)
         
-def readcif(FILE, phaseblock=None, getocc=False):
-    """ Read useful data from cif using PyCifRW. """
+def _readesd(value):
+    """ Return value and standard uncertainty from a CIF number such as '0.1234(5)' (esd is zero if not given). """
+    if '(' not in value:
+        return float(value), 0.
+    number, esd = value.split('(', 1)
+    mantissa = number.lower().split('e')[0]
+    exponent = int(number.lower().split('e')[1]) if 'e' in number.lower() else 0
+    decimals = len(mantissa.split('.')[1]) if '.' in mantissa else 0
+    return float(number), float(esd.rstrip(')')) * 10.**(exponent - decimals)
+
+def readcif(FILE, phaseblock=None, getocc=False, getesd=False):
+    """ Read useful data from cif using PyCifRW. 
+    
+    If getesd is True, dicts of standard uncertainties of cell parameters and atomic
+    coordinates (zero where none are given) are also returned, after occupancies if requested.
+    """
     import CifFile     # Should be PyCifRW module, but also occurs in GSASII - I haven't yet found a conflict...
     import urllib
     
@@ -231,20 +461,24 @@ def readcif(FILE, phaseblock=None, getocc=False):
     
     # Read cell
     cell = {}
+    cellesd = {}
     
-    cell['a'] = float(allcif[phase]['_cell_length_a'].split('(')[0])
-    cell['b'] = float(allcif[phase]['_cell_length_b'].split('(')[0])
-    cell['c'] = float(allcif[phase]['_cell_length_c'].split('(')[0])
-    cell['alp'] = float(allcif[phase]['_cell_angle_alpha'].split('(')[0])
-    cell['bet'] = float(allcif[phase]['_cell_angle_beta'].split('(')[0])
-    cell['gam'] = float(allcif[phase]['_cell_angle_gamma'].split('(')[0])
+    cell['a'], cellesd['a'] = _readesd(allcif[phase]['_cell_length_a'])
+    cell['b'], cellesd['b'] = _readesd(allcif[phase]['_cell_length_b'])
+    cell['c'], cellesd['c'] = _readesd(allcif[phase]['_cell_length_c'])
+    cell['alp'], cellesd['alp'] = _readesd(allcif[phase]['_cell_angle_alpha'])
+    cell['bet'], cellesd['bet'] = _readesd(allcif[phase]['_cell_angle_beta'])
+    cell['gam'], cellesd['gam'] = _readesd(allcif[phase]['_cell_angle_gamma'])
     
     #Read in atom labels/coordinates
     atomcoords = {}
+    atomesds = {}
     atomtypes = {}
     atomoccs = {}
     for i,site in enumerate(allcif[phase]['_atom_site_label']):  # Iterate over all atom labels
-        atomcoords[site] = np.array([ allcif[phase]['_atom_site_fract_x'][i].split('(')[0], allcif[phase]['_atom_site_fract_y'][i].split('(')[0], allcif[phase]['_atom_site_fract_z'][i].split('(')[0] ]).astype(np.float)
+        xyz = [ _readesd(allcif[phase][k][i]) for k in ['_atom_site_fract_x', '_atom_site_fract_y', '_atom_site_fract_z'] ]
+        atomcoords[site] = np.array([ p[0] for p in xyz ]).astype(np.float)
+        atomesds[site] = np.array([ p[1] for p in xyz ]).astype(np.float)
         atomtypes[site] = allcif[phase]['_atom_site_type_symbol'][i]
         atomoccs[site] = float(allcif[phase]['_atom_site_occupancy'][i].split('(')[0])
     
@@ -279,81 +513,335 @@ def readcif(FILE, phaseblock=None, getocc=False):
         symmops.insert(0, symmops.pop(idx) )
         symmid.insert(0, symmid.pop(idx) )
     
+    returnvals = (cell, atomcoords, atomtypes, spacegp, symmops, symmid)
     if getocc:
-        return cell, atomcoords, atomtypes, spacegp, symmops, symmid, atomoccs
-    else:
-        return cell, atomcoords, atomtypes, spacegp, symmops, symmid
+        returnvals = returnvals + (atomoccs,)
+    if getesd:
+        returnvals = returnvals + (cellesd, atomesds)
+    return returnvals
+    
+def _wrapcell(abc):
+    """ Return crystal coordinates shifted back into unit cell (0.0 <= r < 1.0)"""
+    abc = np.mod(abc, 1.0)
+    abc[abc >= 1.0] -= 1.0      # Small negative values round up to 1.0
+    return abc
+    
+def _uniqueimages(images, tol):
+    """ Return mask of images that are not within tol of an earlier kept image of the same site.
+    
+    images is a (sites, operations, 3) array of crystal coordinates in the unit cell, and positions
+    are compared in each coordinate, allowing for cell translations. Images are hashed into a
+    periodic grid of cells about 8*tol wide, so each is only compared with those in its own cell,
+    or in a neighbouring cell if it lies within tol of their shared face.
+    """
+    nsite, nop = images.shape[:2]
+    keep = np.ones((nsite, nop), dtype=bool)
+    if nop < 2 or nsite == 0:
+        return keep
+    ncell = int(np.floor(1.0 / (8*tol)))
+    if ncell < 3:
+        ncell = 1       # Every cell neighbours every other: use a single cell
+    flat = images.reshape(-1, 3)
+    op = np.tile(np.arange(nop), nsite)
+    scaled = flat * ncell
+    cells = np.floor(scaled).astype(np.int64)
+    inner = scaled - cells      # Position within cell, from 0 to 1
+    cells %= ncell
+    nearface = {-1 : inner <= tol*ncell, 0 : np.ones(flat.shape, dtype=bool), 1 : inner >= 1.0 - tol*ncell}
+    sitekey = np.repeat(np.arange(nsite, dtype=np.int64), nop) * ncell**3
+    def _key(c):
+        return sitekey + (c[:,0] * ncell + c[:,1]) * ncell + c[:,2]
+    keys = _key(cells)
+    order = np.argsort(keys, kind='mergesort')
+    sortedkeys = keys[order]
+    
+    # Pairs (later, earlier) of images of the same site in the same or neighbouring cells
+    later, earlier = [], []
+    for offset in _CELLTRANS if ncell > 1 else _CELLTRANS[:1]:
+        if ncell > 1 and offset.any():
+            a = np.nonzero(nearface[offset[0]][:,0] & nearface[offset[1]][:,1] & nearface[offset[2]][:,2])[0]
+            query = _key((cells + offset) % ncell)[a]
+        else:
+            a = np.arange(len(flat))
+            query = keys
+        lo = np.searchsorted(sortedkeys, query, side='left')
+        counts = np.searchsorted(sortedkeys, query, side='right') - lo
+        a = np.repeat(a, counts)
+        b = order[np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - lo, counts)]
+        near = op[b] < op[a]
+        a, b = a[near], b[near]
+        diff = abs(flat[a] - flat[b])
+        near = (np.minimum(diff, 1.0 - diff) <= tol).all(axis=1)
+        later.append(a[near])
+        earlier.append(b[near])
+    later, earlier = np.concatenate(later), np.concatenate(earlier)
+    
+    # Drop images near a kept image, taking operations in turn (as earlier images are then final)
+    sort = np.argsort(op[later], kind='mergesort')
+    later, earlier = later[sort], earlier[sort]
+    bounds = np.searchsorted(op[later], np.arange(nop+1))
+    flatkeep = keep.reshape(-1)
+    for i in range(1, nop):
+        a, b = later[bounds[i]:bounds[i+1]], earlier[bounds[i]:bounds[i+1]]
+        flatkeep[a[flatkeep[b]]] = False
+    return keep
     
-def makeP1cell(atomcoords, symmops, symmid):
+def makeP1cell(atomcoords, symmops, symmid, tol=1e-3):
     """ Generate full unit cell contents from symmetry operations from Cif file
 
     Returned atom labels (as dict keys) are appended with '_##' to denote the number
     of the symmetry operation that generated them from cif file (initial position
-    label is not changed).
+    label is not changed). Images within tol (in each fractional coordinate) of an
+    earlier image of the same site are special positions, and are not repeated; the
+    default allows for rounding of eg 0.3333 in the CIF file.
     """
+    if tol <= 0:
+        raise ValueError("Tolerance must be positive")
     
-    def _shiftcoord((x,y,z)):
-        """ Shift atom coordinates back into unit cell (0.0 <= r < 1.0)"""
-        if x >= 1.0: x -= 1.0
-        if x < 0.0: x += 1.0
-        if y >= 1.0: y -= 1.0
-        if y < 0.0: y += 1.0
-        if z >= 1.0: z -= 1.0
-        if z < 0.0: z += 1.0
-        return x,y,z
-        
-    def _isspecial(site, xyz , newcoords):
-        """ Check if site position already exists in newcoords (special position) """
-        difftol = 1e-3  # Tolerance for difference in position (due to error reading eg 0.3333 from CIF file)
-        
-        for c in newcoords:
-            if '_'.join(c.split('_')[:-1]) == site or c == site:     # Check if site name already exists in newcoords (allows for '_' in site name)
-                if np.logical_or((abs(xyz - newcoords[c]) <= difftol), (abs(abs(xyz - newcoords[c])-1.0) <= difftol) ).all():
-                    # Test if either sites are at same position (within tol) or at position (x,y,z)+1 (or -1)
-                    return True
-        return False
-        
+    rotations, translations = symmetryoperations(symmops)
+    sites = list(atomcoords.keys())
+    if len(sites) == 0 or len(symmops) == 0:
+        return {}
+    abc = _wrapcell(np.array([ atomcoords[site] for site in sites ], dtype=float))
+    images = _wrapcell(np.einsum('oij,aj->aoi', rotations, abc) + translations)     # All images of all sites at once
+    
+    keep = _uniqueimages(images, tol)      # Special positions: drop repeated images of a site
     
+    suffixes = _opsuffixes(symmid, len(symmops))
     newcoords = {}
-    for site in atomcoords:     # Iterate over all atoms
-        x,y,z = _shiftcoord(atomcoords[site])
-        #print x,y,z
-        for i, symm in enumerate(symmops):  # Iterate over symmops, counting them
-            newx,newy,newz = _shiftcoord(eval(symm))     # Will fail with old-style division
-            if _isspecial(site, np.array([newx, newy, newz]).astype(np.float), newcoords) and i != 0:   # Special position - don't add to list
-                continue
-            elif i == 0:    # First site, don't append '_1'
-                newcoords[site] = np.array([newx, newy, newz]).astype(np.float)
-            else:
-                newcoords[site+"_{0:0{width}}".format(int(symmid[i]), width=len(str(len(symmops))))] = np.array([newx, newy, newz]).astype(np.float)
+    for n, i in zip(*np.nonzero(keep)):
+        newcoords[sites[n]+suffixes[i]] = images[n,i]
     return newcoords
     
+def _opsuffixes(symmid, nop):
+    """ Return suffixes '_##' added to labels of images from each symmetry operation (none for the first). """
+    width = len(str(nop))
+    return [''] + [ "_{0:0{width}}".format(int(symmid[i]), width=width) for i in range(1, nop) ]
+    
+def makeP1local(atomcoords, symmops, symmid, centres, orthom, radius, tol=1e-3):
+    """ Generate centres and the atoms within radius of them, as they would be returned by makeP1cell.
+    
+    centres are labels of atoms in the full unit cell ('_##' appended as makeP1cell); those not
+    generated by the symmetry operations are left out. Images of each site are first checked
+    against a box in crystal coordinates about each centre, and only sites with an image in a
+    box are expanded in full, so the work and memory needed follow the number of centres and
+    their neighbours rather than the contents of the cell. ligandarrays gives the same ligands
+    from the returned atoms as from the whole cell.
+    """
+    if tol <= 0:
+        raise ValueError("Tolerance must be positive")
+    
+    rotations, translations = symmetryoperations(symmops)
+    sites = list(atomcoords.keys())
+    if len(sites) == 0 or len(symmops) == 0:
+        return {}
+    abc = _wrapcell(np.array([ atomcoords[site] for site in sites ], dtype=float))
+    suffixes = _opsuffixes(symmid, len(symmops))
+    
+    def _expand(rows):
+        """ Return images of sites in rows under all operations, and mask of those kept by makeP1cell. """
+        images = _wrapcell(np.einsum('oij,aj->aoi', rotations, abc[rows]) + translations)
+        return images, _uniqueimages(images, tol)
+    
+    # Find site and operation generating each centre
+    index = dict([ (site, n) for n, site in enumerate(sites) ])
+    opindex = dict([ (suffix, i) for i, suffix in enumerate(suffixes) ])
+    cenrow, cenop = [], []
+    for cen in centres:
+        parent, suffix = cen, ''
+        if cen not in index and '_' in cen:
+            parent, suffix = cen.rsplit('_', 1)
+            suffix = '_' + suffix
+        if parent in index and suffix in opindex:
+            cenrow.append(index[parent])
+            cenop.append(opindex[suffix])
+    rows = sorted(set(cenrow))
+    images, keep = _expand(rows)
+    newcoords = {}
+    cenabc = []
+    for n, i in zip(cenrow, cenop):
+        if keep[rows.index(n), i]:
+            newcoords[sites[n]+suffixes[i]] = images[rows.index(n), i]
+            cenabc.append(images[rows.index(n), i])
+    if len(cenabc) == 0:
+        return newcoords
+    cenabc = np.array(cenabc)
+    
+    # Half-widths of box containing a sphere of radius about each centre (with margin for tol), in the reduced cell
+    basis = neighbours.reducedbasis(orthom)
+    inverse = np.round(np.linalg.inv(basis))
+    halfwidth = radius * np.sqrt((np.linalg.inv(np.dot(orthom, basis))**2).sum(axis=1)) + tol * abs(inverse).sum(axis=1)
+    def _inbox(images):
+        """ Return mask of images (..., 3) within the box about any centre, allowing for cell translations. """
+        found = np.zeros(images.shape[:-1], dtype=bool)
+        for cen in cenabc:
+            diff = np.dot(images - cen, inverse.T)
+            found |= (abs(diff - np.round(diff)) <= halfwidth).all(axis=-1)
+        return found
+    
+    # Sites with any image near a centre, taking operations in turn
+    near = np.zeros(len(sites), dtype=bool)
+    for rot, trans in zip(rotations, translations):
+        near |= _inbox(_wrapcell(np.dot(abc, rot.T) + trans))
+    rows = np.nonzero(near)[0]
+    images, keep = _expand(rows)
+    for n, i in zip(*np.nonzero(keep & _inbox(images))):
+        newcoords[sites[rows[n]]+suffixes[i]] = images[n,i]
+    return newcoords
+    
+# Parsed symmetry operation strings (see _parsesymmop)
+_SYMMOPS = {}
+    
+def _parsesymmop(symm):
+    """ Return rotation matrix and translation vector of a symmetry operation string such as '-x+1/2, y, z-1/4' as Fractions.
+    
+    Coordinates may be separated by commas or spaces, and each is a sum of terms such as
+    'x', '-y', '+1/2', '0.5' or '2*x'. Results are cached, and strings are never evaluated.
+    """
+    if symm in _SYMMOPS:
+        return _SYMMOPS[symm]
+    text = symm.strip().lower().strip("'\"")
+    parts = text.split(',') if ',' in text else text.split()
+    if len(parts) != 3:
+        raise ValueError("Cannot read symmetry operation '{0}': expected three coordinates".format(symm))
+    rotation = [ [Fraction(0)]*3 for k in range(3) ]
+    translation = [Fraction(0)]*3
+    for k, part in enumerate(parts):
+        part = re.sub(r'\s+', '', part)
+        if len(part) == 0:
+            raise ValueError("Cannot read symmetry operation '{0}': empty coordinate".format(symm))
+        if part[0] not in '+-':
+            part = '+' + part
+        for term in re.findall(r'[+-][^+-]*', part):
+            sign = -1 if term[0] == '-' else 1
+            term = term[1:]
+            match = re.match(r'^(\d+/\d+|\d+\.?\d*|\.\d+)?\*?([xyz])?$', term)
+            if len(term) == 0 or match is None:
+                raise ValueError("Cannot read symmetry operation '{0}': unknown term '{1}'".format(symm, term))
+            number, axis = match.groups()
+            value = sign * (Fraction(number) if number else Fraction(1))
+            if axis is None:
+                translation[k] += value
+            else:
+                rotation[k]['xyz'.index(axis)] += value
+    _SYMMOPS[symm] = (rotation, translation)
+    return rotation, translation
+    
+def symmetryoperations(symmops):
+    """ Return rotation matrices and translation vectors (in fractional coordinates) of symmetry operation strings. """
+    rotations = np.zeros((len(symmops), 3, 3))
+    translations = np.zeros((len(symmops), 3))
+    for i, symm in enumerate(symmops):
+        rotation, translation = _parsesymmop(symm)
+        rotations[i] = np.array(rotation, dtype=float)
+        translations[i] = np.array(translation, dtype=float)
+    return rotations, translations
+    
+def sitesymmetry(site, symmops, tol=1e-3, orthom=None):
+    """ Return rotation matrices (in fractional coordinates) of the symmetry operations that leave site unchanged. 
+    
+    tol is the largest allowed shift of the site, in fractional coordinates or, if the
+    orthogonalisation matrix orthom is given, in Angstroms.
+    """
+    rotations, translations = symmetryoperations(symmops)
+    diff = np.dot(rotations, np.asarray(site, dtype=float)) + translations - site
+    diff = diff - np.round(diff)
+    if orthom is None:
+        return rotations[ (abs(diff) <= tol).all(axis=1) ]
+    return rotations[ np.sqrt((np.dot(diff, np.asarray(orthom).T)**2).sum(axis=1)) <= tol ]
+    
+# Original cell and all 26 neighbouring cell translations, in the order used to label repeated ligands
+_CELLTRANS = neighbours.TRANSLATIONS
+
+def _typekey(site, atomtypes):
+    """ Return label of site in atomtypes: either site itself or its original label (without '_##'), or None. """
+    if atomtypes is None:
+        return None
+    if site in atomtypes:
+        return site
+    parent = '_'.join(site.split('_')[:-1])
+    if parent in atomtypes:
+        return parent
+    return None
+
 def findligands(centre, atomcoords, orthom, radius=2.0, types=[], names = [], atomtypes=None):
-    """ Find all atoms within radius of centre """
-    # Calculate nearest neighbours by creating cell2 = cell1 + 99.5
-    # then:
-    # da = (a2 - a1) % 1 - 0.5
-    # db = (b2 - b1) % 1 - 0.5
-    # dc = (c2 - c1) % 1 - 0.5
-    # To find nearest neighbour position, use X2 = x + dX etc...
-    cell1 = atomcoords.copy()
-    #cell2 = {}
-    checktype=False
-    checkname=False
-    
-    for site in cell1:
-    #    cell2[site] = cell1[site] + 99.5
-        # Check central atom exists
-        if centre not in atomcoords.keys():
+    """ Find all atoms within radius of centre.
+    
+    Images in any cell within radius are found, even if radius is longer than the cell.
+    Returns dicts of ligand labels/coordinates and of labels/types (including centre).
+    See ligandarrays to get the same ligands as arrays.
+    """
+    labels, abc, ligtyp, centyp = ligandarrays(centre, atomcoords, orthom, radius=radius, types=types, names=names, atomtypes=atomtypes)
+    ligands = dict(zip(labels, abc))
+    ligtypes = dict(zip(labels, ligtyp))
+    ligtypes[centre] = centyp
+    return ligands, ligtypes
+    
+def _sitearrays(atomcoords, atomtypes):
+    """ Return labels, dict of label indices, (N, 3) array of crystal coordinates, type indices and LabelTable of types of all sites.
+    
+    Arrays are used directly if atomcoords and atomtypes are the atoms and atomtypes of a Crystal.
+    Otherwise they are built from the dicts, finding types from the exact or original label of each site.
+    """
+    import polyhedron
+    crystal = getattr(atomcoords, 'crystal', None)
+    if crystal is not None and getattr(atomtypes, 'crystal', None) is crystal:
+        return crystal.atomlbl, crystal.atomindex, crystal.atomabc, crystal.atomtypidx, crystal.labeltable
+    labels = list(atomcoords.keys())
+    index = dict([ (site, i) for i, site in enumerate(labels) ])
+    abc = np.array([ atomcoords[site] for site in labels ], dtype=float).reshape(-1, 3)
+    table = polyhedron.LabelTable()
+    typidx = np.zeros(len(labels), dtype=np.int32)
+    for i, site in enumerate(labels):
+        key = _typekey(site, atomtypes)
+        typidx[i] = table.intern(atomtypes[key] if key is not None else None)
+    return labels, index, abc, typidx, table
+    
+def _repeatsuffix(n):
+    """ Return suffix for the nth repeated image of a ligand (from 1): 'a' to 'z', then 'aa', 'ab', ... """
+    suffix = ''
+    while n > 0:
+        n, r = divmod(n - 1, 26)
+        suffix = chr(97 + r) + suffix
+    return suffix
+    
+def ligandarrays(centre, atomcoords, orthom, radius=2.0, types=[], names=[], atomtypes=None, cells=None):
+    """ Find all atoms within radius of centre (arguments as findligands).
+    
+    Returns a sorted list of ligand labels, an (N, 3) array of their crystal coordinates, a list
+    of their types and the centre type, as taken by Polyhedron.from_arrays. Ligands found in
+    more than one cell have 'a', 'b', ... 'z', 'aa', 'ab', ... appended to their label, in the order of cells in
+    neighbours.TRANSLATIONS and then of larger translations. Images of the centre itself are
+    not included. The search uses a neighbours.CellList, which may be given as cells to reuse
+    it for more centres (it must hold the coordinates of atomcoords, in order). To find the
+    ligands of many centres, neighbourlists is faster.
+    """
+    return neighbourlists([centre], atomcoords, orthom, radius=radius, types=types, names=names, atomtypes=atomtypes, cells=cells)[centre]
+    
+def neighbourlists(centres, atomcoords, orthom, radius=2.0, types=[], names=[], atomtypes=None, cells=None):
+    """ Find all atoms within radius of each of centres in one search (other arguments as ligandarrays).
+    
+    Returns dict of the ligands of each centre, as returned by ligandarrays. Ligand types and
+    labels are checked once, as a mask of allowed sites, and all centres are searched at once.
+    """
+    # Check central atoms exist
+    for centre in centres:
+        if centre not in atomcoords:
             raise KeyError("Atom {0} not found in atomcoords".format(centre))
     
+    labels, index, abc, typidx, table = _sitearrays(atomcoords, atomtypes)
+    
     if types == []:
         checktype = False
     else:
         if atomtypes is None:
             raise ValueError("List of valid types requires corresponding atomtypes dictionary")
+        if isinstance(atomtypes, TypeView):
+            present = set(table.lookup(np.unique(typidx))) - set([None])     # Without listing every atom
+        else:
+            present = set(atomtypes.values())
         for t in types:
-            if t not in atomtypes.values():
+            if t not in present:
                 raise ValueError("Atom type {0} is not allowed. Valid types are: {1}".format(t, ", ".join([str(p) for p in set(atomtypes.values())])))
         checktype = True
     
@@ -363,106 +851,37 @@ def findligands(centre, atomcoords, orthom, radius=2.0, types=[], names = [], at
         if atomtypes is None:
             raise ValueError("List of ligand names requires corresponding atomtypes dictionary")
         for t in names:
-            if t not in atomtypes.keys():
+            if t not in atomtypes:
                 raise ValueError("Atom label {0} is not allowed. Valid labels are: {1}".format(t, ", ".join([str(p) for p in set(atomtypes.keys())])))
         checkname = True
         
-    # Iterate over all atoms
-    ligands = {}
-    ligtypes = {}
-    ligtypes[centre] = atomtypes[centre]
-    
-    #for site in cell2:
-    for site in cell1:
-        if site == centre:
-            continue
-        else:
-            if checktype:   # Method to filter out correct atom types, either with exact name in dict, or original name in dict (without _##)
-                if site in atomtypes.keys() and atomtypes[site] not in types:
-                    continue
-                elif '_'.join(site.split('_')[:-1]) in atomtypes.keys() and atomtypes[ '_'.join(site.split('_')[:-1]) ] not in types:
-                    continue
-            elif checkname: # Filter out ligands by label
-                if site in atomtypes.keys() and ( site not in names and '_'.join(site.split('_')[:-1]) not in names):
-                    continue
-                elif '_'.join(site.split('_')[:-1]) in atomtypes.keys() and '_'.join(site.split('_')[:-1]) not in names:
-                    continue
-            
-            # Array to check all 26 neighbouring cell translations (+ original cell)
-            celltrans = np.array([[0,0,0],
-                                  [1,0,0],[-1,0,0],
-                                  [0,1,0],[0,-1,0],
-                                  [0,0,1],[0,0,-1],
-                                  [1,1,0],[1,-1,0],
-                                  [-1,1,0],[-1,-1,0],
-                                  [1,0,1],[1,0,-1],
-                                  [-1,0,1],[-1,0,-1],
-                                  [0,1,1],[0,1,-1],
-                                  [0,-1,1],[0,-1,-1],
-                                  [1,1,1],[1,1,-1],
-                                  [-1,1,1],[-1,1,-1],
-                                  [1,-1,1],[1,-1,-1],
-                                  [-1,-1,1],[-1,-1,-1]])
-            alltrans = cell1[site] + celltrans
-            labelapp = 96   # Number to add character to name
-            for t in (alltrans)[ np.linalg.norm(np.dot( orthom, (alltrans - cell1[centre]).T  ).T, axis=1 ) <= radius ]: # Find any translations within range
-                #print site, t - cell1[centre], np.linalg.norm(np.dot( orthom, (t - cell1[centre]) ))
-                if labelapp == 96:
-                    ligands[site] = t
-                    # Add ligand type
-                    if site in atomtypes.keys():
-                        ligtypes[site] = atomtypes[site]
-                    elif '_'.join(site.split('_')[:-1]) in atomtypes.keys():
-                        ligtypes[site] = atomtypes[ '_'.join(site.split('_')[:-1]) ]                    
-                else:
-                    ligands[site+chr(labelapp)] = t
-                    # Add ligand type
-                    if site in atomtypes.keys():
-                        ligtypes[site+chr(labelapp)] = atomtypes[site]
-                    elif '_'.join(site.split('_')[:-1]) in atomtypes.keys():
-                        ligtypes[site+chr(labelapp)] = atomtypes[ '_'.join(site.split('_')[:-1]) ]
-                labelapp += 1                    
-            
-            #########################
-            # Old method using modulus division
-            #########################
-            # delabc = (cell2[site] - cell1[centre]) % 1 - 0.5    # Finds nearest neighbouring atoms, regardless of cell shifts - can fail for non-orthogonal crystal systems...
-            # Check atom lies within radius
-            #if np.linalg.norm(np.dot(orthom, delabc)) <= radius:
-            #    ligands[site] = cell1[centre] + delabc
-            #    if site in atomtypes.keys():
-            #        ligtypes[site] = atomtypes[site]
-            #    elif '_'.join(site.split('_')[:-1]) in atomtypes.keys():
-            #        ligtypes[site] = atomtypes[ '_'.join(site.split('_')[:-1]) ]
-                    
-                # Need to also check if other translations are neighbours (ie. in small unit cells)
-                # Translations for all 26 unit cells
-                # celltrans = np.array([[1,0,0],[-1,0,0],
-                                      # [0,1,0],[0,-1,0],
-                                      # [0,0,1],[0,0,-1],
-                                      # [1,1,0],[1,-1,0],
-                                      # [-1,1,0],[-1,-1,0],
-                                      # [1,0,1],[1,0,-1],
-                                      # [-1,0,1],[-1,0,-1],
-                                      # [0,1,1],[0,1,-1],
-                                      # [0,-1,1],[0,-1,-1],
-                                      # [1,1,1],[1,1,-1],
-                                      # [-1,1,1],[-1,1,-1],
-                                      # [1,-1,1],[1,-1,-1],
-                                      # [-1,-1,1],[-1,-1,-1]])
-                # alltrans = ligands[site] + celltrans
-                # labelapp = 97   # Number to add character to name
-                # for t in (alltrans)[ np.linalg.norm(np.dot( orthom, (alltrans - cell1[centre]).T  ).T, axis=1 ) <= radius ]: # Find any translations within range
-                    # #print site, t - cell1[centre], np.linalg.norm(np.dot( orthom, (t - cell1[centre]) ))
-                    # ligands[site+chr(labelapp)] = t
-                    # # Add ligand type
-                    # if site in atomtypes.keys():
-                        # ligtypes[site+chr(labelapp)] = atomtypes[site]
-                    # elif '_'.join(site.split('_')[:-1]) in atomtypes.keys():
-                        # ligtypes[site+chr(labelapp)] = atomtypes[ '_'.join(site.split('_')[:-1]) ]
-                    # labelapp += 1
+    # Sites allowed as ligands: those of allowed types or names, or without a type
+    allowed = np.ones(len(labels), dtype=bool)
+    if checktype:   # Filter by type of exact or original label (without _##)
+        allowed = np.array([ t is None or t in types for t in table.labels ], dtype=bool)[typidx]
+    elif checkname: # Filter by label
+        untyped = np.array([ t is None for t in table.labels ], dtype=bool)[typidx]
+        allowed = untyped | np.array([ site in names or '_'.join(site.split('_')[:-1]) in names for site in labels ], dtype=bool)
     
-    return ligands, ligtypes
-                        
-            
-    
\ No newline at end of file
+    # Search around all centres at once, leaving out each centre itself
+    cenidx = np.array([ index[centre] for centre in centres ], dtype=np.int64)
+    if cells is None:
+        crystal = getattr(atomcoords, 'crystal', None)
+        basis = crystal.reducedbasis() if crystal is not None and crystal.cell else None      # Reduced cell, if already found
+        cells = neighbours.CellList(abc, orthom, radius, basis=basis)
+    cen, found, trans = cells.query(abc[cenidx], sites=allowed)[:3]      # Each centre, then site, then translations in order
+    other = found != cenidx[cen]
+    cen, found, trans = cen[other], found[other], trans[other]
+    bounds = np.searchsorted(cen, np.arange(len(centres)+1))
+    
+    ligandsets = {}
+    for c, centre in enumerate(centres):
+        sites = found[bounds[c]:bounds[c+1]]
+        ligands = []
+        for i, n in enumerate(sites):
+            repeat = repeat + 1 if i > 0 and sites[i-1] == n else 0     # Number of earlier images of this site
+            ligands.append(labels[n] + _repeatsuffix(repeat))
+        order = sorted(range(len(ligands)), key=ligands.__getitem__)
+        ligabc = (abc[sites] + trans[bounds[c]:bounds[c+1]])[order]
+        ligandsets[centre] = ([ ligands[i] for i in order ], ligabc, table.lookup(typidx[sites[order]]), table.labels[typidx[cenidx[c]]])
+    return ligandsets
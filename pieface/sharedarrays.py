@@ -0,0 +1,56 @@
+"""
+Shared contiguous arrays backing many small Polyhedron and Ellipsoid objects.
+
+Crystal.compact moves the small per-object arrays of all polyhedra and ellipsoids into a few
+large arrays, registered here with share(), leaving each object with views (rows) of them.
+The __getstate__/__setstate__ helpers used by the slotted classes pickle such views as
+(array, rows) pairs, so each shared array is stored only once rather than once per view.
+"""
+
+from __future__ import division
+import numpy as np
+import weakref
+
+_SHARED = weakref.WeakValueDictionary()     # Registered arrays, by id
+
+_VIEW = '__sharedview__'     # Marks a pickled view of a shared array
+
+def share(array):
+    """ Register array as shared, so that views of its rows are pickled by reference. Returns array. """
+    _SHARED[id(array)] = array
+    return array
+
+def _rows(value):
+    """ Return (base, rows) if value is a view of rows of a shared array, otherwise None. """
+    base = getattr(value, 'base', None)
+    if base is None or _SHARED.get(id(base)) is not base or base.ndim == 0 or base.strides[0] == 0:
+        return None
+    offset = value.__array_interface__['data'][0] - base.__array_interface__['data'][0]
+    start = offset // base.strides[0]
+    if offset % base.strides[0] != 0 or not 0 <= start < len(base):
+        return None
+    if value.shape == base.shape[1:]:
+        rows = start
+    else:
+        rows = slice(start, start + len(value))
+    view = base[rows]
+    if view.shape != value.shape or view.strides != value.strides:
+        return None
+    return base, rows
+
+def getslots(obj):
+    """ Return dict of the slots set on obj, with views of shared arrays given by reference. """
+    state = {}
+    for k in obj.__slots__:
+        if hasattr(obj, k):
+            value = getattr(obj, k)
+            ref = _rows(value) if isinstance(value, np.ndarray) else None
+            state[k] = (_VIEW,) + ref if ref is not None else value
+    return state
+
+def setslots(obj, state):
+    """ Restore slots of obj from dict given by getslots. """
+    for k, value in state.items():
+        if isinstance(value, tuple) and len(value) == 3 and isinstance(value[0], str) and value[0] == _VIEW:
+            value = share(value[1])[value[2]]
+        setattr(obj, k, value)
@@ -0,0 +1,115 @@
+"""
+Closed-form linear algebra for stacks of small (2x2, 3x3 and 4x4) matrices.
+
+Ellipsoid fitting works almost entirely with 3x3 and 4x4 matrices, for which the call
+overhead of the LAPACK routines in np.linalg is far larger than the arithmetic. The
+functions here evaluate explicit formulae over a whole stack of matrices (shape
+(..., n, n)) at once, so that the batched fits in ellipsoid.fit_many can share each call.
+
+They do not speed up a single fit (Ellipsoid.getminvol): each formula has a fixed cost of
+roughly a hundred array operations, and even evaluated on Python floats a single 4x4
+inverse is no quicker than np.linalg.inv, so single matrices and small stacks (fewer than
+MINSTACK matrices) are passed straight to np.linalg.
+"""
+
+from __future__ import division
+import numpy as np
+
+MINSTACK = 256      # Smallest stack of matrices for which closed-form expressions are used
+
+
+def _elements(a):
+    """ Return matrix elements of a stack of matrices as nested lists of arrays. """
+    n = a.shape[-1]
+    flat = a.reshape(-1, n*n).T
+    return [ [ flat[i*n + j].reshape(a.shape[:-2]) for j in range(n) ] for i in range(n) ]
+
+def _assemble(rows):
+    """ Build array from nested lists of matrix elements, with matrix axes last. """
+    out = np.array(rows, dtype=float)
+    return np.rollaxis(np.rollaxis(out, 0, out.ndim), 0, out.ndim)
+
+def _checksquare(a):
+    """ Raise an error if a is not a (stack of) square 2x2, 3x3 or 4x4 matrices. """
+    if a.ndim < 2 or a.shape[-1] != a.shape[-2]:
+        raise np.linalg.LinAlgError("Last 2 dimensions of the array must be square")
+    if a.shape[-1] not in [2, 3, 4]:
+        raise ValueError("Only 2x2, 3x3 and 4x4 matrices are supported (got {0}x{0})".format(a.shape[-1]))
+
+def inv(a):
+    """ Return the inverse of 2x2, 3x3 or 4x4 matrices. """
+    a = np.asarray(a, dtype=float)
+    _checksquare(a)
+    if a.size < MINSTACK * a.shape[-1]**2:
+        return np.linalg.inv(a)
+    adj, d = _adjugate(_elements(a), a.shape[-1])
+    if np.any(d == 0.):
+        raise np.linalg.LinAlgError("Singular matrix")
+    return _assemble(adj) / d[...,np.newaxis,np.newaxis]
+
+def quadform(x, a):
+    """ Return x[i].a.x[i] for each row of x (i.e. diag(x.a.xT) without forming it). """
+    x = np.asarray(x, dtype=float)
+    return np.einsum('...ij,...ij->...i', np.einsum('...ik,...kj->...ij', x, a), x)
+
+def eigvalsh3(a):
+    """ Return eigenvalues (in ascending order) of symmetric 3x3 matrices.
+
+    Uses the trigonometric solution of the characteristic polynomial (Smith, 1961). Errors
+    are of order machine precision relative to the largest eigenvalue, rising towards its
+    square root for (nearly) repeated eigenvalues, so tests based on these values should
+    allow a generous margin.
+    """
+    a = np.asarray(a, dtype=float)
+    _checksquare(a)
+    if a.shape[-1] != 3:
+        raise ValueError("eigvalsh3 requires 3x3 matrices")
+    if a.size < MINSTACK * 9:
+        return np.linalg.eigvalsh(a)
+    a00, a11, a22 = a[...,0,0], a[...,1,1], a[...,2,2]
+    a01, a02, a12 = a[...,0,1], a[...,0,2], a[...,1,2]
+    q = (a00 + a11 + a22) / 3.
+    p = np.sqrt( ((a00 - q)**2 + (a11 - q)**2 + (a22 - q)**2 + 2.*(a01**2 + a02**2 + a12**2)) / 6. )
+    safep = np.where(p > 0., p, 1.)
+    b00, b11, b22 = (a00 - q) / safep, (a11 - q) / safep, (a22 - q) / safep
+    b01, b02, b12 = a01 / safep, a02 / safep, a12 / safep
+    r = (b00*(b11*b22 - b12*b12) - b01*(b01*b22 - b12*b02) + b02*(b01*b12 - b11*b02)) / 2.
+    phi = np.arccos(np.clip(r, -1., 1.)) / 3.
+    largest = q + 2.*p*np.cos(phi)
+    smallest = q + 2.*p*np.cos(phi + 2.*np.pi/3.)
+    return np.concatenate([ e[...,np.newaxis] for e in [smallest, 3.*q - largest - smallest, largest] ], axis=-1)
+
+def _adjugate(m, n):
+    """ Return adjugate (as nested lists) and determinant of matrix elements m (n x n). """
+    if n == 2:
+        ((a00, a01), (a10, a11)) = m
+        return [[a11, -a01], [-a10, a00]], a00*a11 - a01*a10
+    elif n == 3:
+        ((a00, a01, a02), (a10, a11, a12), (a20, a21, a22)) = m
+        c00 = a11*a22 - a12*a21
+        c10 = a12*a20 - a10*a22
+        c20 = a10*a21 - a11*a20
+        adj = [[c00, a02*a21 - a01*a22, a01*a12 - a02*a11],
+               [c10, a00*a22 - a02*a20, a02*a10 - a00*a12],
+               [c20, a01*a20 - a00*a21, a00*a11 - a01*a10]]
+        return adj, a00*c00 + a01*c10 + a02*c20
+    else:
+        # Laplace expansion in terms of 2x2 minors of the first two and last two rows
+        ((a00, a01, a02, a03), (a10, a11, a12, a13), (a20, a21, a22, a23), (a30, a31, a32, a33)) = m
+        s0 = a00*a11 - a10*a01
+        s1 = a00*a12 - a10*a02
+        s2 = a00*a13 - a10*a03
+        s3 = a01*a12 - a11*a02
+        s4 = a01*a13 - a11*a03
+        s5 = a02*a13 - a12*a03
+        c5 = a22*a33 - a32*a23
+        c4 = a21*a33 - a31*a23
+        c3 = a21*a32 - a31*a22
+        c2 = a20*a33 - a30*a23
+        c1 = a20*a32 - a30*a22
+        c0 = a20*a31 - a30*a21
+        adj = [[ a11*c5 - a12*c4 + a13*c3, -a01*c5 + a02*c4 - a03*c3,  a31*s5 - a32*s4 + a33*s3, -a21*s5 + a22*s4 - a23*s3],
+               [-a10*c5 + a12*c2 - a13*c1,  a00*c5 - a02*c2 + a03*c1, -a30*s5 + a32*s2 - a33*s1,  a20*s5 - a22*s2 + a23*s1],
+               [ a10*c4 - a11*c2 + a13*c0, -a00*c4 + a01*c2 - a03*c0,  a30*s4 - a31*s2 + a33*s0, -a20*s4 + a21*s2 - a23*s0],
+               [-a10*c3 + a11*c1 - a12*c0,  a00*c3 - a01*c1 + a02*c0, -a30*s3 + a31*s1 - a32*s0,  a20*s3 - a21*s1 + a22*s0]]
+        return adj, s0*c5 - s1*c4 + s2*c3 + s3*c2 - s4*c1 + s5*c0
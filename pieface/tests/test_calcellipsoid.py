@@ -0,0 +1,99 @@
+""" Tests for calcellipsoid.py """
+import unittest
+from pieface import calcellipsoid
+import numpy as np
+import pkg_resources    # To find packaged CIF files
+
+class PreviousWeights(unittest.TestCase):
+    """ Test warm-starting ellipsoid fits from a previous Crystal. """
+    @classmethod
+    def setUpClass(cls):
+        cls.CIF = pkg_resources.resource_filename('pieface.tests.test_data', 'MnSnO3_COD1004021.cif')
+        cls.first = calcellipsoid.calcfromcif(cls.CIF, ['Mn1', 'Sn1'], 2.5, allligtypes=['O2-'], tolerance=1e-4)
+    def test_reuse_weights(self):
+        second = calcellipsoid.calcfromcif(self.CIF, ['Mn1', 'Sn1'], 2.5, allligtypes=['O2-'], tolerance=1e-4, previous=self.first)
+        for cen in ['Mn1', 'Sn1']:
+            cold = getattr(self.first, cen+"_poly").ellipsoid
+            warm = getattr(second, cen+"_poly").ellipsoid
+            self.assertTrue(warm.cycles < cold.cycles / 10)
+            np.testing.assert_array_almost_equal(warm.radii, cold.radii, decimal=3)
+    def test_different_ligands(self):
+        # Larger radius gives a different set of ligands, so weights cannot be reused
+        cold = calcellipsoid.calcfromcif(self.CIF, ['Mn1'], 3.5, allligtypes=['O2-'], tolerance=1e-4)
+        other = calcellipsoid.calcfromcif(self.CIF, ['Mn1'], 3.5, allligtypes=['O2-'], tolerance=1e-4, previous=self.first)
+        self.assertNotEqual(other.Mn1_poly.alllbl, self.first.Mn1_poly.alllbl)
+        self.assertEqual(other.Mn1_poly.ellipsoid.cycles, cold.Mn1_poly.ellipsoid.cycles)
+        np.testing.assert_array_almost_equal(other.Mn1_poly.ellipsoid.radii, cold.Mn1_poly.ellipsoid.radii)
+
+class DistortionIndices(unittest.TestCase):
+    """ Test distortion indices computed for all polyhedra in a Crystal. """
+    @classmethod
+    def setUpClass(cls):
+        cls.CIF = pkg_resources.resource_filename('pieface.tests.test_data', 'MnSnO3_COD1004021.cif')
+        cls.phase = calcellipsoid.calcfromcif(cls.CIF, ['Mn1', 'Sn1'], 2.5, allligtypes=['O2-'], method='wolfe-atwood')
+    def test_crystal(self):
+        geometry = self.phase.bondgeometry()
+        self.assertItemsEqual(geometry.keys(), ['Mn1', 'Sn1'])
+        for cen in ['Mn1', 'Sn1']:
+            poly = getattr(self.phase, cen+"_poly")
+            single = poly.bondgeometry(self.phase.orthomatrix())
+            for key in single:
+                np.testing.assert_almost_equal(geometry[cen][key], single[key])
+            np.testing.assert_almost_equal(geometry[cen]['bondlens'], poly.allbondlens(self.phase.mtensor()))
+    def test_nesteddict(self):
+        data = calcellipsoid.makenesteddict({self.CIF: self.phase})
+        geometry = self.phase.bondgeometry()
+        for key in ['polyvol', 'quadelong', 'anglevar', 'econ']:
+            self.assertEqual(data['Mn1'][key], [ float(geometry['Mn1'][key]) ])
+        self.assertTrue(data['Mn1']['quadelong'][0] > 1.)
+
+class ShapeMeasures(unittest.TestCase):
+    """ Test continuous shape measures calculated from a CIF file. """
+    CIF = pkg_resources.resource_filename('pieface.tests.test_data', 'MnSnO3_COD1004021.cif')
+    def test_shapes(self):
+        phase = calcellipsoid.calcfromcif(self.CIF, ['Mn1'], 2.5, allligtypes=['O2-'], method='wolfe-atwood', shapes=True)
+        self.assertItemsEqual(phase.Mn1_poly.cshm.keys(), ['HP-6', 'OC-6', 'TPR-6'])
+        self.assertTrue(phase.Mn1_poly.cshm['OC-6'] < phase.Mn1_poly.cshm['TPR-6'])
+        data = calcellipsoid.makenesteddict({self.CIF: phase})
+        self.assertEqual(data['Mn1']['cshm_OC-6'], [phase.Mn1_poly.cshm['OC-6']])
+    def test_no_shapes(self):
+        phase = calcellipsoid.calcfromcif(self.CIF, ['Mn1'], 2.5, allligtypes=['O2-'], method='wolfe-atwood')
+        self.assertTrue(phase.Mn1_poly.cshm is None)
+        self.assertFalse('cshm_OC-6' in calcellipsoid.makenesteddict({self.CIF: phase})['Mn1'])
+
+class LocalExpansion(unittest.TestCase):
+    """ Test generating only atoms near centres from a CIF file. """
+    CIF = pkg_resources.resource_filename('pieface.tests.test_data', 'fayalite_COD1000064.cif')
+    def test_local(self):
+        full = calcellipsoid.calcfromcif(self.CIF, ['Fe1', 'Fe2_3'], 2.5, allligtypes=['O2-'], tolerance=1e-4)
+        local = calcellipsoid.calcfromcif(self.CIF, ['Fe1', 'Fe2_3'], 2.5, allligtypes=['O2-'], tolerance=1e-4, local=True)
+        self.assertTrue(len(local.atoms) < len(full.atoms))
+        self.assertEqual(local.polyhedra.keys(), full.polyhedra.keys())
+        for cen in full.polyhedra:
+            self.assertEqual(local.polyhedra[cen].alllbl, full.polyhedra[cen].alllbl)
+            np.testing.assert_array_almost_equal(local.polyhedra[cen].ellipsoid.radii, full.polyhedra[cen].ellipsoid.radii)
+    def test_local_names(self):
+        """ Ligands given by label are found when their original sites are not near a centre """
+        full = calcellipsoid.calcfromcif(self.CIF, ['Fe1'], 2.5, alllignames=['O1', 'O2', 'O3'], tolerance=1e-4)
+        local = calcellipsoid.calcfromcif(self.CIF, ['Fe1'], 2.5, alllignames=['O1', 'O2', 'O3'], tolerance=1e-4, local=True)
+        self.assertEqual(len(full.polyhedra['Fe1'].liglbl), 6)
+        self.assertEqual(local.polyhedra['Fe1'].alllbl, full.polyhedra['Fe1'].alllbl)
+        self.assertEqual(local.polyhedra['Fe1'].ligtyp, full.polyhedra['Fe1'].ligtyp)
+        np.testing.assert_array_equal(local.polyhedra['Fe1'].allabc, full.polyhedra['Fe1'].allabc)
+
+if __name__ == "__main__":
+
+    test_classes_to_run = [PreviousWeights,
+                           DistortionIndices,
+                           ShapeMeasures,
+                           LocalExpansion,
+                           ]
+
+    suites_list = []
+    for test_class in test_classes_to_run:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+        suites_list.append(suite)
+
+    big_suite = unittest.TestSuite(suites_list)
+
+    results = unittest.TextTestRunner().run(big_suite)
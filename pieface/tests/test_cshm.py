@@ -0,0 +1,77 @@
+""" Tests for cshm.py """
+import unittest
+from pieface import cshm
+import numpy as np
+import itertools
+
+def _bruteforce(points, reference):
+    """ Shape measure minimised over every pairing of points with reference vertices. """
+    q = points - points.mean(axis=0)
+    p = reference - reference.mean(axis=0)
+    best = 0.
+    for perm in itertools.permutations(range(len(q))):
+        best = max(best, cshm._rotation(q, p[list(perm)])[1])
+    return 100. * (1. - best**2 / ((q**2).sum() * (p**2).sum()))
+
+class ReferenceShapes(unittest.TestCase):
+    """ Test shape measures of ideal shapes against each other. """
+    def test_ideal(self):
+        rng = np.random.RandomState(0)
+        for name, ref in cshm.REFERENCES.items():
+            rot = np.linalg.qr(rng.normal(size=(3,3)))[0]
+            moved = 2.5 * np.dot(ref, rot)[rng.permutation(len(ref))] + [1., 2., 3.]
+            self.assertAlmostEqual(cshm.shapemeasure(moved, ref)[0], 0.)
+    def test_known_values(self):
+        for shape1, shape2, value in [('OC-6', 'TPR-6', 16.737), ('T-4', 'SP-4', 33.333), ('CU-8', 'SAPR-8', 10.989),
+                                      ('OC-6', 'HP-6', 33.333), ('TBPY-5', 'vOC-5', 6.699)]:
+            self.assertAlmostEqual(cshm.shapemeasure(cshm.REFERENCES[shape1], cshm.REFERENCES[shape2])[0], value, places=3)
+    def test_pairing(self):
+        # Pairing is unique up to the symmetry of the reference, so check it reproduces the measure
+        ref = cshm.REFERENCES['TPR-6']
+        points = ref + 0.05 * np.random.RandomState(0).normal(size=ref.shape)
+        q = points[[3, 0, 5, 1, 4, 2]]
+        measure, pairs = cshm.shapemeasure(q, ref)
+        self.assertItemsEqual(pairs, range(6))
+        q, p = q - q.mean(axis=0), ref[pairs] - ref.mean(axis=0)
+        self.assertAlmostEqual(100. * (1. - cshm._rotation(q, p)[1]**2 / ((q**2).sum() * (p**2).sum())), measure)
+        self.assertAlmostEqual(measure, _bruteforce(points, ref))
+
+class DistortedShapes(unittest.TestCase):
+    """ Compare the pruned search with trying every pairing. """
+    def test_bruteforce(self):
+        rng = np.random.RandomState(1)
+        for name in ['T-4', 'SP-4', 'TBPY-5', 'vOC-5', 'OC-6', 'TPR-6']:
+            ref = cshm.REFERENCES[name]
+            for trial in range(3):
+                points = ref + 0.3 * rng.normal(size=ref.shape)
+                self.assertAlmostEqual(cshm.shapemeasure(points, ref)[0], _bruteforce(points, ref))
+    def test_shapemeasures(self):
+        points = cshm.REFERENCES['OC-6'] + 0.1 * np.random.RandomState(2).normal(size=(6,3))
+        measures = cshm.shapemeasures(points)
+        self.assertItemsEqual(measures.keys(), ['HP-6', 'OC-6', 'TPR-6'])
+        self.assertTrue(measures['OC-6'] < measures['TPR-6'] < measures['HP-6'])
+        self.assertItemsEqual(cshm.shapemeasures(points, names=['OC-6']).keys(), ['OC-6'])
+    def test_hungarian(self):
+        rng = np.random.RandomState(3)
+        for n in [1, 4, 7]:
+            cost = rng.normal(size=(n,n))
+            best = min( cost[range(n), list(p)].sum() for p in itertools.permutations(range(n)) )
+            self.assertAlmostEqual(cost[range(n), cshm._hungarian(cost)].sum(), best)
+    def test_errors(self):
+        self.assertRaises(ValueError, cshm.shapemeasure, np.zeros((6,3)), cshm.REFERENCES['OC-6'])
+        self.assertRaises(ValueError, cshm.shapemeasure, np.ones((4,3)), cshm.REFERENCES['OC-6'])
+
+if __name__ == "__main__":
+
+    test_classes_to_run = [ReferenceShapes,
+                           DistortedShapes,
+                           ]
+
+    suites_list = []
+    for test_class in test_classes_to_run:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+        suites_list.append(suite)
+
+    big_suite = unittest.TestSuite(suites_list)
+
+    results = unittest.TextTestRunner().run(big_suite)
@@ -220,6 +220,277 @@ class PlanarEllipse(AllEllipsoidFunctions, unittest.TestCase):
     tolerance = float(1.e-6)
 
 
+class LargePointSet(unittest.TestCase):
+    """ Distorted, rotated octahedron hidden among many interior points. """
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(42)
+        cls.radii = np.array([3., 2., 1.])
+        cls.offset = np.array([0.5, -1.0, 2.0])
+        cls.rot, _ = np.linalg.qr(rng.normal(size=(3,3)))
+        vertices = np.vstack([np.diag(cls.radii), -np.diag(cls.radii)])
+        interior = rng.uniform(-0.3, 0.3, size=(40,3)) * cls.radii
+        cls.points = np.dot(np.vstack([vertices, interior]), cls.rot) + cls.offset
+        cls.ellipob = ellipsoid.Ellipsoid(points = cls.points, tolerance=1e-5)
+        cls.ellipob.findellipsoid()
+        
+    def test_radii(self):
+        np.testing.assert_array_almost_equal(self.ellipob.radii, self.radii, decimal=3)
+    def test_centre(self):
+        np.testing.assert_array_almost_equal(self.ellipob.centre, self.offset, decimal=3)
+    def test_rotation(self):
+        # Rows of rotation are ellipsoid axes (up to sign)
+        np.testing.assert_array_almost_equal(abs(np.dot(self.ellipob.rotation, self.rot.T)), np.eye(3), decimal=3)
+
+class RankOneAlgorithm(unittest.TestCase):
+    """ Check rank-one updated Khachiyan iteration matches full recalculation. """
+    points = np.array([[ 1.9, 0.1,-0.2],[-2.1, 0.2, 0.1],[ 0.1, 1.2, 0.3],
+                       [-0.2,-1.4, 0.1],[ 0.3, 0.2, 0.8],[ 0.1,-0.3,-0.7]])
+    def test_matches_khachiyan(self):
+        ellipob = ellipsoid.Ellipsoid(points = self.points, tolerance=1e-6)
+        full = ellipob.getminvol(self.points)
+        rank1 = ellipob.getminvol(self.points, algorithm='khachiyan-rank1')
+        for a, b in zip(full, rank1):
+            np.testing.assert_array_almost_equal(a, b)
+    def test_unknown_algorithm(self):
+        ellipob = ellipsoid.Ellipsoid(points = self.points)
+        self.assertRaises(ValueError, ellipob.getminvol, self.points, algorithm='unknown')
+
+class WolfeAtwoodOct(AllEllipsoidFunctions, unittest.TestCase):
+    """ Simple octahedron (with central point) fitted using away-step solver """
+    points = np.array([[0,0,0],[1,0,0],[-1,0,0],[0,1,0],[0,-1,0],[0,0,1],[0,0,-1]])
+    @classmethod
+    def setUpClass(cls):
+        cls.ellipob = ellipsoid.Ellipsoid(points = cls.points, tolerance=cls.tolerance)
+        cls.ellipob.findellipsoid(method='wolfe-atwood')
+    valid = dict(SimpleOctEllipsoid.valid, numpoints=7)
+    tolerance = float(1.e-6)
+    
+    def test_distorted(self):
+        """ Away-step solver agrees with Khachiyan for a distorted, rotated polyhedron """
+        points = np.array([[ 1.9, 0.1,-0.2],[-2.1, 0.2, 0.1],[ 0.1, 1.2, 0.3],
+                           [-0.2,-1.4, 0.1],[ 0.3, 0.2, 0.8],[ 0.1,-0.3,-0.7]])
+        ellipob = ellipsoid.Ellipsoid(points = points, tolerance=1e-6)
+        full = ellipob.getminvol(points)
+        away = ellipob.getminvol(points, algorithm='wolfe-atwood')
+        np.testing.assert_array_almost_equal(full[0], away[0], decimal=4)
+        np.testing.assert_array_almost_equal(full[1], away[1], decimal=4)
+
+class FitMany(unittest.TestCase):
+    """ Check batched fitting gives the same results as individual Ellipsoid objects. """
+    pointsets = [SimpleOctEllipsoid.points,
+                 RankOneAlgorithm.points,
+                 np.array([[ 1.1, 0.9, 1.0],[ 1.0,-1.0,-0.9],[-1.0, 1.0,-1.1],[-0.9,-1.1, 1.0]]),
+                 PlanarEllipse.points,
+                 LinearEllipse.points,
+                 ]
+    @classmethod
+    def setUpClass(cls):
+        cls.centres, cls.radii, cls.rotations = ellipsoid.fit_many(cls.pointsets, tolerance=1e-6)
+    def test_shapes(self):
+        self.assertEqual(self.centres.shape, (len(self.pointsets), 3))
+        self.assertEqual(self.radii.shape, (len(self.pointsets), 3))
+        self.assertEqual(self.rotations.shape, (len(self.pointsets), 3, 3))
+    def test_matches_single(self):
+        for i, pts in enumerate(self.pointsets):
+            ellipob = ellipsoid.Ellipsoid(points = pts, tolerance=1e-6)
+            ellipob.findellipsoid()
+            np.testing.assert_array_almost_equal(self.centres[i], ellipob.centre)
+            np.testing.assert_array_almost_equal(self.radii[i], ellipob.radii)
+            np.testing.assert_array_almost_equal(self.rotations[i], ellipob.rotation)
+    def test_empty(self):
+        centres, radii, rotations = ellipsoid.fit_many([])
+        self.assertEqual(len(radii), 0)
+
+class GapCriterion(unittest.TestCase):
+    """ Check fits stopped on the optimality gap reach the requested accuracy. """
+    radii = np.array([3., 2., 1.])
+    points = np.vstack([np.diag(radii), -np.diag(radii),
+                        np.random.RandomState(7).uniform(-0.3, 0.3, size=(20,3)) * radii])
+    def test_gap(self):
+        for tol in [1e-2, 1e-4]:
+            ellipob = ellipsoid.Ellipsoid(points = self.points, tolerance=tol)
+            ellipob.findellipsoid(criterion='gap')
+            self.assertTrue(0. <= ellipob.gap <= tol)
+            self.assertTrue(ellipob.cycles > 0)
+    def test_bound(self):
+        # All points lie within the fitted ellipsoid scaled by sqrt(1 + (d+1)*gap/d)
+        ellipob = ellipsoid.Ellipsoid(points = self.points, tolerance=1e-3)
+        ellipob.findellipsoid(criterion='gap')
+        A = np.dot(ellipob.rotation.T / ellipob.radii**2, ellipob.rotation)
+        rel = self.points - ellipob.centre
+        self.assertTrue(np.einsum('ij,jk,ik->i', rel, A, rel).max() <= 1 + 4*ellipob.gap/3 + 1e-10)
+    def test_radii(self):
+        gap = ellipsoid.Ellipsoid(points = self.points, tolerance=1e-4)
+        gap.findellipsoid(criterion='gap')
+        np.testing.assert_array_almost_equal(gap.radii, self.radii, decimal=3)
+    def test_unknown_criterion(self):
+        ellipob = ellipsoid.Ellipsoid(points = self.points)
+        self.assertRaises(ValueError, ellipob.getminvol, self.points, criterion='unknown')
+    def test_fit_many(self):
+        centres, radii, rotations = ellipsoid.fit_many([self.points, SimpleOctEllipsoid.points], tolerance=1e-4, criterion='gap')
+        np.testing.assert_array_almost_equal(radii[0], self.radii, decimal=3)
+        np.testing.assert_array_almost_equal(radii[1], SimpleOctEllipsoid.valid['radii'], decimal=3)
+
+class HullReduction(unittest.TestCase):
+    """ Check removing duplicate and interior points leaves the ellipsoid unchanged. """
+    radii = np.array([3., 2., 1.])
+    points = np.vstack([np.zeros(3), np.diag(radii), -np.diag(radii), np.diag(radii),
+                        np.random.RandomState(3).uniform(-0.3, 0.3, size=(30,3)) * radii])
+    def test_hullindices(self):
+        idx = ellipsoid._hullindices(self.points)
+        self.assertTrue(set(range(1,7)).issubset(idx))
+        self.assertFalse(0 in idx)      # Centre
+        self.assertFalse(7 in idx)      # Duplicate
+    def test_matches_full(self):
+        full = ellipsoid.Ellipsoid(points = self.points, tolerance=1e-6)
+        full.findellipsoid(method='wolfe-atwood')
+        for method in ['khachiyan', 'khachiyan-rank1', 'wolfe-atwood']:
+            reduced = ellipsoid.Ellipsoid(points = self.points, tolerance=1e-6)
+            reduced.findellipsoid(hull=True, method=method)
+            np.testing.assert_array_almost_equal(reduced.radii, full.radii, decimal=4)
+            np.testing.assert_array_almost_equal(reduced.centre, full.centre, decimal=4)
+            self.assertEqual(reduced.weights.shape, (len(self.points),))
+            self.assertEqual(reduced.weights[0], 0.)
+    def test_warmstart(self):
+        first = ellipsoid.Ellipsoid(points = self.points, tolerance=1e-6)
+        first.findellipsoid(hull=True)
+        second = ellipsoid.Ellipsoid(points = self.points, tolerance=1e-6)
+        second.findellipsoid(hull=True, u0=first.weights)
+        np.testing.assert_array_almost_equal(second.radii, first.radii, decimal=4)
+        
+class SymmetricFit(unittest.TestCase):
+    """ Check fast paths for symmetric point sets agree with the full fit. """
+    half = np.random.RandomState(5).uniform(-1, 1, size=(6,3)) * np.array([3., 2., 1.])
+    centrosym = np.vstack([np.zeros(3), half, -half]) + np.array([1., 2., 3.])
+    cube = np.array([[i,j,k] for i in [-1.,1.] for j in [-1.,1.] for k in [-1.,1.]])
+    def test_centred(self):
+        full = ellipsoid.Ellipsoid(points = self.centrosym, tolerance=1e-8)
+        full.findellipsoid(method='wolfe-atwood')
+        for method in ['khachiyan', 'wolfe-atwood']:
+            for symmetry in [True, 'centred']:
+                ellipob = ellipsoid.Ellipsoid(points = self.centrosym, tolerance=1e-4)
+                ellipob.findellipsoid(symmetry=symmetry, method=method, criterion='gap')
+                self.assertEqual(ellipob.fitpath, 'centred')
+                np.testing.assert_array_almost_equal(ellipob.centre, [1., 2., 3.])
+                np.testing.assert_array_almost_equal(ellipob.radii, full.radii, decimal=3)
+    def test_sphere(self):
+        # Cube (centrosymmetric) and tetrahedron (not centrosymmetric) with central point
+        for points in [self.cube, self.cube[[0,3,5,6]]]:
+            ellipob = ellipsoid.Ellipsoid(points = np.vstack([np.zeros(3), points]))
+            ellipob.findellipsoid(symmetry=True)
+            self.assertEqual(ellipob.fitpath, 'sphere')
+            self.assertEqual(ellipob.cycles, 0)
+            np.testing.assert_array_almost_equal(ellipob.radii, np.sqrt(3.) * np.ones(3))
+            np.testing.assert_array_almost_equal(ellipob.centre, np.zeros(3))
+    def test_distorted_sphere(self):
+        # Small genuine distortion must be fitted, not rounded to a sphere
+        points = np.vstack([np.zeros(3), np.diag([2., 2., 2.002]), -np.diag([2., 2., 2.002])])
+        ellipob = ellipsoid.Ellipsoid(points = points, tolerance=1e-8)
+        ellipob.findellipsoid(symmetry=True, method='wolfe-atwood')
+        self.assertNotEqual(ellipob.fitpath, 'sphere')
+        np.testing.assert_array_almost_equal(ellipob.radii, [2.002, 2., 2.], decimal=6)
+        self.assertTrue(ellipob.shapeparam() > 1e-4)
+    def test_off_centre(self):
+        # Ligands centred 0.001 away from the central atom are not centrosymmetric about the centroid
+        points = np.vstack([np.zeros(3), np.vstack([2.*np.eye(3), -2.*np.eye(3)]) + np.array([0.001, 0., 0.])])
+        ellipob = ellipsoid.Ellipsoid(points = points, tolerance=1e-8)
+        ellipob.findellipsoid(symmetry=True, method='wolfe-atwood')
+        self.assertEqual(ellipob.fitpath, 'full')
+        np.testing.assert_array_almost_equal(ellipob.centre, [0.001, 0., 0.], decimal=6)
+        np.testing.assert_array_almost_equal(ellipob.radii, [2., 2., 2.], decimal=6)
+    def test_asserted_centre(self):
+        # symmetry='centred' fixes the centre on the first point (central atom), not the centroid
+        points = np.vstack([np.array([1., 2., 3.]), self.centrosym[1:]])
+        ellipob = ellipsoid.Ellipsoid(points = points, tolerance=1e-6)
+        ellipob.findellipsoid(symmetry='centred', method='wolfe-atwood')
+        np.testing.assert_array_almost_equal(ellipob.centre, [1., 2., 3.])
+    def test_asymmetric(self):
+        ellipob = ellipsoid.Ellipsoid(points = RankOneAlgorithm.points)
+        ellipob.findellipsoid(symmetry=True)
+        self.assertEqual(ellipob.fitpath, 'full')
+    def test_planar(self):
+        square = np.array([[1.,0.,0.],[0.,1.,0.],[-1.,0.,0.],[0.,-1.,0.]])
+        ellipob = ellipsoid.Ellipsoid(points = square)
+        ellipob.findellipsoid(symmetry=True)
+        self.assertEqual(ellipob.fitpath, 'sphere')
+        np.testing.assert_array_almost_equal(ellipob.radii, [1., 1., 0.])
+        
+class WarmStart(unittest.TestCase):
+    """ Check that fits started from previous weights converge to the same ellipsoid. """
+    points = RankOneAlgorithm.points
+    def setUp(self):
+        self.first = ellipsoid.Ellipsoid(points = self.points, tolerance=1e-6)
+        self.first.findellipsoid()
+        self.moved = self.points * np.array([1.01, 0.99, 1.0])
+        self.cold = ellipsoid.Ellipsoid(points = self.moved, tolerance=1e-6)
+        self.cold.findellipsoid()
+    def test_weights(self):
+        self.assertEqual(self.first.weights.shape, (len(self.points),))
+        self.assertAlmostEqual(self.first.weights.sum(), 1.0)
+        self.assertTrue(len(self.first.supportpoints()) <= len(self.points))
+    def test_warmstart(self):
+        warm = ellipsoid.Ellipsoid(points = self.moved, tolerance=1e-6)
+        warm.findellipsoid(u0 = self.first.weights)
+        np.testing.assert_array_almost_equal(warm.centre, self.cold.centre, decimal=4)
+        np.testing.assert_array_almost_equal(warm.radii, self.cold.radii, decimal=4)
+    def test_fit_many(self):
+        cold = ellipsoid.fit_many([self.moved], tolerance=1e-6)
+        warm = ellipsoid.fit_many([self.moved], tolerance=1e-6, u0=[self.first.weights])
+        for a, b in zip(cold, warm):
+            np.testing.assert_array_almost_equal(a, b, decimal=4)
+        self.assertRaises(ValueError, ellipsoid.fit_many, [self.moved], u0=[np.ones(2)])
+    def test_bad_weights(self):
+        warm = ellipsoid.Ellipsoid(points = self.moved, tolerance=1e-6)
+        with self.assertRaises(ValueError):
+            warm.findellipsoid(u0 = np.ones(len(self.points)+1))
+    def test_no_weights(self):
+        with self.assertRaises(AttributeError):
+            ellipsoid.Ellipsoid(points = self.points).supportpoints()
+
+class Sensitivity(unittest.TestCase):
+    """ Compare analytic derivatives of ellipsoid parameters with finite differences. """
+    distorted = np.array([[2.1,0.,0.],[-1.9,0.1,0.],[0.,2.,0.05],[0.1,-2.2,0.],[0.,0.,1.8],[0.05,0.1,-2.05],[0.2,0.1,0.3]])
+    def fit(self, points):
+        ellipob = ellipsoid.Ellipsoid(points = points, tolerance=1e-11)
+        ellipob.findellipsoid(method='wolfe-atwood', criterion='gap')
+        return ellipob
+    def finitediff(self, points, dims=3, h=1e-4):
+        N = len(points)
+        radii, centre, shape = np.zeros((3,N,dims)), np.zeros((3,N,dims)), np.zeros((N,dims))
+        for j in range(N):
+            for m in range(dims):
+                step = np.zeros_like(points)
+                step[j,m] = h
+                up, down = self.fit(points + step), self.fit(points - step)
+                radii[:,j,m] = (up.radii - down.radii) / (2*h)
+                centre[:,j,m] = (up.centre - down.centre) / (2*h)
+                shape[j,m] = (up.shapeparam() - down.shapeparam()) / (2*h)
+        return radii, centre, shape
+    def test_3D(self):
+        sens = self.fit(self.distorted).sensitivity()
+        radii, centre, shape = self.finitediff(self.distorted)
+        np.testing.assert_array_almost_equal(sens['radii'], radii, decimal=6)
+        np.testing.assert_array_almost_equal(sens['centre'], centre, decimal=6)
+        np.testing.assert_array_almost_equal(sens['shapeparam'], shape, decimal=6)
+        # Interior point does not affect the ellipsoid
+        self.assertTrue((sens['radii'][:,6] == 0.).all())
+    def test_planar(self):
+        points = np.array([[2.1,0.,0.],[-1.9,0.1,0.],[0.,1.5,0.],[0.1,-1.2,0.],[0.3,0.2,0.]])
+        sens = self.fit(points).sensitivity()
+        radii, centre, shape = self.finitediff(points, dims=2)
+        np.testing.assert_array_almost_equal(sens['radii'][:,:,:2], radii, decimal=6)
+        np.testing.assert_array_almost_equal(sens['centre'][:,:,:2], centre, decimal=6)
+        np.testing.assert_array_almost_equal(sens['shapeparam'][:,:2], shape, decimal=6)
+    def test_linear(self):
+        sens = self.fit(np.array([[0.,0.,0.],[1.,1.,0.],[-2.,-2.,0.]])).sensitivity()
+        vector = np.array([1.,1.,0.]) / np.sqrt(2.)
+        np.testing.assert_array_almost_equal(abs(sens['radii'][0]), np.vstack([np.zeros(3), vector/2., vector/2.]))
+        np.testing.assert_array_almost_equal(sens['radii'][0,1], -sens['radii'][0,2])
+        np.testing.assert_array_almost_equal(sens['centre'][:,0], np.eye(3))
+    def test_not_fitted(self):
+        self.assertRaises(AttributeError, ellipsoid.Ellipsoid(points = self.distorted).sensitivity)
+
     
 if __name__ == "__main__":
 
@@ -227,7 +498,16 @@ if __name__ == "__main__":
                            EmptyEllipsoidInit,
                            SinglePoint,
                            LinearEllipse,
-                           PlanarEllipse
+                           PlanarEllipse,
+                           LargePointSet,
+                           RankOneAlgorithm,
+                           WolfeAtwoodOct,
+                           FitMany,
+                           GapCriterion,
+                           HullReduction,
+                           SymmetricFit,
+                           WarmStart,
+                           Sensitivity
                            ]
     
     
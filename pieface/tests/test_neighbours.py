@@ -0,0 +1,113 @@
+""" Tests for neighbours.py """
+import unittest
+from pieface import neighbours
+import numpy as np
+import itertools
+
+def brute(centres, abc, orthom, radius, maxtrans):
+    """ Return set of (centre, site, translation) found by checking every translation up to maxtrans. """
+    found = set()
+    for t in itertools.product(range(-maxtrans, maxtrans+1), repeat=3):
+        delxyz = np.dot(abc[np.newaxis,:,:] + np.array(t) - centres[:,np.newaxis,:], orthom.T)
+        for c, s in zip(*np.nonzero(np.sqrt((delxyz**2).sum(axis=2)) <= radius)):
+            found.add((c, s, t))
+    return found
+
+class CellListSearch(unittest.TestCase):
+    """ Compare cell list search with checking all translations. """
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(0)
+        cls.abc = rng.uniform(-0.5, 1.5, size=(60, 3))       # Not all in the unit cell
+        cls.centres = rng.rand(8, 3)
+        cls.orthom = np.array([[5.0, 1.2, -0.8], [0.0, 4.2, 0.9], [0.0, 0.0, 6.1]])    # Triclinic
+        
+    def test_short_radius(self):
+        cells = neighbours.CellList(self.abc, self.orthom, 1.3)
+        self.assertTrue((cells.nbins > 1).all())
+        cen, site, trans, dist = cells.query(self.centres)
+        self.assertEqual(set(zip(cen, site, map(tuple, trans))), brute(self.centres, self.abc, self.orthom, 1.3, 3))
+        
+    def test_long_radius(self):
+        """ Images in cells beyond the neighbouring ones are found """
+        cells = neighbours.CellList(self.abc, self.orthom, 9.0)
+        cen, site, trans, dist = cells.query(self.centres)
+        self.assertTrue(abs(trans).max() > 1)
+        self.assertEqual(len(set(zip(cen, site, map(tuple, trans)))), len(cen))
+        self.assertEqual(set(zip(cen, site, map(tuple, trans))), brute(self.centres, self.abc, self.orthom, 9.0, 4))
+        
+    def test_distances(self):
+        cells = neighbours.CellList(self.abc, self.orthom, 3.0)
+        cen, site, trans, dist = cells.query(self.centres)
+        delxyz = np.dot(self.abc[site] + trans - self.centres[cen], self.orthom.T)
+        np.testing.assert_array_almost_equal(dist, np.sqrt((delxyz**2).sum(axis=1)))
+        self.assertTrue((dist <= 3.0).all())
+        
+    def test_order(self):
+        """ Images are ordered by centre, site and translation """
+        cells = neighbours.CellList(self.abc, self.orthom, 9.0)
+        cen, site, trans, dist = cells.query(self.centres)
+        keys = list(zip(cen, site, neighbours.translationorder(trans)))
+        self.assertEqual(keys, sorted(keys))
+        np.testing.assert_array_equal(neighbours.translationorder(neighbours.TRANSLATIONS), np.arange(27))
+        self.assertTrue(neighbours.translationorder([[2, 0, 0]])[0] > 26)
+        
+    def test_site_mask(self):
+        mask = np.arange(len(self.abc)) % 3 == 0
+        cells = neighbours.CellList(self.abc, self.orthom, 3.0)
+        allcen, allsite, alltrans, alldist = cells.query(self.centres)
+        cen, site, trans, dist = cells.query(self.centres, sites=mask)
+        np.testing.assert_array_equal(site, allsite[mask[allsite]])
+        np.testing.assert_array_equal(trans, alltrans[mask[allsite]])
+        
+    def test_empty(self):
+        cells = neighbours.CellList(np.zeros((0, 3)), self.orthom, 3.0)
+        cen, site, trans, dist = cells.query(self.centres)
+        self.assertEqual(len(cen), 0)
+        self.assertEqual(trans.shape, (0, 3))
+
+class ReducedCell(unittest.TestCase):
+    """ Test Delaunay reduction of oblique cells, and searching in the reduced cell. """
+    @classmethod
+    def setUpClass(cls):
+        cls.P = np.array([[1, 3, -2], [0, 1, 4], [0, -1, -3]])      # Oblique setting of a simple lattice
+        cls.orthom = np.dot(np.diag([10.0, 11.0, 12.0]), cls.P)
+        rng = np.random.RandomState(1)
+        cls.abc = rng.rand(40, 3)
+        cls.centres = rng.rand(5, 3)
+        
+    def test_reduction(self):
+        basis = neighbours.reducedbasis(self.orthom)
+        self.assertEqual(basis.dtype.kind, 'i')
+        self.assertEqual(round(np.linalg.det(basis)), 1)
+        np.testing.assert_array_almost_equal(np.sort(np.sqrt((np.dot(self.orthom, basis)**2).sum(axis=0))), [10.0, 11.0, 12.0])
+        
+    def test_reduced_cell(self):
+        """ A reduced cell is unchanged, apart from the order of vectors """
+        basis = neighbours.reducedbasis(np.diag([10.0, 11.0, 12.0]))
+        np.testing.assert_array_equal(abs(basis), np.eye(3))
+        
+    def test_same_images(self):
+        """ Images found are the same in any setting of the bins """
+        cells = neighbours.CellList(self.abc, self.orthom, 6.0)
+        found = cells.query(self.centres)
+        unreduced = neighbours.CellList(self.abc, self.orthom, 6.0, basis=np.eye(3, dtype=int)).query(self.centres)
+        for a, b in zip(found, unreduced):
+            np.testing.assert_array_equal(a, b)
+        self.assertEqual(set(zip(found[0], found[1], map(tuple, found[2]))), brute(self.centres, self.abc, self.orthom, 6.0, 9))
+        self.assertTrue(cells.nbins.prod() > 1)
+
+if __name__ == "__main__":
+
+    test_classes_to_run = [CellListSearch,
+                           ReducedCell,
+                           ]
+
+    suites_list = []
+    for test_class in test_classes_to_run:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+        suites_list.append(suite)
+
+    big_suite = unittest.TestSuite(suites_list)
+
+    results = unittest.TextTestRunner().run(big_suite)
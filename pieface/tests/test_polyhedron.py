@@ -2,6 +2,7 @@
 import unittest
 from pieface import polyhedron
 import numpy as np
+import pickle
 
 class RepeatedPolyFunctions(object):
     """ Methods to test polyhedron functions with repeated values, assumes initialisation will work. """
@@ -437,6 +438,137 @@ class FullColourPalette(unittest.TestCase):
     def test_pointcolours(self):
         self.assertEqual(self.poly.pointcolours()[:7], ['b', 'r','g','c','m','y','k', 0.1, 0.2, float(0.3), 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0][:7])
         np.testing.assert_almost_equal(self.poly.pointcolours()[7:], [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0])
+
+class BondGeometry(unittest.TestCase):
+    """ Test bond lengths, angles and distortion indices for regular and distorted polyhedra. """
+    octahedron = np.array([[1.,0.,0.],[-1.,0.,0.],[0.,1.,0.],[0.,-1.,0.],[0.,0.,1.],[0.,0.,-1.]])
+    tetrahedron = np.array([[1.,1.,1.],[1.,-1.,-1.],[-1.,1.,-1.],[-1.,-1.,1.]])
+    cube = np.array([[x,y,z] for x in [-1.,1.] for y in [-1.,1.] for z in [-1.,1.]])
+    def test_regular(self):
+        for points, volume in [(self.octahedron, 4./3.), (self.tetrahedron, 8./3.), (self.cube, 8.)]:
+            geometry = polyhedron.bondgeometry(points)
+            self.assertAlmostEqual(geometry['polyvol'], volume)
+            self.assertAlmostEqual(geometry['quadelong'], 1.)
+            self.assertAlmostEqual(geometry['anglevar'], 0.)
+            self.assertAlmostEqual(geometry['econ'], len(points))
+    def test_elongated(self):
+        geometry = polyhedron.bondgeometry(self.octahedron * [1., 1., 1.1])
+        np.testing.assert_almost_equal(geometry['bondlens'], [1., 1., 1., 1., 1.1, 1.1])
+        np.testing.assert_almost_equal(geometry['angles'][0], [0., 180., 90., 90., 90., 90.])
+        self.assertAlmostEqual(geometry['polyvol'], 4.4/3.)
+        self.assertAlmostEqual(geometry['quadelong'], (4. + 2.*1.21) / 6. / 1.1**(2./3.))
+        self.assertAlmostEqual(geometry['anglevar'], 0.)
+        self.assertTrue(geometry['econ'] < 6.)
+    def test_bent(self):
+        bent = self.octahedron.copy()
+        bent[4] = [np.sin(np.radians(10.)), 0., np.cos(np.radians(10.))]
+        geometry = polyhedron.bondgeometry(bent)
+        self.assertAlmostEqual(geometry['anglevar'], 2. * 10.**2 / 11.)
+        self.assertAlmostEqual(geometry['quadelong'], 1. / (geometry['polyvol'] / (4./3.))**(2./3.))
+    def test_stack(self):
+        stack = np.array([self.octahedron, self.octahedron * [1., 1., 1.1]])
+        stacked = polyhedron.bondgeometry(stack)
+        for i, points in enumerate(stack):
+            single = polyhedron.bondgeometry(points)
+            for key in single:
+                np.testing.assert_almost_equal(stacked[key][i], single[key])
+    def test_irregular_coordination(self):
+        geometry = polyhedron.bondgeometry(self.octahedron[:5])
+        self.assertTrue(np.isnan(geometry['quadelong']) and np.isnan(geometry['anglevar']))
+        self.assertAlmostEqual(geometry['polyvol'], 2./3.)
+    def test_polyhedron(self):
+        poly = polyhedron.Polyhedron(('Mn', [0,0,0]), [ ('O'+str(i), p/10.) for i, p in enumerate(self.octahedron) ])
+        geometry = poly.bondgeometry(10.*np.eye(3))
+        self.assertAlmostEqual(geometry['polyvol'], 4./3.)
+        np.testing.assert_almost_equal(geometry['bondlens'], poly.allbondlens(100.*np.eye(3)))
+        empty = polyhedron.Polyhedron(('Mn', [0,0,0]), []).bondgeometry(np.eye(3))
+        self.assertEqual(empty['polyvol'], 0.)
+
+class CompactStorage(unittest.TestCase):
+    """ Test slots, shared label tables and pickling of polyhedra. """
+    def setUp(self):
+        self.labels = polyhedron.LabelTable()
+        self.poly = polyhedron.Polyhedron(('Mn', [0,0,0]), [('A', [0.1,0,0]), ('B', [0,0.2,0])], ligtypes=['Mn', 'O', 'O'], labels=self.labels)
+    def test_slots(self):
+        self.assertFalse(hasattr(self.poly, '__dict__'))
+        self.assertRaises(AttributeError, setattr, self.poly, 'unknown', 1)
+    def test_labels(self):
+        self.assertEqual(self.poly.liglbl, ['A', 'B'])
+        self.assertEqual(self.poly.alllbl, ['Mn', 'A', 'B'])
+        self.assertEqual((self.poly.centyp, self.poly.ligtyp), ('Mn', ['O', 'O']))
+        self.assertEqual(self.labels.labels, ['Mn', 'A', 'B', 'O'])
+        other = polyhedron.Polyhedron(('Fe', [0,0,0]), [('B', [0.1,0,0])], ligtypes=['O'], labels=self.labels)
+        self.assertEqual(self.labels.labels[4:], ['Fe', None])      # Centre type not given
+        self.poly.liglbl = ['C', 'D']
+        self.assertEqual(self.poly.alllbl, ['Mn', 'C', 'D'])
+    def test_pickle(self):
+        self.poly.makeellipsoid(np.eye(3))
+        for protocol in [0, 2]:
+            copy = pickle.loads(pickle.dumps(self.poly, protocol))
+            self.assertEqual(copy.alllbl, self.poly.alllbl)
+            self.assertEqual(copy.ligtyp, self.poly.ligtyp)
+            np.testing.assert_array_equal(copy.allabc, self.poly.allabc)
+            np.testing.assert_array_equal(copy.ellipsoid.radii, self.poly.ellipsoid.radii)
+            np.testing.assert_array_equal(copy.alldelxyz(np.eye(3)), self.poly.alldelxyz(np.eye(3)))
+
+class SimpleOctahedronFromArrays(SimpleOctahedronAsList):
+    """ Tests for polyhedron methods, with simple octahedron made by Polyhedron.from_arrays """
+    @classmethod
+    def setUpClass(cls):
+        """Initialise Polyhedron object from arrays."""
+        cls.poly = polyhedron.Polyhedron.from_arrays(cls.centre[0], cls.centre[1], [ l[0] for l in cls.ligands ], np.array([ l[1] for l in cls.ligands ]),
+                                                     lig_types=['O']*6, cen_type='Mn')
+    
+    def test_mismatched_ligands(self):
+        """ Numbers of ligand labels and coordinates must agree. """
+        self.assertRaises(ValueError, polyhedron.Polyhedron.from_arrays, 'Mn', [0,0,0], ['O1', 'O2'], np.zeros((1,3)))
+    
+    def test_same_as_init(self):
+        """ Polyhedron matches one made by __init__, and shares its label table. """
+        labels = polyhedron.LabelTable()
+        poly = polyhedron.Polyhedron(self.centre, self.ligands, ligtypes=self.ligtypes, labels=labels)
+        arrpoly = polyhedron.Polyhedron.from_arrays('Mn', poly.cenabc, poly.liglbl, poly.ligabc, poly.ligtyp, poly.centyp, labels=labels)
+        self.assertEqual(len(labels), 8)
+        np.testing.assert_array_equal(arrpoly._lig, poly._lig)
+        np.testing.assert_array_equal(arrpoly._ligtyp, poly._ligtyp)
+        self.assertEqual(arrpoly._cen, poly._cen)
+        self.assertEqual(arrpoly._centyp, poly._centyp)
+        np.testing.assert_array_equal(arrpoly.allabc, poly.allabc)
+        
+    def test_separate_arrays(self):
+        """ Changing ligand or centre coordinates in place leaves the others unchanged, as from __init__. """
+        poly = polyhedron.Polyhedron.from_arrays('Mn', [0,0,0], ['O1', 'O2'], np.array([[0.1,0,0],[0,0.2,0]]))
+        poly.ligabc[0, 0] = 0.5
+        poly.cenabc[1] = 0.5
+        np.testing.assert_array_equal(poly.allabc, [[0,0,0],[0.1,0,0],[0,0.2,0]])
+        poly.allabc[1, 0] = 0.3
+        np.testing.assert_array_equal(poly.ligabc, [[0.5,0,0],[0,0.2,0]])
+        
+class NoLigandsFromArrays(NoLigandsAsList):
+    """ Test empty ligand initialisation by Polyhedron.from_arrays """
+    @classmethod
+    def setUpClass(cls):
+        """Initialise Polyhedron object from arrays."""
+        cls.poly = polyhedron.Polyhedron.from_arrays('Mn', [0,0,0], [], np.zeros((0,3)), cen_type='Mn')
+        
+class CachedCoordinates(unittest.TestCase):
+    """ Test reuse and invalidation of cached cartesian coordinates and bond lengths. """
+    def setUp(self):
+        self.poly = polyhedron.Polyhedron(('Mn', [0,0,0]), [('A', [0.1,0,0]), ('B', [0,0.2,0])])
+        self.ortho = 10.*np.eye(3)
+    def test_reused(self):
+        first = self.poly.ligdelxyz(self.ortho)
+        self.assertTrue(self.poly.ligdelxyz(self.ortho.copy()) is first)
+        self.assertTrue(self.poly.allbondlens(self.ortho) is self.poly.allbondlens(self.ortho))
+        self.assertFalse(first.flags.writeable)
+    def test_new_matrix(self):
+        self.poly.ligxyz(self.ortho)
+        np.testing.assert_almost_equal(self.poly.ligxyz(20.*np.eye(3)), [[2.,0.,0.],[0.,4.,0.]])
+    def test_new_coordinates(self):
+        np.testing.assert_almost_equal(self.poly.allbondlens(self.ortho**2), [1., 2.])
+        self.poly.ligabc = np.array([[0.3,0.,0.],[0.,0.4,0.]])
+        np.testing.assert_almost_equal(self.poly.allbondlens(self.ortho**2), [3., 4.])
+        np.testing.assert_almost_equal(self.poly.ligdelxyz(self.ortho), [[3.,0.,0.],[0.,4.,0.]])
   
     
 
@@ -454,7 +586,12 @@ if __name__ == "__main__":
                             NoLigandsAsList,
                             NoLigandsAsDict,
                             NoLigandsAsAtomDict,
-                            FullColourPalette
+                            SimpleOctahedronFromArrays,
+                            NoLigandsFromArrays,
+                            FullColourPalette,
+                            BondGeometry,
+                            CompactStorage,
+                            CachedCoordinates
                            ]
     
     
@@ -2,6 +2,7 @@
 import unittest
 from pieface import readcoords
 import numpy as np
+import pickle
 import os
 import StringIO         # Necessary to read text string like a file
 import pkg_resources    # To find packaged CIF files
@@ -58,6 +59,193 @@ class CrystalInit(unittest.TestCase):
                                                str(self.cell['gam']), atoms=None, atomtypes=None)
         self.assertEqual(self.Crystal.cell, self.cell)  
 
+class CellMatrices(unittest.TestCase):
+    """ Test cached orthogonalisation, reciprocal and metric matrices """
+    def setUp(self):
+        self.phase = readcoords.Crystal(cell=[5.0, 6.0, 7.0, 80.0, 95.0, 110.0])
+        
+    def test_values(self):
+        """ Metric tensor and reciprocal matrix agree with orthogonalisation matrix """
+        M = self.phase.orthomatrix()
+        np.testing.assert_almost_equal(self.phase.mtensor(), np.dot(M.T, M))
+        np.testing.assert_almost_equal(np.dot(self.phase.recipmatrix(), M), np.eye(3))
+        np.testing.assert_almost_equal(np.sqrt(np.diag(self.phase.mtensor())), [5.0, 6.0, 7.0])
+        
+    def test_cached(self):
+        """ Matrices are only calculated once for each cell, and cannot be changed by callers """
+        self.assertIs(self.phase.orthomatrix(), self.phase.orthomatrix())
+        self.assertIs(self.phase.mtensor(), self.phase.mtensor())
+        self.assertRaises(ValueError, self.phase.orthomatrix().__setitem__, (0, 0), 1.0)
+        
+    def test_cell_changed(self):
+        """ Matrices are recalculated when the cell is set or changed """
+        M = self.phase.orthomatrix()
+        self.phase.cell = [5.0, 6.0, 7.0, 90.0, 90.0, 90.0]
+        np.testing.assert_almost_equal(self.phase.orthomatrix(), np.diag([5.0, 6.0, 7.0]))
+        self.phase.cell['a'] = 4.0
+        np.testing.assert_almost_equal(self.phase.mtensor(), np.diag([16.0, 36.0, 49.0]))
+        self.assertIsNot(self.phase.orthomatrix(), M)
+        
+    def test_conversion(self):
+        """ Many positions are converted between crystal and cartesian coordinates at once """
+        abc = np.random.RandomState(0).rand(50, 3)
+        xyz = self.phase.abctoxyz(abc)
+        np.testing.assert_almost_equal(xyz, np.dot(self.phase.orthomatrix(), abc.T).T)
+        np.testing.assert_almost_equal(self.phase.xyztoabc(xyz), abc)
+        np.testing.assert_almost_equal(self.phase.abctoxyz(abc[0]), xyz[0])
+        
+    def test_reduced_basis(self):
+        """ An oblique setting of a cell is reduced back to it """
+        P = np.array([[1, 3, -2], [0, 1, 4], [0, -1, -3]])
+        M = np.dot(self.phase.orthomatrix(), P)
+        oblique = readcoords.Crystal(cell=dict(zip(['a', 'b', 'c', 'alpha', 'beta', 'gamma'], list(np.sqrt((M**2).sum(axis=0))) + \
+                    [ np.degrees(np.arccos(np.dot(M[:,i], M[:,j]) / np.sqrt(np.dot(M[:,i], M[:,i]) * np.dot(M[:,j], M[:,j])))) for i, j in [(1,2), (0,2), (0,1)] ])))
+        basis = oblique.reducedbasis()
+        self.assertIs(basis, oblique.reducedbasis())
+        self.assertEqual(round(np.linalg.det(basis)), 1)
+        reduced = np.dot(oblique.orthomatrix(), basis)
+        self.assertTrue(np.sqrt((reduced**2).sum(axis=0)).sum() <= 5.0 + 6.0 + 7.0 + 1e-6)
+        
+class AtomArrays(unittest.TestCase):
+    """ Test atoms held as arrays, with dict-like views """
+    def setUp(self):
+        self.atoms = {'Mn1'  : np.array([0.0, 0.0, 0.0]),
+                      'O1'   : np.array([0.25, 0.0, 0.0]),
+                      'O1_2' : np.array([0.0, 0.25, 0.0]),
+                      'X1'   : [0.5, 0.5, 0.5]}
+        self.phase = readcoords.Crystal(cell=[8.0, 8.0, 8.0, 90.0, 90.0, 90.0], atoms=self.atoms, atomtypes={'Mn1':'Mn', 'O1':'O'})
+        
+    def test_arrays(self):
+        """ Coordinates, types and indices are held as arrays """
+        self.assertEqual(self.phase.atomabc.shape, (4, 3))
+        self.assertEqual(sorted(self.phase.atomlbl), sorted(self.atoms.keys()))
+        for site in self.atoms:
+            np.testing.assert_array_equal(self.phase.atomabc[self.phase.atomindex[site]], self.atoms[site])
+        self.assertEqual(self.phase.labeltable.lookup(self.phase.atomtypidx[[ self.phase.atomindex[s] for s in ['O1', 'O1_2', 'X1'] ]]), ['O', 'O', None])
+        
+    def test_views(self):
+        """ atoms and atomtypes behave as dicts """
+        self.assertEqual(len(self.phase.atoms), 4)
+        self.assertIn('O1_2', self.phase.atoms)
+        self.assertNotIn('O2', self.phase.atoms)
+        np.testing.assert_array_equal(self.phase.atoms['X1'], [0.5, 0.5, 0.5])
+        self.assertRaises(KeyError, self.phase.atoms.__getitem__, 'O2')
+        self.assertItemsEqual(self.phase.atoms.keys(), self.atoms.keys())
+        self.assertDictEqual(dict(self.phase.atomtypes), {'Mn1':'Mn', 'O1':'O', 'O1_2':'O'})      # Untyped atom not included
+        self.assertEqual(self.phase.atomtypes.get('X1', 'none'), 'none')
+        
+    def test_change_atoms(self):
+        """ Atoms can be added, moved and removed through the views """
+        self.phase.atoms['O2'] = [0.0, 0.0, 0.25]
+        self.phase.atoms['O1'] = [0.75, 0.0, 0.0]
+        self.phase.atomtypes['O2'] = 'O'
+        np.testing.assert_array_equal(self.phase.atoms['O1'], [0.75, 0.0, 0.0])
+        self.assertEqual(self.phase.atomtypes['O2'], 'O')
+        del self.phase.atoms['Mn1']
+        self.assertEqual(len(self.phase.atoms), 4)
+        self.assertNotIn('Mn1', self.phase.atomtypes)
+        np.testing.assert_array_equal(self.phase.atoms['O2'], [0.0, 0.0, 0.25])
+        self.assertEqual(self.phase.atomabc.shape, (4, 3))
+        
+    def test_ligands(self):
+        """ Ligands found from the arrays of a Crystal match those from dicts """
+        fromcrystal = readcoords.ligandarrays('Mn1', self.phase.atoms, self.phase.orthomatrix(), radius=2.5, types=['O'], atomtypes=self.phase.atomtypes)
+        fromdicts = readcoords.ligandarrays('Mn1', self.phase.atoms.copy(), self.phase.orthomatrix(), radius=2.5, types=['O'], atomtypes=self.phase.atomtypes.copy())
+        self.assertEqual(fromcrystal[0], ['O1', 'O1_2'])
+        self.assertEqual(fromcrystal[0], fromdicts[0])
+        np.testing.assert_array_equal(fromcrystal[1], fromdicts[1])
+        self.assertEqual(fromcrystal[2:], fromdicts[2:])
+        self.assertRaises(ValueError, readcoords.ligandarrays, 'Mn1', self.phase.atoms, self.phase.orthomatrix(), types=['F'], atomtypes=self.phase.atomtypes)
+        
+    def test_pickle(self):
+        """ Atom arrays and views survive pickling """
+        phase = pickle.loads(pickle.dumps(self.phase, 2))
+        np.testing.assert_array_equal(phase.atoms['O1_2'], self.atoms['O1_2'])
+        self.assertEqual(phase.atomtypes['O1_2'], 'O')
+        
+class PolyhedronRegistry(unittest.TestCase):
+    """ Test registry of polyhedra in a Crystal """
+    def setUp(self):
+        self.phase = readcoords.Crystal(cell=[5.0, 5.0, 5.0, 90.0, 90.0, 90.0])
+        for cen in ['B2', 'A1', 'C3']:
+            self.phase.makepolyhedron({cen : [0.,0.,0.]}, [('O1', [0.2,0.,0.]), ('O2', [0.,0.2,0.])], ligtypes=['O']*2)
+            
+    def test_order_lookup(self):
+        """ Polyhedra are kept in order added and found by label """
+        self.assertEqual(list(self.phase.polyhedra), ['B2', 'A1', 'C3'])
+        self.assertEqual([ p.cenlbl for p in self.phase.polyhedra.values() ], ['B2', 'A1', 'C3'])
+        self.assertEqual(self.phase.polyhedra['A1'].cenlbl, 'A1')
+        self.assertIn('C3', self.phase.polyhedra)
+        self.assertRaises(KeyError, self.phase.polyhedra.__getitem__, 'D4')
+        
+    def test_replace(self):
+        """ Making a polyhedron for an existing centre replaces it """
+        self.phase.makepolyhedron({'A1' : [0.5,0.,0.]}, [('O1', [0.7,0.,0.])], ligtypes=['O'])
+        self.assertEqual(list(self.phase.polyhedra), ['B2', 'A1', 'C3'])
+        self.assertEqual(self.phase.polyhedra['A1'].liglbl, ['O1'])
+        self.phase.polyhedra.remove('B2')
+        self.assertEqual(list(self.phase.polyhedra), ['A1', 'C3'])
+        self.assertEqual(self.phase.polyhedra['C3'].cenlbl, 'C3')
+        
+    def test_attributes(self):
+        """ Polyhedra are available as '<label>_poly' attributes """
+        self.assertTrue(self.phase.B2_poly is self.phase.polyhedra['B2'])
+        self.assertTrue(getattr(self.phase, 'C3_poly') is self.phase.polyhedra['C3'])
+        self.assertFalse(hasattr(self.phase, 'D4_poly'))
+        self.assertRaises(AttributeError, getattr, self.phase, 'missing')
+        
+    def test_pickle(self):
+        """ Registry survives pickling, and older pickles (polyhedra as attributes) are converted """
+        for protocol in [0, 2]:
+            phase = pickle.loads(pickle.dumps(self.phase, protocol))
+            self.assertEqual(list(phase.polyhedra), ['B2', 'A1', 'C3'])
+            self.assertTrue(phase.A1_poly._labels is phase.C3_poly._labels)
+        state = dict(self.phase.__dict__)
+        state['polyhedra'] = ['B2', 'A1']
+        state['B2_poly'], state['A1_poly'] = self.phase.polyhedra['B2'], self.phase.polyhedra['A1']
+        phase = readcoords.Crystal.__new__(readcoords.Crystal)
+        phase.__setstate__(state)
+        self.assertEqual(list(phase.polyhedra), ['B2', 'A1'])
+        self.assertFalse('B2_poly' in phase.__dict__)
+        
+class CompactCrystal(unittest.TestCase):
+    """ Test moving polyhedra and ellipsoids into shared arrays. """
+    def setUp(self):
+        self.phase = readcoords.Crystal(cell=[5., 6., 7., 90., 90., 90.])
+        octahedron = [[0.3,0,0],[-0.3,0,0],[0,0.3,0],[0,-0.3,0.01],[0,0,0.3],[0.02,0,-0.3]]
+        for i in range(3):
+            ligands = [ ('O'+str(j), np.array(p)*(1.+0.1*i)) for j, p in enumerate(octahedron) ]
+            self.phase.makepolyhedron({'M'+str(i): [0.,0.,0.]}, ligands, ligtypes=['O']*6)
+            getattr(self.phase, 'M'+str(i)+'_poly').makeellipsoid(self.phase.orthomatrix(), tolerance=1e-4, method='wolfe-atwood')
+        self.phase.makepolyhedron({'M3': [0.5,0.5,0.5]}, [])
+    def test_shared_labels(self):
+        self.assertEqual(len(self.phase.labeltable), 12)      # M0-M3, O0-O5, type O and (unknown centre type) None
+        self.assertTrue(self.phase.M0_poly._labels is self.phase.M2_poly._labels)
+    def test_compact(self):
+        before = [ (p.allabc.copy(), p.ellipsoid.radii.copy(), p.ellipsoid.weights.copy()) for p in [ getattr(self.phase, c+'_poly') for c in ['M0', 'M1', 'M2'] ] ]
+        self.phase.compact()
+        self.assertEqual(self.phase.store['abc'].shape, (22, 3))
+        self.assertEqual(self.phase.store['radii'].shape, (3, 3))
+        for i, cen in enumerate(['M0', 'M1', 'M2']):
+            poly = getattr(self.phase, cen+'_poly')
+            self.assertTrue(poly.allabc.base is self.phase.store['abc'])
+            self.assertTrue(poly.ellipsoid.radii.base is self.phase.store['radii'])
+            np.testing.assert_array_equal(poly.allabc, before[i][0])
+            np.testing.assert_array_equal(poly.ligabc, before[i][0][1:])
+            np.testing.assert_array_equal(poly.ellipsoid.radii, before[i][1])
+            np.testing.assert_array_equal(poly.ellipsoid.weights, before[i][2])
+        np.testing.assert_array_equal(self.phase.M3_poly.cenabc, [0.5,0.5,0.5])
+    def test_pickle(self):
+        plain = len(pickle.dumps(self.phase, 2))
+        self.phase.compact()
+        data = pickle.dumps(self.phase, 2)
+        self.assertTrue(len(data) < plain)
+        copy = pickle.loads(data)
+        self.assertTrue(copy.M1_poly.allabc.base is copy.store['abc'])
+        self.assertTrue(copy.M1_poly.ellipsoid.points.base is copy.store['points'])
+        np.testing.assert_array_equal(copy.M1_poly.ellipsoid.radii, self.phase.M1_poly.ellipsoid.radii)
+        np.testing.assert_array_equal(copy.M2_poly.ligabc, self.phase.M2_poly.ligabc)
+
 class CifRead(unittest.TestCase):
     """ Check reading of CIF files works as expected. """
     # Mainly checks correct interface to pyCIFRW
@@ -152,6 +340,26 @@ class CifRead(unittest.TestCase):
         
             
             
+class EsdReading(unittest.TestCase):
+    """ Test reading of standard uncertainties from CIF numbers. """
+    def test_readesd(self):
+        for string, value, esd in [('0.1234(5)', 0.1234, 0.0005), ('10.4788(17)', 10.4788, 0.0017), ('55.65(2)', 55.65, 0.02),
+                                   ('1234(5)', 1234., 5.), ('1.2e-3(4)', 1.2e-3, 4e-4), ('0.25', 0.25, 0.)]:
+            v, e = readcoords._readesd(string)
+            self.assertAlmostEqual(v, value)
+            self.assertAlmostEqual(e, esd)
+    def test_getesd(self):
+        CIF = pkg_resources.resource_filename('pieface.tests.test_data', 'fayalite_COD1000064.cif')
+        returnvals = readcoords.readcif(CIF, getesd=True)
+        self.assertEqual(len(returnvals), 8)
+        cellesd, atomesds = returnvals[6:]
+        self.assertAlmostEqual(cellesd['b'], 0.0017)
+        self.assertEqual(cellesd['alp'], 0.)
+        np.testing.assert_array_almost_equal(atomesds['O3'], [0.00017, 0.00009, 0.00009])
+        np.testing.assert_array_almost_equal(atomesds['Fe1'], np.zeros(3))
+        self.assertEqual(len(readcoords.readcif(CIF, getocc=True, getesd=True)), 9)
+        self.assertEqual(len(readcoords.readcif(CIF)), 6)
+            
 class PrimitiveCell(unittest.TestCase):
     """ Test generation of all atom positions. """
     def TearDown(slef):
@@ -177,6 +385,22 @@ class PrimitiveCell(unittest.TestCase):
         for k in self.newcoords.keys():
             np.testing.assert_array_almost_equal(self.newcoords[k], correctcoords[k])
             
+    def test_wrapped_labels(self):
+        """ Images are moved into the unit cell, and labels padded to the number of operations """
+        self.atomcoords={'Mn1':np.array([1.25, -0.5, 2.0])}
+        self.symmops = ['x,y,z'] + [ 'x+{0}/10,y,-z'.format(i) for i in range(1, 10) ] + ['-x,-y,-z']
+        self.symmid = range(1, 12)
+        
+        self.newcoords = readcoords.makeP1cell(self.atomcoords, self.symmops, self.symmid)
+        
+        self.assertEqual(len(self.newcoords), 10)
+        np.testing.assert_array_almost_equal(self.newcoords['Mn1'], [0.25, 0.5, 0.0])
+        np.testing.assert_array_almost_equal(self.newcoords['Mn1_06'], [0.75, 0.5, 0.0])
+        np.testing.assert_array_almost_equal(self.newcoords['Mn1_10'], [0.15, 0.5, 0.0])
+        self.assertNotIn('Mn1_11', self.newcoords)     # Same position as Mn1_06
+        for v in self.newcoords.values():
+            self.assertTrue(((v >= 0.0) & (v < 1.0)).all())
+            
     def test_rounding_errors(self):
         """ Check that positions rounded when reading CIF are correctly handled as duplicates"""
         self.atomcoords={'O1': np.array([0.3333, 0.3333, 0.3333])}
@@ -191,7 +415,106 @@ class PrimitiveCell(unittest.TestCase):
         self.assertItemsEqual(self.newcoords.keys(), correctcoords.keys())
         for k in self.newcoords.keys():
             np.testing.assert_array_almost_equal(self.newcoords[k], correctcoords[k])
+            
+    def test_tolerance(self):
+        """ Images further apart than tol are kept; tol must be positive """
+        self.atomcoords={'O1': np.array([0.999, 0.25, 0.5])}
+        self.symmops = ['x,y,z', 'x+0.005,y,z', '-x,y,z']
+        self.symmid = [0,1,2]
+        
+        self.assertItemsEqual(readcoords.makeP1cell(self.atomcoords, self.symmops, self.symmid).keys(), ['O1', 'O1_1', 'O1_2'])
+        self.newcoords = readcoords.makeP1cell(self.atomcoords, self.symmops, self.symmid, tol=0.01)
+        self.assertItemsEqual(self.newcoords.keys(), ['O1'])     # Images across the cell edge are the same
+        self.assertRaises(ValueError, readcoords.makeP1cell, self.atomcoords, self.symmops, self.symmid, tol=0)
+        
+    def test_unique_images(self):
+        """ Grid search drops the same images as comparing each with all earlier ones """
+        rng = np.random.RandomState(0)
+        images = rng.rand(20, 24, 3)
+        images[:,12:] = np.round(images[:,:12] * 4) / 4 + rng.uniform(-0.002, 0.002, size=(20, 12, 3))
+        images = readcoords._wrapcell(images)
+        for tol in [1e-3, 2e-3, 0.1]:
+            keep = np.zeros(images.shape[:2], dtype=bool)
+            for i in range(images.shape[1]):
+                diff = abs(images[:,i:i+1] - images[:,:i])
+                same = (np.minimum(diff, 1.0 - diff) <= tol).all(axis=2)
+                keep[:,i] = ~(same & keep[:,:i]).any(axis=1)
+            np.testing.assert_array_equal(readcoords._uniqueimages(images, tol), keep)
 
+class LocalCell(unittest.TestCase):
+    """ Test generation of atoms near centres only. """
+    @classmethod
+    def setUpClass(cls):
+        CIF = pkg_resources.resource_filename('pieface.tests.test_data', 'fayalite_COD1000064.cif')
+        cell, cls.atomcoords, cls.atomtypes, spacegp, cls.symmops, cls.symmid = readcoords.readcif(CIF)[:6]
+        cls.allatoms = readcoords.makeP1cell(cls.atomcoords, cls.symmops, cls.symmid)
+        cls.orthom = readcoords.Crystal(cell=cell).orthomatrix()
+        
+    def test_subset(self):
+        """ Atoms generated are a subset of the full cell, including centres """
+        centres = ['Fe1', sorted(self.allatoms.keys())[-1]]
+        local = readcoords.makeP1local(self.atomcoords, self.symmops, self.symmid, centres, self.orthom, 2.5)
+        self.assertTrue(len(local) < len(self.allatoms))
+        for cen in centres:
+            self.assertIn(cen, local)
+        for site in local:
+            np.testing.assert_array_equal(local[site], self.allatoms[site])
+            
+    def test_same_ligands(self):
+        """ Ligands found from local atoms are the same as those from the full cell """
+        for cen in sorted(self.allatoms.keys())[::5]:
+            local = readcoords.makeP1local(self.atomcoords, self.symmops, self.symmid, [cen], self.orthom, 3.5)
+            full = readcoords.ligandarrays(cen, self.allatoms, self.orthom, radius=3.5, atomtypes=self.atomtypes)
+            part = readcoords.ligandarrays(cen, local, self.orthom, radius=3.5, atomtypes=self.atomtypes)
+            self.assertEqual(part[0], full[0])
+            np.testing.assert_array_equal(part[1], full[1])
+            self.assertEqual(part[2], full[2])
+            
+    def test_missing_centres(self):
+        """ Labels not in the full cell are ignored """
+        local = readcoords.makeP1local(self.atomcoords, self.symmops, self.symmid, ['Fe3', 'Fe1_99'], self.orthom, 2.5)
+        self.assertEqual(local, {})
+
+class SiteSymmetry(unittest.TestCase):
+    """ Test parsing of symmetry operations and site symmetry. """
+    symmops = ['x,y,z', '-x,-y,-z', '-x+1/2,y,-z', 'x+1/2,-y,z']
+    
+    def test_symmetryoperations(self):
+        rotations, translations = readcoords.symmetryoperations(self.symmops)
+        np.testing.assert_array_almost_equal(rotations[1], -np.eye(3))
+        np.testing.assert_array_almost_equal(rotations[2], np.diag([-1, 1, -1]))
+        np.testing.assert_array_almost_equal(translations[3], [0.5, 0., 0.])
+        
+    def test_operator_spellings(self):
+        """ Operations are read in various forms without evaluating them """
+        rotations, translations = readcoords.symmetryoperations(['X+1/2, -y, z-1/4', '1/2+x,x-y,-z+0.5', 'x y z', " -y+x , 2*x , +z", "'x,y,z+1/3'"])
+        np.testing.assert_array_almost_equal(translations, [[0.5, 0., -0.25], [0.5, 0., 0.5], [0., 0., 0.], [0., 0., 0.], [0., 0., 1./3.]])
+        np.testing.assert_array_almost_equal(rotations[1], [[1, 0, 0], [1, -1, 0], [0, 0, -1]])
+        np.testing.assert_array_almost_equal(rotations[2], np.eye(3))
+        np.testing.assert_array_almost_equal(rotations[3], [[1, -1, 0], [2, 0, 0], [0, 0, 1]])
+        
+    def test_invalid_operators(self):
+        """ Unreadable operations raise ValueError """
+        for symm in ['x,y', 'x,,z', 'x+,y,z', 'a,y,z', 'x**2,y,z', '__import__("os").getcwd(),y,z']:
+            self.assertRaises(ValueError, readcoords.symmetryoperations, [symm])
+        
+    def test_general_site(self):
+        ops = readcoords.sitesymmetry([0.1, 0.2, 0.3], self.symmops)
+        self.assertEqual(len(ops), 1)
+        np.testing.assert_array_almost_equal(ops[0], np.eye(3))
+    
+    def test_special_sites(self):
+        self.assertEqual(len(readcoords.sitesymmetry([0., 0., 0.], self.symmops)), 2)      # Inversion centre
+        self.assertEqual(len(readcoords.sitesymmetry([0.25, 0.2, 0.], self.symmops)), 2)   # Two-fold axis
+        self.assertEqual(len(readcoords.sitesymmetry([0.25, 0.2, 0.0001], self.symmops)), 2)   # Rounded coordinates
+    
+    def test_cartesian_tolerance(self):
+        # 0.0005 off an inversion centre is a 0.02 A shift in a 20 A cell
+        orthom = 20. * np.eye(3)
+        self.assertEqual(len(readcoords.sitesymmetry([0.0005, 0., 0.], self.symmops)), 2)
+        self.assertEqual(len(readcoords.sitesymmetry([0.0005, 0., 0.], self.symmops, tol=0.01, orthom=orthom)), 1)
+        self.assertEqual(len(readcoords.sitesymmetry([0.0005, 0., 0.], self.symmops, tol=0.03, orthom=orthom)), 2)
+        
 class LigandSearching(unittest.TestCase):
     """ Test searching of ligands from all atoms. """
     def TearDown(slef):
@@ -252,13 +575,90 @@ class LigandSearching(unittest.TestCase):
         for k in self.ligands.keys():
             np.testing.assert_array_almost_equal(self.ligands[k], correctligands[k])
         self.assertDictEqual(self.ligtypes, correcttypes)
+        
+    def test_ligand_arrays(self):
+        """ Ligands as arrays are sorted by label and agree with findligands """
+        self.atomcoords={'Mn1':np.array([0.0,0.0,0.0]),
+                         'O1': np.array([0.5, 0.5, 0.5]),
+                         'O2_3': np.array([0.0, 0.0, 0.4]),
+                         'Sr1': np.array([0.0, 0.5, 0.0])}
+        self.orthom = np.array([[4.0, 0.0, 0.0],[0.0, 4.0, 0.0],[0.0, 0.0, 4.0]])
+        self.atomtypes = {'Mn1':'Mn', 'O1':'O', 'O2':'O', 'Sr1':'Sr'}
+        
+        self.ligands, self.ligtypes = readcoords.findligands('Mn1', self.atomcoords, self.orthom, radius=3.5, types=['O'], names = [], atomtypes=self.atomtypes)
+        labels, abc, types, centype = readcoords.ligandarrays('Mn1', self.atomcoords, self.orthom, radius=3.5, types=['O'], names = [], atomtypes=self.atomtypes)
+        
+        self.assertEqual(labels, sorted(self.ligands.keys()))
+        self.assertEqual(labels[-2:], ['O2_3', 'O2_3a'])    # Types found from original label
+        self.assertEqual(abc.shape, (10, 3))
+        np.testing.assert_array_almost_equal(abc, [ self.ligands[l] for l in labels ])
+        self.assertEqual(types, ['O']*10)
+        self.assertEqual(centype, 'Mn')
+        
+        labels, abc, types, centype = readcoords.ligandarrays('Mn1', self.atomcoords, self.orthom, radius=1.0, types=['O'], names = [], atomtypes=self.atomtypes)
+        self.assertEqual(labels, [])
+        self.assertEqual(abc.shape, (0, 3))
+        
+    def test_long_radius(self):
+        """ Ligands are found in all cells within radius, even beyond neighbouring cells """
+        self.atomcoords={'Mn1':np.array([0.0,0.0,0.0]),
+                         'O1': np.array([0.5, 0.0, 0.0])}
+        self.orthom = np.array([[2.0, 0.0, 0.0],[0.0, 10.0, 0.0],[0.0, 0.0, 10.0]])
+        self.atomtypes = {'Mn1':'Mn', 'O1':'O'}
+        
+        labels, abc, types, centype = readcoords.ligandarrays('Mn1', self.atomcoords, self.orthom, radius=3.1, types=['O'], atomtypes=self.atomtypes)
+        self.assertEqual(labels, ['O1', 'O1a', 'O1b', 'O1c'])
+        np.testing.assert_array_almost_equal(abc, [[0.5, 0, 0], [1.5, 0, 0], [-0.5, 0, 0], [-1.5, 0, 0]])
+        
+        cells = readcoords.neighbours.CellList([ self.atomcoords[l] for l in self.atomcoords.keys() ], self.orthom, 3.1)   # In the order of atomcoords
+        self.assertEqual(readcoords.ligandarrays('Mn1', self.atomcoords, self.orthom, radius=3.1, types=['O'], atomtypes=self.atomtypes, cells=cells)[0], labels)
+        
+    def test_many_repeats(self):
+        """ Labels of ligands repeated in many cells are unique and printable """
+        self.atomcoords={'Mn1':np.array([0.0,0.0,0.0]),
+                         'O1': np.array([0.5, 0.5, 0.5])}
+        self.orthom = np.diag([3.0, 3.0, 3.0])
+        self.atomtypes = {'Mn1':'Mn', 'O1':'O'}
+        
+        for radius in [6.0, 12.0]:
+            labels, abc, types, centype = readcoords.ligandarrays('Mn1', self.atomcoords, self.orthom, radius=radius, types=['O'], atomtypes=self.atomtypes)
+            self.assertTrue(len(labels) > 26)
+            self.assertEqual(len(set(labels)), len(labels))
+            for l in labels:
+                self.assertTrue(l == 'O1' or (l.startswith('O1') and l[2:].isalpha() and l[2:].islower()))
+        self.assertEqual([ readcoords._repeatsuffix(n) for n in [0, 1, 26, 27, 52, 703] ], ['', 'a', 'z', 'aa', 'az', 'aaa'])
+        
+    def test_neighbour_lists(self):
+        """ Ligands of all centres found at once are those found for each centre in turn """
+        CIF = pkg_resources.resource_filename('pieface.tests.test_data', 'fayalite_COD1000064.cif')
+        cell, atomcoords, atomtypes, spacegp, symmops, symmid = readcoords.readcif(CIF)[:6]
+        phase = readcoords.Crystal(cell=cell, atoms=readcoords.makeP1cell(atomcoords, symmops, symmid), atomtypes=atomtypes)
+        centres = [ site for site in phase.atoms.keys() if site.startswith('Fe') or site.startswith('O1') ]
+        
+        ligandsets = readcoords.neighbourlists(centres, phase.atoms, phase.orthomatrix(), radius=3.0, types=['O2-', 'Fe2+'], atomtypes=phase.atomtypes)
+        self.assertItemsEqual(ligandsets.keys(), centres)
+        for cen in centres:
+            labels, abc, types, centype = readcoords.ligandarrays(cen, phase.atoms, phase.orthomatrix(), radius=3.0, types=['O2-', 'Fe2+'], atomtypes=phase.atomtypes)
+            self.assertNotIn(cen, ligandsets[cen][0])
+            self.assertEqual(ligandsets[cen][0], labels)
+            np.testing.assert_array_equal(ligandsets[cen][1], abc)
+            self.assertEqual(ligandsets[cen][2], types)
+            self.assertEqual(ligandsets[cen][3], centype)
+        self.assertRaises(KeyError, readcoords.neighbourlists, ['Fe1', 'Fe9'], phase.atoms, phase.orthomatrix(), atomtypes=phase.atomtypes)
 
 
 if __name__ == "__main__":
 
     test_classes_to_run = [ CrystalInit,
+                            CellMatrices,
+                            AtomArrays,
+                            PolyhedronRegistry,
+                            CompactCrystal,
                             CifRead,
+                            EsdReading,
                             PrimitiveCell,
+                            LocalCell,
+                            SiteSymmetry,
                             LigandSearching,
                            ]
     
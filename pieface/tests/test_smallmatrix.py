@@ -0,0 +1,58 @@
+""" Tests for smallmatrix.py """
+import unittest
+from pieface import smallmatrix
+import numpy as np
+
+class StackedInverse(unittest.TestCase):
+    """ Compare closed-form results with np.linalg for stacks of matrices. """
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(0)
+        cls.size = smallmatrix.MINSTACK + 4     # Large enough to use closed-form expressions
+        cls.stacks = dict([ (n, rng.normal(size=(cls.size,n,n)) + n*np.eye(n)) for n in [2,3,4] ])
+    def test_inv(self):
+        for n, a in self.stacks.items():
+            np.testing.assert_array_almost_equal(smallmatrix.inv(a), np.linalg.inv(a))
+            np.testing.assert_array_almost_equal(smallmatrix.inv(a[0]), np.linalg.inv(a[0]))
+    def test_small_stack(self):
+        for n, a in self.stacks.items():
+            np.testing.assert_array_almost_equal(smallmatrix.inv(a[:smallmatrix.MINSTACK-1]), np.linalg.inv(a[:smallmatrix.MINSTACK-1]))
+    def test_nested_stack(self):
+        a = self.stacks[3].reshape(2,-1,3,3)
+        np.testing.assert_array_almost_equal(smallmatrix.inv(a), np.linalg.inv(a))
+    def test_singular(self):
+        a = np.array([np.eye(3)]*self.size + [np.zeros((3,3))])
+        self.assertRaises(np.linalg.LinAlgError, smallmatrix.inv, a)
+    def test_wrong_shape(self):
+        self.assertRaises(ValueError, smallmatrix.inv, np.ones((2,5,5)))
+        self.assertRaises(np.linalg.LinAlgError, smallmatrix.inv, np.ones((2,3,4)))
+
+class SymmetricFunctions(unittest.TestCase):
+    """ Test eigenvalues and quadratic forms of symmetric matrices. """
+    def test_eigvalsh3(self):
+        rng = np.random.RandomState(1)
+        a = rng.normal(size=(smallmatrix.MINSTACK,3,3))
+        a = a + np.swapaxes(a, 1, 2)
+        np.testing.assert_array_almost_equal(smallmatrix.eigvalsh3(a), np.linalg.eigvalsh(a))
+    def test_eigvalsh3_degenerate(self):
+        a = np.array([2.*np.eye(3), np.diag([3., 0., 3.])] * smallmatrix.MINSTACK)
+        np.testing.assert_array_almost_equal(smallmatrix.eigvalsh3(a)[:2], [[2., 2., 2.], [0., 3., 3.]])
+    def test_quadform(self):
+        x = np.array([[1., 0., 0.], [1., 1., 0.], [0., 2., 1.]])
+        a = np.diag([1., 2., 3.])
+        np.testing.assert_array_almost_equal(smallmatrix.quadform(x, a), np.diag(np.dot(np.dot(x, a), x.T)))
+
+if __name__ == "__main__":
+
+    test_classes_to_run = [StackedInverse,
+                           SymmetricFunctions,
+                           ]
+
+    suites_list = []
+    for test_class in test_classes_to_run:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+        suites_list.append(suite)
+
+    big_suite = unittest.TestSuite(suites_list)
+
+    results = unittest.TextTestRunner().run(big_suite)
@@ -0,0 +1,133 @@
+""" Tests for uncertainty.py """
+import unittest
+from pieface import uncertainty, readcoords, ellipsoid, calcellipsoid, writeproperties
+import numpy as np
+import os
+import tempfile
+import pkg_resources    # To find packaged CIF files
+
+class SymmetryOrigins(unittest.TestCase):
+    """ Test matching of positions to their generating sites and symmetry operations. """
+    atomcoords = {'M1': np.array([0., 0., 0.]), 'O1': np.array([0.1, 0.2, 0.3])}
+    symmops = ['x,y,z', '-x,-y,-z']
+    def test_siteorigins(self):
+        parents, rots = uncertainty.siteorigins([[0.1, 0.2, 0.3], [0.9, -0.2, 0.7], [1., 0., 0.]], self.atomcoords, self.symmops)
+        self.assertListEqual(parents, ['O1', 'O1', 'M1'])
+        np.testing.assert_array_almost_equal(rots[0], np.eye(3))
+        np.testing.assert_array_almost_equal(rots[1], -np.eye(3))
+    def test_unknown_position(self):
+        self.assertRaises(ValueError, uncertainty.siteorigins, [[0.3, 0.3, 0.3]], self.atomcoords, self.symmops)
+    def test_orthomatrices(self):
+        cells = [[5., 6., 7., 80., 95., 110.], [4., 4., 4., 90., 90., 90.]]
+        M = uncertainty.orthomatrices(cells)
+        for i, cell in enumerate(cells):
+            np.testing.assert_array_almost_equal(M[i], readcoords.Crystal(cell=cell).orthomatrix())
+    def test_properties(self):
+        ellipob = ellipsoid.Ellipsoid(points = np.array([[ 1.9, 0.1,-0.2],[-2.1, 0.2, 0.1],[ 0.1, 1.2, 0.3],
+                                                         [-0.2,-1.4, 0.1],[ 0.3, 0.2, 0.8],[ 0.1,-0.3,-0.7]]), tolerance=1e-6)
+        ellipob.findellipsoid(method='wolfe-atwood')
+        props = uncertainty.properties(ellipob.centre[np.newaxis], ellipob.radii[np.newaxis])
+        for key, value in [('meanrad', ellipob.meanrad()), ('rad_sig', ellipob.raderr()), ('centredisp', ellipob.centredisp()),
+                           ('ellipsvol', ellipob.ellipsvol()), ('sphererad', ellipob.sphererad()),
+                           ('strainen', ellipob.strainenergy()), ('shapeparam', ellipob.shapeparam())]:
+            self.assertAlmostEqual(props[key][0], value)
+
+class MonteCarlo(unittest.TestCase):
+    """ Propagate coordinate esds through a centrosymmetric octahedron. """
+    atomcoords = {'M1': np.array([0., 0., 0.]),
+                  'O1': np.array([0.20, 0., 0.]),
+                  'O2': np.array([0., 0.25, 0.]),
+                  'O3': np.array([0., 0., 0.19])}
+    symmops = ['x,y,z', '-x,-y,-z']
+    def makephase(self):
+        phase = readcoords.Crystal(cell=[10., 10., 10., 90., 90., 90.], atoms=readcoords.makeP1cell(self.atomcoords, self.symmops, [0, 1]), atomtypes={'M1':'M', 'O1':'O', 'O2':'O', 'O3':'O'})
+        ligands, ligtypes = readcoords.findligands('M1', phase.atoms, phase.orthomatrix(), radius=3.0, types=['O'], atomtypes=phase.atomtypes)
+        phase.makepolyhedron({'M1':phase.atoms['M1']}, ligands, ligtypes=ligtypes)
+        phase.M1_poly.makeellipsoid(phase.orthomatrix(), tolerance=1e-6, method='wolfe-atwood')
+        return phase
+    def test_esds(self):
+        phase = self.makephase()
+        coordesds = dict([ (k, np.zeros(3) if k == 'M1' else 0.001*np.ones(3)) for k in self.atomcoords ])
+        cellesd = dict([ (k, 0.) for k in ['a', 'b', 'c', 'alp', 'bet', 'gam'] ])
+        uncertainty.montecarlo(phase, self.atomcoords, self.symmops, cellesd, coordesds, samples=500, seed=0)
+        esds = phase.M1_poly.ellipsoid.esds
+        self.assertItemsEqual(esds.keys(), [ k for k, name in uncertainty.PROPERTIES ])
+        # Longest axis is set by the inversion-related pair O2, so moves exactly with O2 (esd 0.01 A)
+        self.assertAlmostEqual(esds['r1'][0], 2.5, places=2)
+        self.assertAlmostEqual(esds['r1'][1], 0.01, delta=0.001)
+        # Inversion-related ligands move together, so the ellipsoid stays centred on M1
+        self.assertAlmostEqual(esds['centredisp'][0], 0., places=4)
+    def test_zero_esds(self):
+        phase = self.makephase()
+        coordesds = dict([ (k, np.zeros(3)) for k in self.atomcoords ])
+        cellesd = dict([ (k, 0.) for k in ['a', 'b', 'c', 'alp', 'bet', 'gam'] ])
+        uncertainty.montecarlo(phase, self.atomcoords, self.symmops, cellesd, coordesds, samples=20, seed=0)
+        for key, (mean, esd) in phase.M1_poly.ellipsoid.esds.items():
+            self.assertAlmostEqual(esd, 0., places=5)
+
+class Linearised(unittest.TestCase):
+    """ Compare linear propagation of point esds with Monte Carlo sampling. """
+    points = np.array([[2.1,0.,0.],[-1.9,0.1,0.],[0.,2.,0.05],[0.1,-2.2,0.],[0.,0.,1.8],[0.05,0.1,-2.05]])
+    def test_montecarlo(self):
+        ellipob = ellipsoid.Ellipsoid(points = self.points, tolerance=1e-8)
+        ellipob.findellipsoid(method='wolfe-atwood', criterion='gap')
+        esd = 0.002
+        esds = uncertainty.linearised(ellipob, esd * np.ones(self.points.shape))
+        samples = self.points + esd * np.random.RandomState(0).normal(size=(2000,) + self.points.shape)
+        centres, radii, rotations = ellipsoid.fit_many(samples, tolerance=1e-8, criterion='gap', u0=[ellipob.weights]*len(samples))
+        props = uncertainty.properties(centres, radii)
+        for key in ['r1', 'r2', 'r3', 'cenx', 'ceny', 'cenz', 'shapeparam']:
+            self.assertAlmostEqual(esds[key] / props[key].std(), 1., delta=0.1)
+    def test_covariance(self):
+        ellipob = ellipsoid.Ellipsoid(points = self.points, tolerance=1e-8)
+        ellipob.findellipsoid(method='wolfe-atwood', criterion='gap')
+        esds = uncertainty.linearised(ellipob, 0.002 * np.ones(self.points.shape))
+        full = uncertainty.linearised(ellipob, 0.002**2 * np.eye(self.points.size))
+        for key in esds:
+            self.assertAlmostEqual(esds[key], full[key])
+        self.assertRaises(ValueError, uncertainty.linearised, ellipob, np.ones(3))
+
+class CifUncertainty(unittest.TestCase):
+    """ Estimate esds of ellipsoid parameters from a CIF file. """
+    @classmethod
+    def setUpClass(cls):
+        cls.CIF = pkg_resources.resource_filename('pieface.tests.test_data', 'MnSnO3_COD1004021.cif')
+        cls.phase = calcellipsoid.calcfromcif(cls.CIF, ['Mn1'], 2.5, allligtypes=['O2-'], method='wolfe-atwood', samples=100)
+    def test_esds(self):
+        esds = self.phase.Mn1_poly.ellipsoid.esds
+        self.assertTrue(0. < esds['r1'][1] < 0.1)
+        self.assertAlmostEqual(esds['r1'][0], self.phase.Mn1_poly.ellipsoid.radii[0], places=2)
+    def test_nesteddict(self):
+        data = calcellipsoid.makenesteddict({self.CIF: self.phase})
+        self.assertEqual(data['Mn1']['r1_esd'][0], self.phase.Mn1_poly.ellipsoid.esds['r1'][1])
+        self.assertEqual(data['Mn1']['meanrad_mean'][0], self.phase.Mn1_poly.ellipsoid.esds['meanrad'][0])
+    def test_write(self):
+        handle, path = tempfile.mkstemp(suffix='.txt')
+        os.close(handle)
+        try:
+            writeproperties.writeall(path, self.phase, verbosity=0, overwrite=True)
+            with open(path) as f:
+                self.assertTrue('Monte Carlo' in f.read())
+        finally:
+            os.remove(path)
+    def test_no_samples(self):
+        phase = calcellipsoid.calcfromcif(self.CIF, ['Mn1'], 2.5, allligtypes=['O2-'], method='wolfe-atwood')
+        self.assertTrue(phase.Mn1_poly.ellipsoid.esds is None)
+        self.assertFalse('r1_esd' in calcellipsoid.makenesteddict({self.CIF: phase})['Mn1'])
+
+if __name__ == "__main__":
+
+    test_classes_to_run = [SymmetryOrigins,
+                           MonteCarlo,
+                           Linearised,
+                           CifUncertainty,
+                           ]
+
+    suites_list = []
+    for test_class in test_classes_to_run:
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+        suites_list.append(suite)
+
+    big_suite = unittest.TestSuite(suites_list)
+
+    results = unittest.TextTestRunner().run(big_suite)
@@ -0,0 +1,131 @@
+"""
+Monte Carlo propagation of CIF standard uncertainties to ellipsoid parameters.
+
+Cell parameters and asymmetric-unit coordinates are drawn from independent normal
+distributions with widths given by their esds (from readcoords.readcif with getesd=True),
+and each symmetry-equivalent atom is moved with its parent site. Ellipsoids are fitted to
+all samples of a polyhedron at once with ellipsoid.fit_many. For small esds, linearised gives
+first-order estimates for single ellipsoids without sampling.
+"""
+
+from __future__ import division
+import numpy as np
+import logging
+import ellipsoid
+import readcoords
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# Ellipsoid properties given esds (keys as calcellipsoid.makenesteddict), with descriptions for output
+PROPERTIES = [('r1', 'R1'),
+              ('r2', 'R2'),
+              ('r3', 'R3'),
+              ('cenx', 'Centre x'),
+              ('ceny', 'Centre y'),
+              ('cenz', 'Centre z'),
+              ('centredisp', 'Centre displacement'),
+              ('meanrad', 'Mean Radius'),
+              ('rad_sig', 'Radius Std. Dev.'),
+              ('ellipsvol', 'Volume'),
+              ('sphererad', 'Equiv. Sphere Radius'),
+              ('strainen', 'Strain Energy'),
+              ('shapeparam', 'Shape Parameter'),
+              ]
+
+def orthomatrices(cells):
+    """ Return orthogonalisation matrices for an array of cells [a, b, c, alpha, beta, gamma] (as Crystal.orthomatrix). """
+    cells = np.asarray(cells, dtype=float)
+    a, b, c = cells[...,0], cells[...,1], cells[...,2]
+    calp, cbet, cgam = [ np.cos(np.radians(cells[...,i])) for i in [3, 4, 5] ]
+    salp, sbet, sgam = [ np.sin(np.radians(cells[...,i])) for i in [3, 4, 5] ]
+    calpstar = (cbet*cgam - calp) / (sbet*sgam)
+    salpstar = np.sqrt(1.0 - calpstar**2)
+    M = np.zeros(cells.shape[:-1] + (3, 3))
+    M[...,0,0] = a
+    M[...,0,1] = b*cgam
+    M[...,0,2] = c*cbet
+    M[...,1,1] = b*sgam
+    M[...,1,2] = -c*sbet*calpstar
+    M[...,2,2] = c*sbet*salpstar
+    return M
+
+def siteorigins(positions, atomcoords, symmops, tol=1e-3):
+    """ Return the asymmetric-unit label and symmetry rotation matrix that generate each position.
+
+    positions are fractional coordinates (e.g. Polyhedron.allabc), which may be in any unit cell.
+    """
+    rotations, translations = readcoords.symmetryoperations(symmops)
+    labels = sorted(atomcoords.keys())
+    images = np.einsum('oij,aj->aoi', rotations, np.array([ atomcoords[l] for l in labels ])) + translations
+    parents = []
+    rots = []
+    for pos in np.atleast_2d(positions):
+        diff = images - pos
+        match = np.argwhere( (abs(diff - np.round(diff)) <= tol).all(axis=2) )
+        if len(match) == 0:
+            raise ValueError("Position {0} is not generated by any site and symmetry operation".format(pos))
+        parents.append(labels[match[0][0]])
+        rots.append(rotations[match[0][1]])
+    return parents, np.array(rots)
+
+def properties(centres, radii):
+    """ Return dict of ellipsoid properties (see PROPERTIES) for arrays of centres and radii (r1 > r2 > r3). """
+    props = {}
+    props['r1'], props['r2'], props['r3'] = radii[...,0], radii[...,1], radii[...,2]
+    props['cenx'], props['ceny'], props['cenz'] = centres[...,0], centres[...,1], centres[...,2]
+    props['centredisp'] = np.sqrt((centres**2).sum(axis=-1))
+    props['meanrad'] = radii.mean(axis=-1)
+    props['rad_sig'] = np.sqrt( ((radii - props['meanrad'][...,np.newaxis])**2).mean(axis=-1) )
+    props['ellipsvol'] = 4./3.*np.pi*radii.prod(axis=-1)
+    props['sphererad'] = radii.prod(axis=-1)**(1./3.)
+    props['strainen'] = (radii**2).sum(axis=-1) / radii.sum(axis=-1)**2 - 1./3.
+    props['shapeparam'] = radii[...,2]/radii[...,1] - radii[...,1]/radii[...,0]
+    return props
+
+def linearised(ellip, cov):
+    """ Return esds of radii, centre and shape parameter of a fitted Ellipsoid by linear propagation.
+
+    cov is either the (3N, 3N) covariance matrix of the flattened points (ellip.points), or an
+    (N, 3) array of independent esds of each coordinate. Uses Ellipsoid.sensitivity, so costs
+    a single small linear solve rather than a refit per sample (compare montecarlo). Returns a
+    dict of esds for r1, r2, r3, cenx, ceny, cenz and shapeparam (keys as PROPERTIES).
+    """
+    sens = ellip.sensitivity()
+    N = len(np.atleast_2d(ellip.points))
+    cov = np.asarray(cov, dtype=float)
+    if cov.shape == (N, 3):
+        cov = np.diag(cov.ravel()**2)
+    elif cov.shape != (3*N, 3*N):
+        raise ValueError("Covariance must be a ({0}, {0}) matrix or ({1}, 3) array of esds".format(3*N, N))
+    jac = np.vstack([ sens['radii'].reshape(3, 3*N), sens['centre'].reshape(3, 3*N), sens['shapeparam'].reshape(1, 3*N) ])
+    esds = np.sqrt(np.einsum('ij,jk,ik->i', jac, cov, jac))
+    return dict(zip(['r1', 'r2', 'r3', 'cenx', 'ceny', 'cenz', 'shapeparam'], esds))
+
+def montecarlo(phase, atomcoords, symmops, cellesd, coordesds, samples=1000, seed=None, maxcycles=None, criterion='step'):
+    """ Estimate uncertainties of ellipsoid parameters for all fitted polyhedra in phase.
+
+    atomcoords and symmops are the asymmetric unit and symmetry operations used to build phase,
+    and cellesd and coordesds their esds (as returned by readcoords.readcif with getesd=True).
+    The mean and standard deviation over all samples of each property in PROPERTIES are
+    stored as Ellipsoid.esds, a dict of (mean, esd) pairs. Only 3D ellipsoids are sampled.
+    """
+    rng = np.random.RandomState(seed)
+    labels = sorted(atomcoords.keys())
+    shifts = rng.normal(size=(samples, len(labels), 3)) * np.array([ coordesds[l] for l in labels ])
+    keys = ['a', 'b', 'c', 'alp', 'bet', 'gam']
+    cells = np.array([ phase.cell[k] for k in keys ]) + rng.normal(size=(samples, 6)) * np.array([ cellesd[k] for k in keys ])
+    orthoms = orthomatrices(cells)
+
+    for cen, poly in phase.polyhedra.items():
+        ellip = getattr(poly, 'ellipsoid', None)
+        if ellip is None or ellip.ellipdims != 3:
+            logger.debug("No 3D ellipsoid for %s: not estimating uncertainties", cen)
+            continue
+        parents, rots = siteorigins(poly.allabc, atomcoords, symmops)
+        abc = poly.allabc + np.einsum('nij,knj->kni', rots, shifts[:, [ labels.index(p) for p in parents ]])
+        points = np.einsum('kij,knj->kni', orthoms, abc - abc[:, :1])      # Relative to centre, as Polyhedron.alldelxyz
+        u0 = [ellip.weights] * samples if ellip.weights is not None else None       # Start from the fitted weights
+        centres, radii, rotations = ellipsoid.fit_many(points, tolerance=ellip.tolerance, maxcycles=maxcycles, criterion=criterion, u0=u0)
+        props = properties(centres, radii)
+        ellip.esds = dict([ (k, (props[k].mean(), props[k].std())) for k, name in PROPERTIES ])
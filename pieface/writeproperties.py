@@ -25,8 +25,10 @@ fmt_vlrstr = "{:>25}"
 fmt_unitcell = fmt_flt*6+"\n"
 fmt_atm_cord = fmt_str+fmt_flt*3+"\n"
 fmt_llbl_1lflt = fmt_vlstr+":"+fmt_lflt+"\n"
+fmt_llbl_2lflt = fmt_vlstr+":"+fmt_lflt+fmt_lflt+"\n"
 fmt_llbl_3lflt = fmt_vlstr+":"+fmt_lflt+fmt_lflt+fmt_lflt+"\n"
 fmt_llbl_1lint = fmt_vlstr+":"+fmt_lint+"\n"
+fmt_llbl_1lstr = fmt_vlstr+":"+"{:>14}"+"\n"
 
 fmt_lbl_9flt_str = fmt_str+fmt_flt*9+fmt_vlrstr+"\n"
 fmt_lbl_10flt = fmt_str+fmt_flt*10+"\n"
@@ -62,14 +64,13 @@ def _writecrystal(fileob, phase, v=0):
         fileob.write("\n")
     
     if v >= 4:
-        fileob.write("! Coordinates of all atoms in unit cell ({0})\n".format(len(phase.atoms)))
-        for site in phase.atoms:
-            fileob.write(fmt_atm_cord.format(site, *phase.atoms[site]))
+        fileob.write("! Coordinates of all atoms in unit cell ({0})\n".format(len(phase.atomlbl)))
+        fileob.write("".join([ fmt_atm_cord.format(site, *abc) for site, abc in zip(phase.atomlbl, phase.atomabc.tolist()) ]))
         fileob.write("\n")
     
 def _writepolyhedron(fileob, phase, cen, v=0):
     """ Write details of polyhedron definition """
-    polyob = getattr(phase, cen+"_poly")
+    polyob = phase.polyhedra[cen]
     
     if v == 0:
         # Assume we don't want any lists of ligands or coordinates
@@ -88,11 +89,13 @@ def _writepolyhedron(fileob, phase, cen, v=0):
     if v >= 2:
         fileob.write("! Polyhedron definition {0} ({1}-coordinate) -------\n".format(cen, len(polyob.liglbl)))
         fileob.write((fmt_str+fmt_3colstr*3+fmt_vlrstr+"\n").format("# Atom", "Lattice Coords","CartesianCoords","CartesianCoordsReltoCentre","Centre-ligand bondlength"))
-        data = [cen] + [p for p in polyob.cenabc] + [p for p in polyob.cenxyz(phase.orthomatrix())]
-        data = data + [ p for p in polyob.alldelxyz(phase.orthomatrix())[0]] + ["*Central Site"]
+        orthom, mtensor = phase.orthomatrix(), phase.mtensor()
+        data = [cen] + [p for p in polyob.cenabc] + [p for p in polyob.cenxyz(orthom)]
+        data = data + [ p for p in polyob.alldelxyz(orthom)[0]] + ["*Central Site"]
         fileob.write(fmt_lbl_9flt_str.format(*data))
+        ligxyz, ligdelxyz, bondlens = polyob.ligxyz(orthom), polyob.ligdelxyz(orthom), polyob.allbondlens(mtensor)
         for i, lig in enumerate(polyob.liglbl):    # Iterate over all sites
-            data = [lig] + [p for p in polyob.ligabc[i]] + [p for p in polyob.ligxyz(phase.orthomatrix())[i]] + [ p for p in polyob.ligdelxyz(phase.orthomatrix())[i]] + [ polyob.allbondlens(phase.mtensor())[i] ]
+            data = [lig] + [p for p in polyob.ligabc[i]] + [p for p in ligxyz[i]] + [ p for p in ligdelxyz[i]] + [ bondlens[i] ]
             fileob.write(fmt_lbl_10flt.format(*data))
         fileob.write("\n")
     
@@ -100,7 +103,7 @@ def _writeellipsoid(fileob, phase, cen, v=0):
     """ Write paramters of fitted ellipsoid """
     
     try:
-        ellipob = getattr(phase, cen+"_poly").ellipsoid
+        ellipob = phase.polyhedra[cen].ellipsoid
     except AttributeError:
         logger.debug("No ellipsoid defined for %s, omitting from output file", cen)
         return
@@ -117,6 +120,7 @@ def _writeellipsoid(fileob, phase, cen, v=0):
     
     if v >= 2:
         fileob.write(fmt_llbl_1lflt.format("Tolerance", ellipob.tolerance))
+        fileob.write(fmt_llbl_1lstr.format("Fitting path", str(getattr(ellipob, "fitpath", None))))
         fileob.write(fmt_llbl_1lflt.format("Mean Radius", ellipob.meanrad()))
         fileob.write(fmt_llbl_1lflt.format("Radius Variance", ellipob.radvar()))
         fileob.write(fmt_llbl_1lflt.format("Volume", ellipob.ellipsvol()))
@@ -128,6 +132,12 @@ def _writeellipsoid(fileob, phase, cen, v=0):
         fileob.write(fmt_llbl_1lflt.format("Strain Energy", ellipob.strainenergy()))
         fileob.write(fmt_llbl_1lflt.format("Shape Parameter", ellipob.shapeparam()))
     
+    if v >= 0 and getattr(ellipob, "esds", None) is not None:
+        from pieface import uncertainty
+        fileob.write("! Monte Carlo ellipsoid parameters {0} (mean, esd) -------\n".format(cen))
+        for key, name in uncertainty.PROPERTIES:
+            fileob.write(fmt_llbl_2lflt.format(name, *ellipob.esds[key]))
+    
     if v >= 0:
         fileob.write('\n')
 